@@ -1,12 +1,491 @@
 import math
+import os
+import re
+import sqlite3
 import sys
+import time
+from fractions import Fraction
+from itertools import chain
 from PyQt5.QtWidgets import QApplication, QWidget, QLineEdit, QGridLayout, QPushButton, QVBoxLayout, QSizePolicy, \
-     QLabel, QHBoxLayout, QListWidget, QMainWindow, QFrame, QStackedWidget, QComboBox, QMenu, QAction, QRadioButton
+     QLabel, QHBoxLayout, QListWidget, QListWidgetItem, QMainWindow, QFrame, QStackedWidget, QComboBox, QMenu, QAction, QRadioButton, QListView, \
+     QFileDialog, QPlainTextEdit, QTableView, QHeaderView, QScrollBar, QSpinBox
 
 # QSizePolicy helps to scale the widgets in accordance to the window size
-from PyQt5.QtCore import Qt, QPropertyAnimation, QRect, QEasingCurve  # For alignment and animations
+from PyQt5.QtCore import Qt, QPropertyAnimation, QRect, QEasingCurve, QTimer, QAbstractListModel, QModelIndex, \
+     QDateTime, QPointF, QRectF, QAbstractTableModel  # For alignment, animations, the history model, the graph and the table
+
+from PyQt5.QtGui import QIcon, QPainter, QPen, QColor, QPolygonF
+
+from column_stats import DATA_FILE_FILTER, Summary, parse_numbers, read_column
+from conversions import CONVERSION_CACHE, build_categories, format_exact, np
+from currency import CurrencyCategory, open_rate_store
+from definitions import Definitions, is_definition
+from history import ANGLE_MODE_NAMES, DEFAULT_HISTORY_LIMIT, HISTORY_LIMITS, SEARCH_LIMIT, HistoryBuffer, \
+     HistoryEntry, parse_history_query, search_entries
+from history_io import export_history, file_format, import_history, read_history, write_history
+from history_store import HistoryStore, PersistentHistory
+from matrices import MATRIX_FILE_FILTER, MAX_SIZE, OPERATIONS, as_matrix, format_value, load_matrix, new_matrix, \
+     parse_matrix, resized, save_matrix
+from plotting import Curve, Viewport
+from unit_packs import load_unit_packs
+from unit_search import build_unit_index
+from value_table import ValueTable
+from worksheet import Worksheet
+
+class HistoryModel(QAbstractListModel):
+    """
+    Shows a history (a HistoryBuffer, or a PersistentHistory that reads from disk)
+    in a QListView; rows are only turned into text when they are painted
+    """
+
+    def __init__(self, history, parent=None):
+        super().__init__(parent)
+        self.buffer = history
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.buffer)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or index.row() >= len(self.buffer):
+            return None
+        entry = self.buffer[index.row()]
+        if role == Qt.DisplayRole:
+            return entry.text()
+        if role == Qt.ToolTipRole:
+            tooltip = QDateTime.fromMSecsSinceEpoch(int(entry.timestamp * 1000)).toString("yyyy-MM-dd hh:mm:ss")
+            if entry.angle_mode is not None and entry.depends_on_angle_mode():
+                tooltip += f" ({ANGLE_MODE_NAMES[entry.angle_mode]})"
+            return tooltip
+        if role == Qt.UserRole:
+            return entry
+        return None
+
+    def add(self, entry):
+        if self.buffer.out_of_sync():
+            self.reload()  # Entries were imported from the command line while the window was open
+        # A full buffer drops its oldest row first, so the view only has to move by one row
+        if self.buffer.is_full():
+            self.beginRemoveRows(QModelIndex(), 0, 0)
+            self.buffer.popleft()
+            self.endRemoveRows()
+
+        row = len(self.buffer)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self.buffer.append(entry)
+        self.endInsertRows()
+
+    def clear(self):
+        self.beginResetModel()
+        self.buffer.clear()
+        self.endResetModel()
+
+    def set_limit(self, limit):
+        self.beginResetModel()
+        self.buffer.resize(limit)
+        self.endResetModel()
+
+    def recalculate(self, rows, angle_mode):
+        """Run some entries again (from their compiled form); returns the rows that failed"""
+        failed = []
+        for row in rows:
+            try:
+                self.buffer.recalculate(row, angle_mode)
+            except (ValueError, ArithmeticError):
+                failed.append(row)
+                continue
+            self.dataChanged.emit(self.index(row), self.index(row))
+        return failed
+
+    def recalculate_all(self, angle_mode):
+        self.beginResetModel()
+        changed = self.buffer.recalculate_all(angle_mode)
+        self.endResetModel()
+        return changed
+
+    def reload(self):
+        """Show the database again after an import: one reset instead of a row per entry"""
+        self.beginResetModel()
+        self.buffer.reload()
+        self.endResetModel()
+
+    def extend(self, entries):
+        """Add many entries with a single reset"""
+        self.beginResetModel()
+        for entry in entries:
+            self.buffer.append(entry)
+        self.endResetModel()
+
+    def set_history(self, history):
+        """Show other entries (a list of search results works too)"""
+        self.beginResetModel()
+        self.buffer = history
+        self.endResetModel()
+
+
+class WorksheetModel(QAbstractListModel):
+    """Shows the result of every line of a Worksheet, one row per line of the editor"""
+
+    def __init__(self, worksheet, parent=None):
+        super().__init__(parent)
+        self.worksheet = worksheet
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.worksheet)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or index.row() >= len(self.worksheet):
+            return None
+        cell = self.worksheet[index.row()]
+        if role == Qt.DisplayRole:
+            return cell.result
+        if role == Qt.ToolTipRole:
+            return cell.error
+        return None
+
+    def set_lines(self, lines):
+        """Take the editor's text; only lines that changed and the lines using them are calculated"""
+        start, stop, new_stop = self.worksheet.changed_range(lines)
+        new_lines = lines[start:new_stop]
+        if new_stop < stop:
+            self.beginRemoveRows(QModelIndex(), new_stop, stop - 1)
+            rows = self.worksheet.replace(start, stop, new_lines)
+            self.endRemoveRows()
+        elif new_stop > stop:
+            self.beginInsertRows(QModelIndex(), stop, new_stop - 1)
+            rows = self.worksheet.replace(start, stop, new_lines)
+            self.endInsertRows()
+        else:
+            rows = self.worksheet.replace(start, stop, new_lines)
+        self.rows_changed(rows)
+
+    def set_angle_mode(self, angle_mode):
+        self.rows_changed(self.worksheet.set_angle_mode(angle_mode))
+
+    def rows_changed(self, rows):
+        if rows:
+            self.dataChanged.emit(self.index(rows[0]), self.index(rows[-1]))
+
+
+class MatrixModel(QAbstractTableModel):
+    """
+    Shows a NumPy matrix (see matrices.py). When editable, an edited cell is
+    written straight into the float64 array, so operations use it as it is.
+    """
+
+    def __init__(self, editable=False, parent=None):
+        super().__init__(parent)
+        self.matrix = None
+        self.editable = editable
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() or self.matrix is None else self.matrix.shape[0]
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() or self.matrix is None else self.matrix.shape[1]
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or self.matrix is None:
+            return None
+        if role in (Qt.DisplayRole, Qt.EditRole):
+            return format_value(self.matrix[index.row(), index.column()])
+        if role == Qt.TextAlignmentRole:
+            return int(Qt.AlignRight | Qt.AlignVCenter)
+        return None
+
+    def setData(self, index, value, role=Qt.EditRole):
+        if not index.isValid() or role != Qt.EditRole or not self.editable:
+            return False
+        try:
+            number = float(value.strip().replace("−", "-"))
+        except ValueError:
+            return False
+        self.matrix[index.row(), index.column()] = number
+        self.dataChanged.emit(index, index)
+        return True
+
+    def flags(self, index):
+        flags = super().flags(index)
+        return flags | Qt.ItemIsEditable if self.editable else flags
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole:
+            return str(section + 1)
+        return None
+
+    def set_matrix(self, matrix):
+        """Show another matrix (a vector, like eigenvalues, is shown as one column)"""
+        self.beginResetModel()
+        self.matrix = None if matrix is None else matrix.reshape(-1, 1) if matrix.ndim == 1 else matrix
+        self.endResetModel()
+
+
+class ValueTableModel(QAbstractTableModel):
+    """
+    Shows a window of a ValueTable: only the rows on screen, starting at `offset`.
+    Qt's views keep a header section per row, which doesn't fit a billion rows,
+    so ValueTableView picks the window with its own scroll bar instead.
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.table = None
+        self.offset = 0
+        self.window_rows = 0
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid() or self.table is None:
+            return 0
+        return max(0, min(self.window_rows, len(self.table) - self.offset))
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else 2
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or self.table is None:
+            return None
+        if role == Qt.DisplayRole:
+            row = self.offset + index.row()
+            return self.table.x_text(row) if index.column() == 0 else self.table.value_text(row)
+        if role == Qt.TextAlignmentRole:
+            return int(Qt.AlignRight | Qt.AlignVCenter)
+        return None
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            if section == 0:
+                return "x"
+            return self.table.compiled.text if self.table is not None else "f(x)"
+        return None
+
+    def set_table(self, table):
+        self.beginResetModel()
+        self.table = table
+        self.offset = 0
+        self.endResetModel()
+
+    def set_window(self, offset, rows):
+        """Show `rows` rows from `offset`; rows that stay on screen are only repainted"""
+        if (offset, rows) == (self.offset, self.window_rows):
+            return
+        old_count = self.rowCount()
+        self.offset, self.window_rows = offset, rows
+        if self.rowCount() != old_count:
+            self.beginResetModel()
+            self.endResetModel()
+        elif old_count:
+            self.dataChanged.emit(self.index(0, 0), self.index(old_count - 1, 1))
+
+
+class ValueTableView(QWidget):
+    """A table view over a ValueTableModel with a scroll bar that covers every row of the table"""
+
+    ROW_HEIGHT = 24
+
+    def __init__(self, model, parent=None):
+        super().__init__(parent)
+        self.model = model
+        self.view = QTableView()
+        self.view.setModel(model)
+        self.view.verticalHeader().hide()
+        self.view.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.view.verticalHeader().setDefaultSectionSize(self.ROW_HEIGHT)
+        self.view.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.view.setVerticalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
+        self.view.setEditTriggers(QTableView.NoEditTriggers)
+        self.view.wheelEvent = self.wheelEvent  # The wheel moves the window, not the view
+
+        self.scroll_bar = QScrollBar(Qt.Vertical)
+        self.scroll_bar.valueChanged.connect(self.update_window)
+
+        layout = QHBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.setSpacing(0)
+        layout.addWidget(self.view)
+        layout.addWidget(self.scroll_bar)
+
+    def visible_rows(self):
+        # The style may make rows taller than asked for
+        return max(1, self.view.viewport().height() // self.view.verticalHeader().defaultSectionSize())
+
+    def table_changed(self):
+        """Call after the model got a new table"""
+        self.scroll_bar.setValue(0)
+        self.update_range()
+
+    def update_range(self):
+        count = len(self.model.table) if self.model.table is not None else 0
+        rows = self.visible_rows()
+        self.scroll_bar.setRange(0, max(0, count - rows))
+        self.scroll_bar.setPageStep(rows)
+        self.update_window()
+
+    def update_window(self):
+        # One row more than fits, so a partly visible row at the bottom isn't left empty
+        self.model.set_window(self.scroll_bar.value(), self.visible_rows() + 1)
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.update_range()
+
+    def wheelEvent(self, event):
+        self.scroll_bar.setValue(self.scroll_bar.value() - event.angleDelta().y() // 40)  # 3 rows a notch
+
+
+class GraphView(QWidget):
+    """
+    Draws curves (see plotting.py) over a grid. Drag to pan, scroll to zoom;
+    every frame only evaluates what the curves don't have yet.
+    """
+
+    COLORS = ["#1f77b4", "#d62728", "#2ca02c", "#ff7f0e", "#9467bd", "#8c564b"]
+    DEFAULT_SCALE = 0.05  # data units per pixel
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.curves = []
+        self.center_x = self.center_y = 0.0
+        self.scale = self.DEFAULT_SCALE  # Same scale on both axes
+        self.drag_position = None
+        self.setMinimumHeight(250)
+        self.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
+
+    def viewport(self):
+        width, height = max(1, self.width()), max(1, self.height())
+        half_width, half_height = width / 2 * self.scale, height / 2 * self.scale
+        return Viewport(self.center_x - half_width, self.center_x + half_width,
+                        self.center_y - half_height, self.center_y + half_height, width, height)
+
+    def set_curves(self, curves):
+        self.curves = curves
+        self.update()
+
+    def reset_view(self):
+        self.center_x = self.center_y = 0.0
+        self.scale = self.DEFAULT_SCALE
+        self.update()
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), QColor("white"))
+        view = self.viewport()
+        self.draw_grid(painter, view)
+
+        painter.setRenderHint(QPainter.Antialiasing)
+        for index, curve in enumerate(self.curves):
+            painter.setPen(QPen(QColor(self.COLORS[index % len(self.COLORS)]), 2))
+            for polyline in self.polylines(*curve.samples(view), view):
+                painter.drawPolyline(polyline)
+
+    def draw_grid(self, painter, view):
+        # Lines 1, 2 or 5 times a power of ten apart, at least 60 pixels
+        step = 10 ** math.floor(math.log10(60 * self.scale))
+        for factor in (1, 2, 5, 10):
+            if step * factor / self.scale >= 60:
+                step *= factor
+                break
+
+        for axis_value, is_x in ((view.x0, True), (view.y0, False)):
+            end = view.x1 if is_x else view.y1
+            value = math.ceil(axis_value / step) * step
+            while value <= end:
+                if is_x:
+                    position = (value - view.x0) / self.scale
+                    line = (QPointF(position, 0), QPointF(position, view.height))
+                else:
+                    position = view.height - (value - view.y0) / self.scale
+                    line = (QPointF(0, position), QPointF(view.width, position))
+                is_axis = abs(value) < step / 2
+                painter.setPen(QPen(QColor("#888888" if is_axis else "#e0e0e0"), 1))
+                painter.drawLine(*line)
+                if not is_axis:
+                    painter.setPen(QColor("#888888"))
+                    label = f"{value:.10g}"
+                    if is_x:
+                        painter.drawText(QPointF(position + 3, view.height - 4), label)
+                    else:
+                        painter.drawText(QPointF(3, position - 3), label)
+                value += step
+
+    def polylines(self, xs, ys, view):
+        """Pixel polylines for the samples, broken where there is no value or the curve jumps off screen"""
+        px = (xs - view.x0) / self.scale
+        with np.errstate(all="ignore"):
+            # Far off-screen points are pulled in so Qt only ever sees small coordinates
+            py = np.clip(view.height - (ys - view.y0) / self.scale, -view.height, 2 * view.height)
+        finite = np.isfinite(py)
+        # A jump from above the view to below it (tan at 90°) isn't part of the curve
+        jumps = np.zeros(len(py), dtype=bool)
+        jumps[1:] = ((py[1:] < 0) & (py[:-1] > view.height)) | ((py[1:] > view.height) & (py[:-1] < 0))
+        breaks = np.flatnonzero(~finite | jumps)
+        start = 0
+        for stop in chain(breaks.tolist(), [len(px)]):
+            if stop - start > 1:
+                yield QPolygonF([QPointF(x, y) for x, y in zip(px[start:stop].tolist(), py[start:stop].tolist())])
+            start = stop + 1 if stop < len(px) and not finite[stop] else stop
+
+    def mousePressEvent(self, event):
+        if event.button() == Qt.LeftButton:
+            self.drag_position = event.pos()
+
+    def mouseMoveEvent(self, event):
+        if self.drag_position is not None:
+            delta = event.pos() - self.drag_position
+            self.drag_position = event.pos()
+            self.center_x -= delta.x() * self.scale
+            self.center_y += delta.y() * self.scale
+            self.update()  # Repaints once per frame however many moves arrive
+
+    def mouseReleaseEvent(self, event):
+        self.drag_position = None
+
+    def wheelEvent(self, event):
+        # Zoom around the point under the cursor, which stays where it is
+        factor = 0.8 ** (event.angleDelta().y() / 120)
+        view = self.viewport()
+        x = view.x0 + event.pos().x() * self.scale
+        y = view.y1 - event.pos().y() * self.scale
+        self.center_x = x + (self.center_x - x) * factor
+        self.center_y = y + (self.center_y - y) * factor
+        self.scale *= factor
+        self.update()
+
+
+class HistogramView(QWidget):
+    """Draws the histogram of a Summary (see column_stats.py) as bars"""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.summary = None
+        self.setMinimumHeight(150)
+        self.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
+
+    def set_summary(self, summary):
+        self.summary = summary
+        self.update()
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), QColor("white"))
+        edges, counts, width = self.summary.histogram() if self.summary is not None else ([], [], 0)
+        if not counts:
+            return
+        label_height = painter.fontMetrics().height() + 4
+        plot_height = self.height() - label_height
+        bar_width = self.width() / len(counts)
+        tallest = max(counts)
+        for index, count in enumerate(counts):
+            height = count / tallest * (plot_height - 4)
+            painter.fillRect(QRectF(index * bar_width, plot_height - height, max(1.0, bar_width - 1), height),
+                             QColor("#1f77b4"))
+        painter.setPen(QColor("#888888"))
+        painter.drawLine(0, plot_height, self.width(), plot_height)
+        painter.drawText(QRectF(2, plot_height, self.width() - 4, label_height), Qt.AlignLeft | Qt.AlignVCenter,
+                         f"{edges[0]:.6g}")
+        painter.drawText(QRectF(2, plot_height, self.width() - 4, label_height), Qt.AlignRight | Qt.AlignVCenter,
+                         f"{edges[-1] + width:.6g}")
+        painter.drawText(QRectF(2, plot_height, self.width() - 4, label_height), Qt.AlignHCenter | Qt.AlignVCenter,
+                         f"{len(counts)} bins of {width:.3g}, tallest {tallest:,}")
 
-from PyQt5.QtGui import QIcon
 
 class Calculator(QMainWindow):
     def __init__(self):
@@ -23,6 +502,9 @@ class Calculator(QMainWindow):
 
         self.just_calculated = False
 
+        # Variables and functions typed on the display ("r = 5 km", "f(x) = x² + 1"), used by both modes
+        self.definitions = Definitions()
+
         self.standard_buttons = []
         self.advanced_buttons = []
         self.more_buttons = []
@@ -74,7 +556,7 @@ class Calculator(QMainWindow):
         # Menu options:
         self.menu_list = QListWidget(self.sidebar)
         self.menu_list.setObjectName("menu_list")
-        self.menu_list.addItems(["Standard", "Advanced", "Conversions"])
+        self.menu_list.addItems(["Standard", "Advanced", "Worksheet", "Graph", "Table", "Matrix", "Statistics", "Conversions"])
         self.menu_list.itemClicked.connect(self.change_mode)
         self.sidebar_layout.addWidget(self.menu_list)  # Add to layout instead
 
@@ -102,13 +584,57 @@ class Calculator(QMainWindow):
         self.history_open = False
         self.menu_open = False
 
-        # Separate histories for standard and advanced modes
-        self.standard_history = QListWidget()
-        self.advanced_history = QListWidget()
-
-        # Adding double click functionality to history items
-        self.standard_history.itemDoubleClicked.connect(self.use_history_item)
-        self.advanced_history.itemDoubleClicked.connect(self.use_history_item)
+        # Separate histories for standard and advanced modes. The entries live in bounded
+        # models (see history.py); the views only create text for the rows on screen
+        # History is saved to disk in the background (see history_store.py); without a
+        # usable database it is only kept until the app closes
+        try:
+            self.history_store = HistoryStore()
+            self.history_limit = self.history_store.setting("history_limit", DEFAULT_HISTORY_LIMIT)
+            standard, advanced = (PersistentHistory(self.history_store, mode, self.history_limit)
+                                  for mode in ("Standard", "Advanced"))
+        except (OSError, sqlite3.Error) as error:
+            print(f"History won't be saved: {error}", file=sys.stderr)
+            self.history_store = None
+            self.history_limit = DEFAULT_HISTORY_LIMIT
+            standard, advanced = HistoryBuffer(), HistoryBuffer()
+        self.standard_history_model = HistoryModel(standard, parent=self)
+        self.advanced_history_model = HistoryModel(advanced, parent=self)
+        self.search_results_model = HistoryModel([], parent=self)
+        self.standard_history = QListView()
+        self.advanced_history = QListView()
+        self.search_results = QListView()
+
+        # Searching both histories, e.g. "sin", "result > 1e6" or "mode:advanced" (see history.py)
+        self.history_search = QLineEdit()
+        self.history_search.setPlaceholderText("Search: sin, result > 1e6, mode:advanced")
+        self.history_search.setClearButtonEnabled(True)
+        right_layout.addWidget(self.history_search)
+        self.history_search_status = QLabel()
+        self.history_search_status.hide()
+        right_layout.addWidget(self.history_search_status)
+
+        # The search runs once typing pauses, not on every key press
+        self.history_search_timer = QTimer(self)
+        self.history_search_timer.setSingleShot(True)
+        self.history_search_timer.setInterval(150)
+        self.history_search_timer.timeout.connect(self.search_history)
+        self.history_search.textChanged.connect(self.history_search_timer.start)
+
+        for view, model in ((self.standard_history, self.standard_history_model),
+                            (self.advanced_history, self.advanced_history_model),
+                            (self.search_results, self.search_results_model)):
+            view.setModel(model)
+            view.setUniformItemSizes(True)  # Rows aren't measured one by one, so huge histories scroll smoothly
+            view.setEditTriggers(QListView.NoEditTriggers)
+            # Adding double click functionality to history items
+            view.doubleClicked.connect(self.use_history_item)
+
+        # Right click: use an entry, or run entries again in the current angle mode
+        for view in (self.standard_history, self.advanced_history):
+            view.setSelectionMode(QListView.ExtendedSelection)
+            view.setContextMenuPolicy(Qt.CustomContextMenu)
+            view.customContextMenuRequested.connect(self.show_history_menu)
 
 
         # Creating a stacked widget (switches with mode)
@@ -117,12 +643,15 @@ class Calculator(QMainWindow):
         self.history_stack.addWidget(self.advanced_history)  # index 1
         right_layout.addWidget(self.history_stack)
         self.history_stack.setCurrentIndex(0)  # Default to standard history
+        # Shown instead of the history while there is a search
+        self.search_results.hide()
+        right_layout.addWidget(self.search_results)
         self.history_button.clicked.connect(self.toggle_history)
 
         # Clear button at bottom
         right_layout.addStretch()
         clear_btn = QPushButton("Clear History")
-        clear_btn.clicked.connect(lambda: self.current_history().clear())
+        clear_btn.clicked.connect(self.clear_history)
         right_layout.addWidget(clear_btn, alignment=Qt.AlignBottom)
 
         self.overlay = QWidget(self)
@@ -263,6 +792,58 @@ class Calculator(QMainWindow):
         layout.addWidget(separator)
 
         layout.addSpacing(20)
+
+        # === History size ===
+        history_layout = QHBoxLayout()
+        history_size_label = QLabel("History entries kept:")
+        history_size_label.setStyleSheet("font-size: 15px;")
+        history_layout.addWidget(history_size_label)
+
+        self.history_limit_combo = QComboBox()
+        self.history_limit_combo.addItems([str(limit) for limit in HISTORY_LIMITS])
+        self.history_limit_combo.setCurrentText(str(self.history_limit))
+        self.history_limit_combo.currentTextChanged.connect(self.change_history_limit)
+        history_layout.addWidget(self.history_limit_combo)
+        layout.addLayout(history_layout)
+
+        # Export / import the history as CSV or JSON Lines (see history_io.py)
+        history_file_layout = QHBoxLayout()
+        export_history_button = QPushButton("Export History…")
+        export_history_button.clicked.connect(self.export_history_file)
+        history_file_layout.addWidget(export_history_button)
+        import_history_button = QPushButton("Import History…")
+        import_history_button.clicked.connect(self.import_history_file)
+        history_file_layout.addWidget(import_history_button)
+        layout.addLayout(history_file_layout)
+
+        self.history_file_status = QLabel()
+        self.history_file_status.setStyleSheet("font-size: 15px; color: #666;")
+        layout.addWidget(self.history_file_status)
+
+        # === "Diagnostics" section: how well the conversion cache works ===
+        diagnostics_title = QLabel("Diagnostics")
+        diagnostics_title.setStyleSheet('font-size: 25px; font-weight: bold; font-family: "Segoe UI", -apple-system, Roboto, sans-serif;')
+        layout.addWidget(diagnostics_title)
+
+        self.cache_stats_label = QLabel()
+        self.cache_stats_label.setStyleSheet("font-size: 15px; color: #666;")
+        layout.addWidget(self.cache_stats_label)
+
+        cache_layout = QHBoxLayout()
+        cache_size_label = QLabel("Cached conversions:")
+        cache_size_label.setStyleSheet("font-size: 15px;")
+        cache_layout.addWidget(cache_size_label)
+
+        self.cache_size_combo = QComboBox()
+        self.cache_size_combo.addItems(["256", "1024", "4096", "16384"])
+        self.cache_size_combo.setCurrentText(str(CONVERSION_CACHE.maxsize))
+        self.cache_size_combo.currentTextChanged.connect(self.change_cache_size)
+        cache_layout.addWidget(self.cache_size_combo)
+
+        clear_cache_button = QPushButton("Clear")
+        clear_cache_button.clicked.connect(self.clear_conversion_cache)
+        cache_layout.addWidget(clear_cache_button)
+        layout.addLayout(cache_layout)
         
         self.about_container = QWidget()
         self.about_layout = QVBoxLayout(self.about_container)
@@ -432,29 +1013,194 @@ class Calculator(QMainWindow):
         # Hide overlay
         self.overlay.hide()
         
+        self.update_cache_stats()
+
         # Switch to settings page
         self.page_layout.setCurrentWidget(self.settings_page)
         self.mode_label.setText("Settings")
         self.display_container.hide()
 
+    def update_cache_stats(self):
+        """Show the hit/miss counters of the conversion cache on the settings page"""
+        lookups = CONVERSION_CACHE.hits + CONVERSION_CACHE.misses
+        hit_rate = f" ({CONVERSION_CACHE.hits / lookups:.0%} hits)" if lookups else ""
+        self.cache_stats_label.setText(f"Conversion cache: {CONVERSION_CACHE.hits} hits, "
+                                       f"{CONVERSION_CACHE.misses} misses{hit_rate}\n"
+                                       f"{len(CONVERSION_CACHE)} of {CONVERSION_CACHE.maxsize} results stored")
+
+    def change_cache_size(self, size):
+        CONVERSION_CACHE.resize(int(size))
+        self.update_cache_stats()
+
+    def clear_conversion_cache(self):
+        CONVERSION_CACHE.clear()
+        self.update_cache_stats()
+
+    def closeEvent(self, event):
+        # Write the history entries that are still queued before the app quits
+        if self.history_store is not None:
+            self.history_store.close()
+        super().closeEvent(event)
+
     def current_history(self):
-        return self.standard_history if self.history_stack.currentIndex() == 0 else self.advanced_history
+        return self.standard_history_model if self.history_stack.currentIndex() == 0 else self.advanced_history_model
     
-    def add_to_history(self, expression, result):
+    def add_to_history(self, expression, result, compiled=None):
         """Add a new item to the appropriate history (standard/advanced)."""
-        self.history_item = f"{expression} = {result}"
-
+        # The compiled expression is kept so the entry can be run again without parsing it
         if self.mode_label.text().startswith("Standard"):
-            self.standard_history.addItem(self.history_item)
+            self.standard_history_model.add(HistoryEntry(expression, result, "Standard",
+                                                         angle_mode=self.angle_mode, compiled=compiled))
         elif self.mode_label.text().startswith("Advanced"):
-            self.advanced_history.addItem(self.history_item)
+            self.advanced_history_model.add(HistoryEntry(expression, result, "Advanced",
+                                                         angle_mode=self.angle_mode, compiled=compiled))
+
+    def clear_history(self):
+        self.current_history().clear()
+        if self.history_search.text().strip():
+            if self.history_store is not None:
+                self.history_store.flush()  # The search reads the database, so the clear has to be written first
+            self.search_history()
+
+    def search_history(self):
+        """Show the entries found by the text in the history search bar"""
+        text = self.history_search.text().strip()
+        if not text:
+            self.search_results.hide()
+            self.history_search_status.hide()
+            self.history_stack.show()
+            return
 
-    def use_history_item(self, item):
+        try:
+            query = parse_history_query(text)
+            if self.history_store is not None:
+                results = self.history_store.search(query)
+            else:
+                results = search_entries([self.standard_history_model.buffer, self.advanced_history_model.buffer],
+                                         query)
+        except (ValueError, sqlite3.Error) as error:
+            results = []
+            self.history_search_status.setText(str(error))
+        else:
+            if len(results) < SEARCH_LIMIT:
+                self.history_search_status.setText(f"{len(results)} found")
+            else:
+                self.history_search_status.setText(f"First {SEARCH_LIMIT} shown")
+
+        self.search_results_model.set_history(results)
+        self.history_stack.hide()
+        self.search_results.show()
+        self.history_search_status.show()
+
+    def use_history_item(self, index):
         """Load expression back into the display when double-clicked."""
-        text = item.text()
-        if "=" in text:
-            expression, result = text.split("=", 1)
-            self.display.setText(expression.strip())
+        entry = index.data(Qt.UserRole)
+        if entry is not None:
+            # Trigonometry gives the same result again only in the angle mode it was calculated in
+            if entry.angle_mode is not None and entry.depends_on_angle_mode():
+                self.angle_mode_combo.setCurrentText(ANGLE_MODE_NAMES[entry.angle_mode])
+            self.display.setText(str(entry.expression))
+
+    def show_history_menu(self, position):
+        view = self.sender()
+        model = view.model()
+        rows = sorted(index.row() for index in view.selectionModel().selectedIndexes())
+        angle_name = ANGLE_MODE_NAMES[self.angle_mode]
+
+        menu = QMenu(self)
+        use_action = menu.addAction("Use Expression")
+        recalculate_action = menu.addAction(f"Recalculate in {angle_name}")
+        recalculate_all_action = menu.addAction(f"Recalculate All in {angle_name}")
+        use_action.setEnabled(len(rows) == 1)
+        recalculate_action.setEnabled(bool(rows))
+        recalculate_all_action.setEnabled(model.rowCount() > 0)
+
+        action = menu.exec_(view.viewport().mapToGlobal(position))
+        if action is use_action:
+            self.use_history_item(model.index(rows[0]))
+        elif action is recalculate_action:
+            failed = model.recalculate(rows, self.angle_mode)
+            # One entry: show its new result like a calculation
+            if len(rows) == 1:
+                self.display.setText("Error" if failed else str(model.data(model.index(rows[0]), Qt.UserRole).result))
+                self.just_calculated = True
+        elif action is recalculate_all_action:
+            QApplication.setOverrideCursor(Qt.WaitCursor)
+            try:
+                model.recalculate_all(self.angle_mode)
+            finally:
+                QApplication.restoreOverrideCursor()
+
+    def change_history_limit(self, limit):
+        """Keep at most `limit` entries in each history (older ones are dropped)"""
+        self.history_limit = int(limit)
+        for model in (self.standard_history_model, self.advanced_history_model):
+            model.set_limit(self.history_limit)
+        if self.history_store is not None:
+            self.history_store.set_setting("history_limit", self.history_limit)
+
+    def export_history_file(self):
+        path, selected = QFileDialog.getSaveFileName(self, "Export History", "history.csv",
+                                                     "CSV (*.csv);;JSON Lines (*.jsonl)")
+        if not path:
+            return
+        if "." not in os.path.basename(path):
+            path += ".jsonl" if selected.startswith("JSON") else ".csv"
+
+        QApplication.setOverrideCursor(Qt.WaitCursor)
+        try:
+            if self.history_store is not None:
+                # Streamed straight from the database
+                count = export_history(self.history_store, path)
+            else:
+                history_format = file_format(path)
+                with open(path, "w", newline="", encoding="utf-8") as out:
+                    count = write_history(out, chain(self.standard_history_model.buffer,
+                                                     self.advanced_history_model.buffer), history_format)
+        except (ValueError, OSError, sqlite3.Error) as error:
+            self.history_file_status.setText(f"Export failed: {error}")
+        else:
+            self.history_file_status.setText(f"Exported {count} entries")
+        finally:
+            QApplication.restoreOverrideCursor()
+
+    def import_history_file(self):
+        path, _ = QFileDialog.getOpenFileName(self, "Import History", "",
+                                              "History files (*.csv *.jsonl *.ndjson);;All files (*)")
+        if not path:
+            return
+
+        models = {"Standard": self.standard_history_model, "Advanced": self.advanced_history_model}
+        QApplication.setOverrideCursor(Qt.WaitCursor)
+        try:
+            if self.history_store is not None:
+                try:
+                    added, skipped = import_history(self.history_store, path)
+                finally:
+                    # Batches written before an error stay, so the lists are reloaded either way
+                    for model in models.values():
+                        model.reload()
+            else:
+                with open(path, newline="", encoding="utf-8") as file:
+                    entries = list(read_history(file, file_format(path), path))
+                seen = {(entry.mode, entry.timestamp, entry.expression)
+                        for model in models.values() for entry in model.buffer}
+                new_entries = {mode: [] for mode in models}
+                for entry in entries:
+                    key = (entry.mode, entry.timestamp, entry.expression)
+                    if key not in seen:
+                        seen.add(key)
+                        new_entries[entry.mode].append(entry)
+                for mode, model in models.items():
+                    model.extend(new_entries[mode])
+                added = sum(len(mode_entries) for mode_entries in new_entries.values())
+                skipped = len(entries) - added
+        except (ValueError, OSError, sqlite3.Error) as error:
+            self.history_file_status.setText(f"Import failed: {error}")
+        else:
+            self.history_file_status.setText(f"Imported {added} entries, skipped {skipped} already in the history")
+        finally:
+            QApplication.restoreOverrideCursor()
 
     def close_sidebar_on_click(self, event):
         """Close history if overlay is clicked"""
@@ -615,12 +1361,24 @@ class Calculator(QMainWindow):
         self.page_layout = QStackedWidget()
         self.standard_page = self.create_standard_calc()
         self.advanced_page = self.create_adv_calc()
+        self.worksheet_page = self.create_worksheet_page()
+        self.graph_page = self.create_graph_page()
+        self.table_page = self.create_table_page()
+        self.matrix_page = self.create_matrix_page()
+        self.statistics_page = self.create_statistics_page()
         self.conversions_page = self.create_conversions_page()
+        self.converter_page = self.create_converter_page()
         self.settings_page = self.create_settings_page()
 
         self.page_layout.addWidget(self.standard_page)  # Added Standard page to the stack widget
         self.page_layout.addWidget(self.advanced_page)  # Added Advanced page to the stack widget
+        self.page_layout.addWidget(self.worksheet_page)  # Added Worksheet page to the stack widget
+        self.page_layout.addWidget(self.graph_page)  # Added Graph page to the stack widget
+        self.page_layout.addWidget(self.table_page)  # Added Table page to the stack widget
+        self.page_layout.addWidget(self.matrix_page)  # Added Matrix page to the stack widget
+        self.page_layout.addWidget(self.statistics_page)  # Added Statistics page to the stack widget
         self.page_layout.addWidget(self.conversions_page)  # Added Conversions page to the stack widget
+        self.page_layout.addWidget(self.converter_page)  # Added the shared converter page to the stack widget
         self.page_layout.addWidget(self.settings_page)  # Added settings page to the stack widget
         self.page_layout.setCurrentWidget(self.standard_page)  # Defaults to the standard page
         main_layout.addWidget(self.page_layout)
@@ -639,6 +1397,11 @@ class Calculator(QMainWindow):
             self.angle_mode = "deg"
         else:
             self.angle_mode = "rad"
+        if self.worksheet_model.worksheet.angle_mode != self.angle_mode:
+            self.worksheet_model.set_angle_mode(self.angle_mode)
+        if self.graph_view is not None:
+            self.update_graph()
+        self.update_value_table()
 
     def show_theme_menu(self):
         """Show the theme selection menu directly"""
@@ -1088,6 +1851,9 @@ class Calculator(QMainWindow):
 
         if self.overlay.isVisible():
             self.overlay.hide()
+        # The worksheet, graph and table pages have their own angle mode selector
+        self.angle_label.setVisible(mode in ("Worksheet", "Graph", "Table"))
+        self.angle_mode_combo.setVisible(mode in ("Worksheet", "Graph", "Table"))
         if hasattr(self, "right_sidebar") and self.right_sidebar.isVisible():
             self.right_sidebar.setVisible(False)
         if hasattr(self, "sidebar") and self.sidebar.isVisible():
@@ -1110,6 +1876,30 @@ class Calculator(QMainWindow):
             self.history_button.show()
             self.theme_button.show()
 
+        elif mode == "Worksheet":
+            self.page_layout.setCurrentWidget(self.worksheet_page)
+            self.display_container.hide()
+            self.worksheet_editor.setFocus()
+
+        elif mode == "Graph":
+            self.page_layout.setCurrentWidget(self.graph_page)
+            self.display_container.hide()
+            if self.graph_view is not None:
+                self.update_graph()  # Definitions may have changed in the other modes
+
+        elif mode == "Table":
+            self.page_layout.setCurrentWidget(self.table_page)
+            self.display_container.hide()
+            self.update_value_table()
+
+        elif mode == "Matrix":
+            self.page_layout.setCurrentWidget(self.matrix_page)
+            self.display_container.hide()
+
+        elif mode == "Statistics":
+            self.page_layout.setCurrentWidget(self.statistics_page)
+            self.display_container.hide()
+
         elif mode == "Conversions":
             self.page_layout.setCurrentWidget(self.conversions_page)
             self.display_container.hide()
@@ -2246,81 +3036,41 @@ class Calculator(QMainWindow):
 
             original_expression = expression
 
-            # 1. Handling the nCr operation:
-            if 'C' in expression and not any(func in expression for func in ['cos', 'acos']):
-                # Adding this line because if the user types in 'cos' or 'acos', it contains a 'C' which will create conflicts
-                try:
-                    parts = expression.split('C')
-                    if len(parts) == 2:
-                        n = int(float(parts[0]))
-                        r = int(float(parts[1]))
-
-                        if n >= 0 and r >= 0 and n >= r:
-                            result = math.factorial(n) // (math.factorial(r) * math.factorial(n - r))
-                            self.display.setText(str(result))
-                            self.add_to_history(original_expression, result)
-                            self.just_calculated = True
-                            return
-
-                        else:
-                            self.display.setText("Error")
-                            return
-
-                except:
-                    self.display.setText("Error")
-                    return
+            # 1. Handling the nCr and nPr operations (typed as 5C2 / 5P2 by the advanced buttons):
+            # Only whole "number C number" expressions count, so units like °C or PB aren't mistaken for them
+            match = re.fullmatch(r"(\d+(?:\.\d*)?)\s*([CP])\s*(\d+(?:\.\d*)?)", expression)
+            if match:
+                n = int(float(match.group(1)))
+                r = int(float(match.group(3)))
 
-            # 2. Handling the nPr operation:
-            if 'P' in expression and not any(func in expression for func in ['exp']):
-                # Adding this line because if the user types in 'exp', it contains a 'P' which will create conflicts
+                if n >= 0 and r >= 0 and n >= r:
+                    if match.group(2) == 'C':
+                        result = math.factorial(n) // (math.factorial(r) * math.factorial(n - r))
+                    else:
+                        result = math.factorial(n) // math.factorial(n - r)
+                    self.display.setText(str(result))
+                    self.add_to_history(original_expression, result)
+                    self.just_calculated = True
 
-                try:
-                    parts = expression.split('P')
-                    if len(parts) == 2:
-                        n = int(float(parts[0]))
-                        r = int(float(parts[1]))
-
-                        if n >= 0 and r >= 0 and n >= r:
-                            result = math.factorial(n) // math.factorial(n - r)
-                            self.display.setText(str(result))
-                            self.add_to_history(original_expression, result)
-                            self.just_calculated = True
-                            return
-
-                        else:
-                            self.display.setText("Error")
-                            return
-
-                except:
+                else:
                     self.display.setText("Error")
-                    return
-
-                # Handle mod operations
-                if ' mod ' in expression:
-                    try:
-                        parts = expression.split(' mod ')
-                        if len(parts) == 2:
-                            a = float(parts[0])
-                            b = float(parts[1])
-                            if b != 0:
-                                result = a % b
-                                self.display.setText(str(result))
-                                self.add_to_history(original_expression, result)
-                                self.just_calculated = True
-                                return
-                            else:
-                                self.display.setText("Error")
-                                return
-                    except:
-                        self.display.setText("Error")
-                        return
+                return
 
-            expression = expression.replace('×', '*').replace('÷', '/')
-            expression = expression.replace('e', str(math.e))
+            # 2. Definitions: "r = 5 km", "f(x) = x² + sin(x)" (shared by both modes, see definitions.py)
+            if is_definition(expression):
+                result = self.definitions.define(expression, self.angle_mode)
+                if "(" not in expression.split("=", 1)[0]:
+                    self.add_to_history(original_expression, result)  # Variables keep their value in the history
+                self.display.setText(result)
+                self.just_calculated = True
+                return
 
-            result = str(eval(expression))
-            # Built-in function to evaluate expressions in python and then typecasting it back to a string
-            self.add_to_history(original_expression, result)
+            # 3. Everything else (including mod and units like "5 km + 300 m in ft") goes through
+            # the expression engine, which caches the compiled form of each expression
+            compiled, value = self.definitions.evaluate(expression, self.angle_mode)
+            result = compiled.format(value)
+            # Only kept with the entry when it can run again without the definitions it read
+            self.add_to_history(original_expression, result, None if compiled.names else compiled)
 
             self.display.setText(result)
             self.just_calculated = True
@@ -2353,25 +3103,6 @@ class Calculator(QMainWindow):
         else:
             self.angle_mode = 'rad'
 
-    def format_result(self, value):
-        """
-        Format calculation results:
-        - If the number is an integer (like 16.0), drop the .0
-        - Otherwise, show up to 10 decimal places (strip trailing zeros)
-        """
-        try:
-            # Convert to float to handle both strings and floats
-            value = float(value)
-
-            # Check if it's effectively an integer (16.0 → 16)
-            if value == int(value):
-                return str(int(value))
-            else:
-                # Format to 10 decimal places and strip extra zeros
-                return f"{value:.10f}".rstrip("0").rstrip(".")
-        except Exception:
-            return str(value)  # Fallback for safety
-
     def extra_buttons_clicked(self):
         button = self.sender()
         # return the object that triggered this event (here, clicked button is the sender)
@@ -2598,6 +3329,492 @@ class Calculator(QMainWindow):
         except ValueError:
             self.display.setText("Error")
 
+    def create_worksheet_page(self):
+        """Lines like "area = width height" on the left, the result of each line on the right (see worksheet.py)"""
+        page = QWidget()
+        layout = QHBoxLayout()
+
+        font = 'font-size: 16px; font-family: "SF Mono", "Segoe UI", Consolas, monospace;'
+        self.worksheet_editor = QPlainTextEdit()
+        self.worksheet_editor.setObjectName("worksheet_editor")
+        self.worksheet_editor.setLineWrapMode(QPlainTextEdit.NoWrap)  # One editor line is one result row
+        self.worksheet_editor.setPlaceholderText("width = 3 m\nheight = 2.5 m\narea = width height\narea in ft²")
+        self.worksheet_editor.setStyleSheet(font)
+        layout.addWidget(self.worksheet_editor, 3)
+
+        self.worksheet_model = WorksheetModel(Worksheet(self.angle_mode), parent=self)
+        self.worksheet_results = QListView()
+        self.worksheet_results.setObjectName("worksheet_results")
+        self.worksheet_results.setModel(self.worksheet_model)
+        self.worksheet_results.setUniformItemSizes(True)
+        self.worksheet_results.setEditTriggers(QListView.NoEditTriggers)
+        self.worksheet_results.setStyleSheet(font)
+        layout.addWidget(self.worksheet_results, 2)
+
+        # Both scroll a line at a time, so the results stay next to their lines
+        self.worksheet_editor.verticalScrollBar().valueChanged.connect(
+            self.worksheet_results.verticalScrollBar().setValue)
+        self.worksheet_results.verticalScrollBar().valueChanged.connect(
+            self.worksheet_editor.verticalScrollBar().setValue)
+
+        # Typing only schedules an update, which then runs once on the next frame
+        self.worksheet_timer = QTimer(self)
+        self.worksheet_timer.setSingleShot(True)
+        self.worksheet_timer.setInterval(16)
+        self.worksheet_timer.timeout.connect(self.update_worksheet)
+        self.worksheet_editor.textChanged.connect(self.schedule_worksheet_update)
+
+        page.setLayout(layout)
+        return page
+
+    def schedule_worksheet_update(self):
+        if not self.worksheet_timer.isActive():
+            self.worksheet_timer.start()
+
+    def update_worksheet(self):
+        self.worksheet_model.set_lines(self.worksheet_editor.toPlainText().split("\n"))
+
+    def create_graph_page(self):
+        """Curves y = f(x), one per line, drawn by a GraphView (see plotting.py)"""
+        page = QWidget()
+        layout = QVBoxLayout()
+        self.graph_curves = {}  # (line, angle mode) → Curve, so an edit keeps the samples of the other lines
+
+        if np is None:
+            self.graph_view = None
+            notice = QLabel("Graphs need NumPy (pip install numpy)")
+            notice.setAlignment(Qt.AlignCenter)
+            layout.addWidget(notice)
+            page.setLayout(layout)
+            return page
+
+        self.graph_editor = QPlainTextEdit()
+        self.graph_editor.setObjectName("graph_editor")
+        self.graph_editor.setPlaceholderText("y = x²\nsin(x)")
+        self.graph_editor.setStyleSheet('font-size: 16px; font-family: "SF Mono", "Segoe UI", Consolas, monospace;')
+        self.graph_editor.setFixedHeight(90)
+        layout.addWidget(self.graph_editor)
+
+        self.graph_status = QLabel()
+        self.graph_status.setWordWrap(True)
+        self.graph_status.hide()
+        layout.addWidget(self.graph_status)
+
+        self.graph_view = GraphView()
+        layout.addWidget(self.graph_view)
+
+        reset_button = QPushButton("Reset View")
+        reset_button.clicked.connect(self.graph_view.reset_view)
+        layout.addWidget(reset_button)
+
+        self.graph_timer = QTimer(self)
+        self.graph_timer.setSingleShot(True)
+        self.graph_timer.setInterval(150)
+        self.graph_timer.timeout.connect(self.update_graph)
+        self.graph_editor.textChanged.connect(self.graph_timer.start)
+
+        page.setLayout(layout)
+        return page
+
+    def update_graph(self):
+        """Compile the lines of the graph editor into curves of x"""
+        scope = self.definitions.scope(self.angle_mode)
+        curves, errors, kept = [], [], {}
+        for number, line in enumerate(self.graph_editor.toPlainText().split("\n"), 1):
+            text = re.sub(r"^\s*y\s*=", "", line).strip()
+            if not text or text.startswith("#"):
+                continue
+            curve = self.graph_curves.get((text, self.angle_mode))
+            if curve is None or curve.scope is not scope:
+                try:
+                    curve = Curve(text, self.definitions.compile(text, self.angle_mode, ("x",)), scope)
+                except ValueError as error:
+                    errors.append(f"Line {number}: {error}")
+                    continue
+            kept[text, self.angle_mode] = curve
+            curves.append(curve)
+        self.graph_curves = kept
+        self.graph_status.setText("\n".join(errors))
+        self.graph_status.setVisible(bool(errors))
+        self.graph_view.set_curves(curves)
+
+    def create_table_page(self):
+        """f(x) for x from a start to a stop value in steps (see value_table.py)"""
+        page = QWidget()
+        layout = QVBoxLayout()
+
+        inputs = QGridLayout()
+        self.table_function = QLineEdit("x²")
+        self.table_start = QLineEdit("0")
+        self.table_stop = QLineEdit("10")
+        self.table_step = QLineEdit("1")
+        for row, (label, field) in enumerate((("f(x) =", self.table_function), ("Start:", self.table_start),
+                                              ("Stop:", self.table_stop), ("Step:", self.table_step))):
+            inputs.addWidget(QLabel(label), row, 0)
+            inputs.addWidget(field, row, 1)
+            field.setObjectName("table_input")
+            field.textChanged.connect(lambda text: self.table_timer.start())
+        layout.addLayout(inputs)
+
+        self.table_status = QLabel()
+        self.table_status.setWordWrap(True)
+        self.table_status.hide()
+        layout.addWidget(self.table_status)
+
+        # Only the rows on screen are in the model, so a billion rows open as fast as ten
+        self.value_table_model = ValueTableModel(parent=self)
+        self.value_table_view = ValueTableView(self.value_table_model)
+        self.value_table_view.view.setStyleSheet('font-family: "SF Mono", "Segoe UI", Consolas, monospace;')
+        layout.addWidget(self.value_table_view)
+
+        self.table_timer = QTimer(self)
+        self.table_timer.setSingleShot(True)
+        self.table_timer.setInterval(150)
+        self.table_timer.timeout.connect(self.update_value_table)
+
+        page.setLayout(layout)
+        return page
+
+    def update_value_table(self):
+        """Make a new table from the inputs; its rows are only computed when they are shown"""
+        scope = self.definitions.scope(self.angle_mode)
+        try:
+            compiled = self.definitions.compile(self.table_function.text().strip(), self.angle_mode, ("x",))
+            # Start, stop and step may be expressions too: 0, 2π, π/12
+            bounds = []
+            for name, field in (("Start", self.table_start), ("Stop", self.table_stop), ("Step", self.table_step)):
+                bound_compiled, bound = self.definitions.evaluate(field.text().strip(), self.angle_mode)
+                if bound_compiled.unit_text is not None:
+                    raise ValueError(f"{name} has to be a plain number")
+                bounds.append(bound)
+            table = ValueTable(compiled, *bounds, scope)
+        except (ValueError, ArithmeticError, TypeError) as error:
+            self.table_status.setText(str(error))
+            self.table_status.show()
+            self.value_table_model.set_table(None)
+            self.value_table_view.table_changed()
+            return
+        self.table_status.hide()
+        self.value_table_model.set_table(table)
+        self.value_table_view.table_changed()
+
+    def create_matrix_page(self):
+        """A grid editor for the matrices A and B and the operations on them (see matrices.py)"""
+        page = QWidget()
+        layout = QVBoxLayout()
+
+        if np is None:
+            notice = QLabel("Matrices need NumPy (pip install numpy)")
+            notice.setAlignment(Qt.AlignCenter)
+            layout.addWidget(notice)
+            page.setLayout(layout)
+            return page
+
+        self.matrices = {"A": new_matrix(3, 3), "B": new_matrix(3, 1)}
+        self.matrix_results = []  # [(title, matrix or number), ...] of the last operation
+
+        controls = QHBoxLayout()
+        self.matrix_selector = QComboBox()
+        self.matrix_selector.addItems(list(self.matrices))
+        self.matrix_selector.currentTextChanged.connect(self.show_matrix)
+        controls.addWidget(self.matrix_selector)
+        self.matrix_rows = QSpinBox()
+        self.matrix_columns = QSpinBox()
+        for label, spin_box in (("Rows:", self.matrix_rows), ("Columns:", self.matrix_columns)):
+            spin_box.setRange(1, MAX_SIZE)
+            spin_box.setKeyboardTracking(False)  # Resize once the number is typed, not at every digit
+            spin_box.valueChanged.connect(self.resize_matrix)
+            controls.addWidget(QLabel(label))
+            controls.addWidget(spin_box)
+        for text, action in (("Identity", lambda: self.fill_matrix("Identity")),
+                             ("Random", lambda: self.fill_matrix("Random")),
+                             ("Paste", self.paste_matrix), ("Load…", self.load_matrix_file),
+                             ("Save…", self.save_matrix_file)):
+            button = QPushButton(text)
+            button.clicked.connect(lambda checked, action=action: action())
+            controls.addWidget(button)
+        controls.addStretch()
+        layout.addLayout(controls)
+
+        self.matrix_model = MatrixModel(editable=True, parent=self)
+        self.matrix_editor = QTableView()
+        self.matrix_editor.setModel(self.matrix_model)
+        self.matrix_editor.setStyleSheet('font-family: "SF Mono", "Segoe UI", Consolas, monospace;')
+        layout.addWidget(self.matrix_editor, 3)
+
+        operations = QHBoxLayout()
+        for name in OPERATIONS:
+            button = QPushButton(name)
+            button.clicked.connect(lambda checked, name=name: self.run_matrix_operation(name))
+            operations.addWidget(button)
+        layout.addLayout(operations)
+
+        self.matrix_status = QLabel()
+        self.matrix_status.setWordWrap(True)
+        layout.addWidget(self.matrix_status)
+
+        result_controls = QHBoxLayout()
+        self.matrix_result_selector = QComboBox()
+        self.matrix_result_selector.currentIndexChanged.connect(self.show_matrix_result)
+        result_controls.addWidget(self.matrix_result_selector)
+        self.matrix_use_buttons = []
+        for name in self.matrices:
+            button = QPushButton(f"Use as {name}")
+            button.clicked.connect(lambda checked, name=name: self.use_matrix_result(name))
+            result_controls.addWidget(button)
+            self.matrix_use_buttons.append(button)
+        result_controls.addStretch()
+        layout.addLayout(result_controls)
+
+        self.matrix_result_model = MatrixModel(parent=self)
+        self.matrix_result_view = QTableView()
+        self.matrix_result_view.setModel(self.matrix_result_model)
+        self.matrix_result_view.setEditTriggers(QTableView.NoEditTriggers)
+        self.matrix_result_view.setStyleSheet('font-family: "SF Mono", "Segoe UI", Consolas, monospace;')
+        layout.addWidget(self.matrix_result_view, 2)
+
+        self.show_matrix("A")
+        self.show_matrix_results([])
+        page.setLayout(layout)
+        return page
+
+    def show_matrix(self, name):
+        """Edit A or B"""
+        matrix = self.matrices[name]
+        for spin_box, size in ((self.matrix_rows, matrix.shape[0]), (self.matrix_columns, matrix.shape[1])):
+            spin_box.blockSignals(True)
+            spin_box.setValue(size)
+            spin_box.blockSignals(False)
+        self.matrix_model.set_matrix(matrix)
+
+    def set_matrix(self, name, matrix):
+        self.matrices[name] = matrix
+        if self.matrix_selector.currentText() == name:
+            self.show_matrix(name)
+        else:
+            self.matrix_selector.setCurrentText(name)
+
+    def resize_matrix(self):
+        name = self.matrix_selector.currentText()
+        self.set_matrix(name, resized(self.matrices[name], self.matrix_rows.value(), self.matrix_columns.value()))
+
+    def fill_matrix(self, kind):
+        name = self.matrix_selector.currentText()
+        rows, columns = self.matrices[name].shape
+        if kind == "Identity":
+            self.set_matrix(name, np.eye(rows, columns))
+        else:
+            self.set_matrix(name, np.random.default_rng().random((rows, columns)))
+
+    def paste_matrix(self):
+        """Rows of numbers from the clipboard, e.g. cells copied from a spreadsheet"""
+        try:
+            self.set_matrix(self.matrix_selector.currentText(), parse_matrix(QApplication.clipboard().text()))
+        except ValueError as error:
+            self.matrix_status.setText(f"Paste failed: {error}")
+
+    def load_matrix_file(self):
+        path, _ = QFileDialog.getOpenFileName(self, "Load Matrix", "", f"{MATRIX_FILE_FILTER};;All files (*)")
+        if not path:
+            return
+        QApplication.setOverrideCursor(Qt.WaitCursor)
+        try:
+            self.set_matrix(self.matrix_selector.currentText(), load_matrix(path))
+        except (ValueError, OSError) as error:
+            self.matrix_status.setText(f"Load failed: {error}")
+        finally:
+            QApplication.restoreOverrideCursor()
+
+    def save_matrix_file(self):
+        name = self.matrix_selector.currentText()
+        path, _ = QFileDialog.getSaveFileName(self, "Save Matrix", f"{name}.csv", MATRIX_FILE_FILTER)
+        if not path:
+            return
+        if "." not in os.path.basename(path):
+            path += ".csv"
+        try:
+            save_matrix(path, self.matrices[name])
+        except (ValueError, OSError) as error:
+            self.matrix_status.setText(f"Save failed: {error}")
+        else:
+            self.matrix_status.setText(f"Saved {name} to {os.path.basename(path)}")
+
+    def run_matrix_operation(self, name):
+        a, b = self.matrices["A"], self.matrices["B"]
+        QApplication.setOverrideCursor(Qt.WaitCursor)
+        try:
+            start = time.perf_counter()
+            results = OPERATIONS[name](a, b)
+            elapsed = time.perf_counter() - start
+        except (ValueError, ArithmeticError) as error:
+            self.matrix_status.setText(str(error))
+            return
+        finally:
+            QApplication.restoreOverrideCursor()
+        numbers = [f"{title} = {value if isinstance(value, str) else format_value(value)}"
+                   for title, value in results if np.ndim(value) == 0]
+        self.matrix_status.setText(", ".join(numbers + [f"{name} took {elapsed * 1000:.3g} ms"]))
+        self.show_matrix_results([(title, value) for title, value in results if np.ndim(value) != 0])
+
+    def show_matrix_results(self, results):
+        self.matrix_results = results
+        self.matrix_result_selector.blockSignals(True)
+        self.matrix_result_selector.clear()
+        self.matrix_result_selector.addItems([f"{title} ({'×'.join(map(str, value.shape))})"
+                                              for title, value in results])
+        self.matrix_result_selector.blockSignals(False)
+        self.matrix_result_selector.setVisible(bool(results))
+        for button in self.matrix_use_buttons:
+            button.setVisible(bool(results))
+        self.matrix_result_view.setVisible(bool(results))
+        self.show_matrix_result(0)
+
+    def show_matrix_result(self, index):
+        self.matrix_result_model.set_matrix(self.matrix_results[index][1] if 0 <= index < len(self.matrix_results)
+                                            else None)
+
+    def use_matrix_result(self, name):
+        """Copy the result on show into A or B, to work on it further"""
+        index = self.matrix_result_selector.currentIndex()
+        if not 0 <= index < len(self.matrix_results):
+            return
+        title, value = self.matrix_results[index]
+        if np.iscomplexobj(value) and np.any(value.imag):
+            self.matrix_status.setText(f"{title} has complex values, which the editor can't hold")
+            return
+        self.set_matrix(name, as_matrix(np.real(value).copy()))  # A copy, so editing it leaves the result alone
+
+    def create_statistics_page(self):
+        """Count, mean, standard deviation... and a histogram of numbers typed in or read from a file"""
+        page = QWidget()
+        layout = QVBoxLayout()
+
+        self.statistics_editor = QPlainTextEdit()
+        self.statistics_editor.setObjectName("statistics_editor")
+        self.statistics_editor.setPlaceholderText("Type or paste numbers, separated by spaces, commas or new lines")
+        self.statistics_editor.setStyleSheet('font-size: 16px; font-family: "SF Mono", "Segoe UI", Consolas, monospace;')
+        self.statistics_editor.setFixedHeight(110)
+        layout.addWidget(self.statistics_editor)
+
+        file_controls = QHBoxLayout()
+        load_button = QPushButton("Load File…")
+        load_button.clicked.connect(self.load_statistics_file)
+        file_controls.addWidget(load_button)
+        file_controls.addWidget(QLabel("Column:"))
+        self.statistics_column = QLineEdit("0")
+        self.statistics_column.setToolTip("Name or number (from 0) of the column to read from CSV files")
+        self.statistics_column.setFixedWidth(120)
+        file_controls.addWidget(self.statistics_column)
+        self.statistics_cancel = QPushButton("Cancel")
+        self.statistics_cancel.clicked.connect(lambda: self.stop_statistics_file("Cancelled"))
+        self.statistics_cancel.hide()
+        file_controls.addWidget(self.statistics_cancel)
+        file_controls.addStretch()
+        layout.addLayout(file_controls)
+
+        self.statistics_status = QLabel()
+        self.statistics_status.setWordWrap(True)
+        layout.addWidget(self.statistics_status)
+
+        results = QGridLayout()
+        self.statistics_labels = {}
+        names = ["Count", "Skipped", "Sum", "Mean", "Minimum", "Maximum",
+                 "Std dev (sample)", "Variance (sample)", "Std dev (population)", "Variance (population)"]
+        for index, name in enumerate(names):
+            value = QLabel()
+            value.setTextInteractionFlags(Qt.TextSelectableByMouse)
+            results.addWidget(QLabel(f"{name}:"), index // 2, index % 2 * 2)
+            results.addWidget(value, index // 2, index % 2 * 2 + 1)
+            self.statistics_labels[name] = value
+        layout.addLayout(results)
+
+        self.histogram_view = HistogramView()
+        layout.addWidget(self.histogram_view)
+
+        self.statistics_timer = QTimer(self)
+        self.statistics_timer.setSingleShot(True)
+        self.statistics_timer.setInterval(150)
+        self.statistics_timer.timeout.connect(self.update_statistics)
+        self.statistics_editor.textChanged.connect(self.statistics_timer.start)
+
+        # A file is read a few chunks per tick, so the window stays responsive and can cancel
+        self.statistics_chunks = None
+        self.statistics_summary = None
+        self.statistics_path = None
+        self.statistics_file_timer = QTimer(self)
+        self.statistics_file_timer.setInterval(0)
+        self.statistics_file_timer.timeout.connect(self.read_statistics_chunks)
+
+        self.show_statistics(Summary())
+        page.setLayout(layout)
+        return page
+
+    def update_statistics(self):
+        """Summarise the numbers in the editor"""
+        self.stop_statistics_file()
+        summary = Summary()
+        summary.add(parse_numbers(self.statistics_editor.toPlainText()))
+        self.statistics_status.clear()
+        self.show_statistics(summary)
+
+    def load_statistics_file(self):
+        path, _ = QFileDialog.getOpenFileName(self, "Load Data", "", f"{DATA_FILE_FILTER};;All files (*)")
+        if path:
+            self.start_statistics_file(path)
+
+    def start_statistics_file(self, path):
+        self.stop_statistics_file()
+        self.statistics_chunks = read_column(path, self.statistics_column.text().strip() or "0")
+        self.statistics_summary = Summary()
+        self.statistics_path = path
+        self.statistics_cancel.show()
+        self.statistics_file_timer.start()
+
+    def read_statistics_chunks(self):
+        """Add chunks of the file for about a frame, then let the window update"""
+        summary, deadline = self.statistics_summary, time.perf_counter() + 0.03
+        try:
+            while time.perf_counter() < deadline:
+                chunk = next(self.statistics_chunks, None)
+                if chunk is None:
+                    self.stop_statistics_file(f"Read {os.path.basename(self.statistics_path)}")
+                    break
+                summary.add(chunk)
+            else:
+                self.statistics_status.setText(f"Reading {os.path.basename(self.statistics_path)}: "
+                                               f"{summary.count + summary.skipped:,} values so far…")
+        except (ValueError, RuntimeError, OSError) as error:
+            self.stop_statistics_file(f"Can't read {os.path.basename(self.statistics_path)}: {error}")
+        self.show_statistics(summary)
+
+    def stop_statistics_file(self, message=None):
+        if self.statistics_chunks is None:
+            return
+        self.statistics_file_timer.stop()
+        self.statistics_chunks.close()  # Closes the file
+        self.statistics_chunks = None
+        self.statistics_cancel.hide()
+        if message is not None:
+            self.statistics_status.setText(message)
+
+    def show_statistics(self, summary):
+        empty = not summary.count
+        values = {
+            "Count": f"{summary.count:,}",
+            "Skipped": f"{summary.skipped:,}",
+            "Sum": "" if empty else f"{summary.sum:.15g}",
+            "Mean": "" if empty else f"{summary.mean:.15g}",
+            "Minimum": "" if empty else f"{summary.minimum:.15g}",
+            "Maximum": "" if empty else f"{summary.maximum:.15g}",
+        }
+        for sample, kind in ((True, "sample"), (False, "population")):
+            variance = summary.variance(sample)
+            values[f"Variance ({kind})"] = "" if math.isnan(variance) else f"{variance:.15g}"
+            values[f"Std dev ({kind})"] = "" if math.isnan(variance) else f"{math.sqrt(variance):.15g}"
+        for name, text in values.items():
+            self.statistics_labels[name].setText(text)
+        self.histogram_view.set_summary(summary)
+
     def create_conversions_page(self):
         page = QWidget()
         layout = QVBoxLayout()
@@ -2611,6 +3828,29 @@ class Calculator(QMainWindow):
         title.setAlignment(Qt.AlignCenter)
         layout.addWidget(title)
 
+        # Built-in units plus the units of the user's unit packs (see unit_packs.py)
+        library, pack_errors = load_unit_packs()
+        for error in pack_errors:
+            print(f"Skipped unit pack {error}", file=sys.stderr)
+        self.conversion_types = library.conversion_types
+        self.conversion_data = library.conversion_data
+
+        # Currencies are only offered when there is a rates file (see currency.py)
+        try:
+            self.rate_store = open_rate_store()
+        except (OSError, ValueError) as error:
+            print(f"Can't read the currency rates: {error}", file=sys.stderr)
+            self.rate_store = None
+        if self.rate_store is not None:
+            self.conversion_types = self.conversion_types + ["Currency"]
+
+        # Search box: typing "mph" or "°F" lists the matching units instead of the categories
+        self.conversion_search = QLineEdit()
+        self.conversion_search.setObjectName("conversion_input")
+        self.conversion_search.setPlaceholderText("Search units, e.g. mph, kg or °F")
+        self.conversion_search.textChanged.connect(self.search_units)
+        layout.addWidget(self.conversion_search)
+
         # Creating the conversion types list:
         self.conversion_list = QListWidget()
 
@@ -2712,10 +3952,7 @@ class Calculator(QMainWindow):
             """)
 
         # Adding conversion categories to the list:
-        conversion_types = ["Length", "Weight and Mass", "Volume", "Temperature", "Energy",
-                            "Area", "Speed", "Time", "Power", "Data", "Pressure", "Angle", "Number Systems"]
-
-        self.conversion_list.addItems(conversion_types)
+        self.conversion_list.addItems(self.conversion_types)
         self.conversion_list.itemClicked.connect(self.open_conversion_calculator)
         self.conversion_list.setFixedHeight(350)
 
@@ -2730,245 +3967,123 @@ class Calculator(QMainWindow):
         instruction.setAlignment(Qt.AlignCenter)
         layout.addWidget(instruction)
 
-        # Adding conversion data types for all types:
-        self.conversion_data = {
-            "Length": {
-                "base_unit": "meter",
-                "units": {
-                    "Nanometer": 1e-9,
-                    "Micrometer": 1e-6,
-                    "Millimeter": 0.001,
-                    "Centimeter": 0.01,
-                    "Meter": 1.0,
-                    "Kilometer": 1000.0,
-                    "Inch": 0.0254,
-                    "Foot": 0.3048,
-                    "Yard": 0.9144,
-                    "Mile": 1609.34,
-                    "Nautical Mile": 1852.0
-                }
-            },
-            "Weight and Mass": {
-                "base_unit": "kilogram",
-                "units": {
-                    "Microgram": 1e-9,
-                    "Milligram": 1e-6,
-                    "Gram": 0.001,
-                    "Kilogram": 1.0,
-                    "Metric Ton": 1000.0,
-                    "Ounce": 0.0283495,
-                    "Pound": 0.453592,
-                    "Stone": 6.35029,
-                    "Short Ton": 907.185,
-                    "Long Ton": 1016.05
-                }
-            },
-            "Temperature": {
-                "special": True,  # Special handling needed
-                "units": ["Celsius", "Fahrenheit", "Kelvin", "Rankine"]
-            },
-            "Area": {
-                "base_unit": "square meter",
-                "units": {
-                    "Square Millimeter": 1e-6,
-                    "Square Centimeter": 1e-4,
-                    "Square Meter": 1.0,
-                    "Hectare": 10000.0,
-                    "Square Kilometer": 1e6,
-                    "Square Inch": 0.00064516,
-                    "Square Foot": 0.092903,
-                    "Square Yard": 0.836127,
-                    "Acre": 4046.86,
-                    "Square Mile": 2.59e6
-                }
-            },
-            "Volume": {
-                "base_unit": "liter",
-                "units": {
-                    "Milliliter": 0.001,
-                    "Liter": 1.0,
-                    "Cubic Centimeter": 0.001,
-                    "Cubic Meter": 1000.0,
-                    "Fluid Ounce (US)": 0.0295735,
-                    "Cup (US)": 0.236588,
-                    "Pint (US)": 0.473176,
-                    "Quart (US)": 0.946353,
-                    "Gallon (US)": 3.78541,
-                    "Cubic Inch": 0.0163871,
-                    "Cubic Foot": 28.3168
-                }
-            },
-            "Speed": {
-                "base_unit": "meter per second",
-                "units": {
-                    "Meter per Second": 1.0,
-                    "Kilometer per Hour": 0.277778,
-                    "Mile per Hour": 0.44704,
-                    "Knot": 0.514444,
-                    "Foot per Second": 0.3048,
-                    "Mach": 343.0
-                }
-            },
-            "Time": {
-                "base_unit": "second",
-                "units": {
-                    "Nanosecond": 1e-9,
-                    "Microsecond": 1e-6,
-                    "Millisecond": 0.001,
-                    "Second": 1.0,
-                    "Minute": 60.0,
-                    "Hour": 3600.0,
-                    "Day": 86400.0,
-                    "Week": 604800.0,
-                    "Month": 2.628e6,
-                    "Year": 3.154e7
-                }
-            },
-            "Power": {
-                "base_unit": "watt",
-                "units": {
-                    "Watt": 1.0,
-                    "Kilowatt": 1000.0,
-                    "Horsepower": 745.7,
-                    "BTU per Hour": 0.293071,
-                    "Calorie per Second": 4.184,
-                    "Foot-Pound per Second": 1.35582
-                }
-            },
-            "Data": {
-                "base_unit": "byte",
-                "units": {
-                    "Bit": 0.125,
-                    "Byte": 1.0,
-                    "Kilobyte": 1024.0,
-                    "Megabyte": 1.049e6,
-                    "Gigabyte": 1.074e9,
-                    "Terabyte": 1.1e12,
-                    "Petabyte": 1.126e15
-                }
-            },
-            "Pressure": {
-                "base_unit": "pascal",
-                "units": {
-                    "Pascal": 1.0,
-                    "Kilopascal": 1000.0,
-                    "Bar": 100000.0,
-                    "PSI": 6894.76,
-                    "Atmosphere": 101325.0,
-                    "Torr": 133.322,
-                    "mmHg": 133.322
-                }
-            },
-            "Angle": {
-                "base_unit": "radian",
-                "units": {
-                    "Degree": 0.0174533,
-                    "Radian": 1.0,
-                    "Gradian": 0.0157080,
-                    "Turn": 6.28319,
-                    "Arcminute": 0.000290888,
-                    "Arcsecond": 4.8481e-6
-                }
-            },
-            "Energy": {
-                "base_unit": "joule",
-                "units": {
-                    "Joule": 1.0,
-                    "Kilojoule": 1000.0,
-                    "Calorie": 4.184,
-                    "Kilocalorie": 4184.0,
-                    "BTU": 1055.06,
-                    "Watt Hour": 3600.0,
-                    "Kilowatt Hour": 3.6e6,
-                    "Electronvolt": 1.602e-19,
-                    "Foot-Pound": 1.35582
-                }
-            },
-            "Number Systems": {
-                "special": True,  # Special handling needed
-                "units": ["Binary", "Octal", "Decimal", "Hexadecimal"]
-            }
-            
-        }
+        # Adding conversion data types for all types (see conversions.py):
+        self.conversion_categories = build_categories(self.conversion_data, library.conversion_types)
 
-        page.setLayout(layout)
-        return page
+        # Built once; every search only looks at the units sharing trigrams with the query
+        self.unit_index = build_unit_index(self.conversion_data, library.conversion_types)
 
-    def open_conversion_calculator(self, item):
-        """Open the specific conversion calculator for the selected type"""
-        conversion_type = item.text()
+        if self.rate_store is not None:
+            self.conversion_categories["Currency"] = CurrencyCategory(self.rate_store)
+            self.unit_index.add("Currency")
+            for code in self.rate_store.currencies:
+                self.unit_index.add("Currency", code)
 
-        # Store the current conversion type as instance variable
-        self.current_conversion_type = conversion_type
+        page.setLayout(layout)
+        return page
 
-        # Create a new page for this specific conversion
-        conversion_page = self.create_specific_conversion_page(conversion_type)
+    def search_units(self, text):
+        """Show the units matching the search box, or all categories when it is empty"""
+        self.conversion_list.clear()
+        if not text.strip():
+            self.conversion_list.addItems(self.conversion_types)
+            return
 
-        # Add to stack if not already there
-        page_name = f"{conversion_type.lower().replace(' ', '_')}_page"
-        if not hasattr(self, page_name):
-            setattr(self, page_name, conversion_page)
-            self.page_layout.addWidget(conversion_page)
+        for result in self.unit_index.search(text, limit=10):
+            item = QListWidgetItem(result.label)
+            # Remember where the result points to, the label is only for display
+            item.setData(Qt.UserRole, (result.category, result.unit))
+            self.conversion_list.addItem(item)
 
-        # Switch to this conversion page
-        self.page_layout.setCurrentWidget(getattr(self, page_name))
+    def open_conversion_calculator(self, item):
+        """Open the shared converter page for the selected type (or search result)"""
+        target = item.data(Qt.UserRole)
+        category_name, unit = target if target else (item.text(), None)
+        category = self.conversion_categories[category_name]
+
+        # Store the current conversion category as instance variable
+        self.current_category = category
+
+        # Swap the category into the converter page instead of building a new page for it
+        self.converter_title.setText(f"{category.name} Conversion")
+
+        # One row per unit in the "All units" view; only their text changes while typing.
+        # Replaced first, changing the units below already triggers a conversion
+        self.converter_all_units.clear()
+        self.converter_all_units.addItems(category.units)
+
+        # The old value means nothing in the new units
+        self.converter_from_value.clear()
+        self.converter_to_value.clear()
+
+        # Block signals while the units are replaced so we don't convert half-updated units
+        for combo in (self.converter_from_unit, self.converter_to_unit):
+            combo.blockSignals(True)
+            combo.clear()
+            combo.addItems(category.units)
+            combo.blockSignals(False)
+
+        # Set different defaults
+        if len(category.units) > 1:
+            self.converter_to_unit.setCurrentIndex(1)
+
+        # A unit picked from the search results becomes the unit to convert from
+        if unit is not None:
+            self.converter_from_unit.blockSignals(True)
+            self.converter_from_unit.setCurrentText(unit)
+            self.converter_from_unit.blockSignals(False)
+            if unit == self.converter_to_unit.currentText():
+                self.converter_to_unit.setCurrentIndex(0)
+
+        # Only currencies have a date; leaving it empty uses the latest rates
+        is_currency = isinstance(category, CurrencyCategory)
+        self.converter_date.setVisible(is_currency)
+        if is_currency:
+            self.converter_date.setToolTip(f"Rates from {self.rate_store.first_date()} "
+                                           f"to {self.rate_store.last_date()}, empty for the latest")
+
+        # Switch to the converter page
+        self.page_layout.setCurrentWidget(self.converter_page)
         self.mode_label.setText("Conversions")
-        # Re-apply the current theme to ensure newly shown conversion page widgets get styled
-        self.change_theme(self.current_theme)
 
-    def create_specific_conversion_page(self, conversion_type):
-        """Create a specific conversion calculator page"""
+    def create_converter_page(self):
+        """Create the converter page that is shared by every conversion type"""
         page = QWidget()
         layout = QVBoxLayout()
 
         # Back button
         back_layout = QHBoxLayout()
         back_button = QPushButton("← Back to Conversions")
-        if self.current_theme == 'dark':
-            back_button.setStyleSheet("font-size: 16px;"
-                                      'font-family: "Segoe UI", -apple-system, Roboto, sans-serif;')
-        if self.current_theme == 'light':
-            back_button.setStyleSheet("font-size: 16px;"
-                                      'font-family: "Segoe UI", -apple-system, Roboto, sans-serif;')
-        if self.current_theme == 'ocean':
-            back_button.setStyleSheet("font-size: 16px;"
-                                      'font-family: "Segoe UI", -apple-system, Roboto, sans-serif;')
-        if self.current_theme == 'forest':
-            back_button.setStyleSheet("font-size: 16px;"
-                                      'font-family: "Segoe UI", -apple-system, Roboto, sans-serif;')
-        if self.current_theme == 'sunset':
-            back_button.setStyleSheet("font-size: 16px;"
-                                      'font-family: "Segoe UI", -apple-system, Roboto, sans-serif;')
-
-        # No parameters needed - uses instance variable approach
+        back_button.setStyleSheet("font-size: 16px;"
+                                  'font-family: "Segoe UI", -apple-system, Roboto, sans-serif;')
+
         back_button.clicked.connect(self.go_back_to_conversions)
         back_layout.addWidget(back_button)
         back_layout.addStretch()
         layout.addLayout(back_layout)
 
-        # Creating a title based on the selected conversion type:
-        title = QLabel(f"{conversion_type} Conversion")
-        title.setStyleSheet("font-size: 25px;"
-                            'font-family: "Segoe UI", -apple-system, Roboto, sans-serif;'
-                            "font-weight: bold;"
-                            "padding: 15px;")
-        title.setAlignment(Qt.AlignCenter)
-        layout.addWidget(title)
+        # Creating a title (the text is set when a conversion type is selected):
+        self.converter_title = QLabel()
+        self.converter_title.setStyleSheet("font-size: 25px;"
+                                           'font-family: "Segoe UI", -apple-system, Roboto, sans-serif;'
+                                           "font-weight: bold;"
+                                           "padding: 15px;")
+        self.converter_title.setAlignment(Qt.AlignCenter)
+        layout.addWidget(self.converter_title)
 
-        # Fixed: Creating a proper VBoxLayout for conversions
         conversion_layout = QVBoxLayout()
 
         # Creating the 'From' part:
         from_layout = QHBoxLayout()
 
-        from_value = QLineEdit()
-        from_value.setFixedHeight(45)
-        from_value.setObjectName("conversion_input")
-        from_value.setPlaceholderText("Enter value")
+        self.converter_from_value = QLineEdit()
+        self.converter_from_value.setFixedHeight(45)
+        self.converter_from_value.setObjectName("conversion_input")
+        self.converter_from_value.setPlaceholderText("Enter value")
 
-        from_unit = QComboBox()
-        from_unit.setFixedWidth(125)
-        from_unit.setObjectName("conversion_combo")
+        self.converter_from_unit = QComboBox()
+        self.converter_from_unit.setFixedWidth(125)
+        self.converter_from_unit.setObjectName("conversion_combo")
 
         from_label = QLabel("From:")
         from_label.setStyleSheet("font-size: 16px;"
@@ -2976,20 +4091,20 @@ class Calculator(QMainWindow):
         from_label.setFixedWidth(50)
 
         from_layout.addWidget(from_label)
-        from_layout.addWidget(from_value)
-        from_layout.addWidget(from_unit)
+        from_layout.addWidget(self.converter_from_value)
+        from_layout.addWidget(self.converter_from_unit)
         conversion_layout.addLayout(from_layout)
 
         # Creating the 'To' part:
         to_layout = QHBoxLayout()
-        to_value = QLineEdit()
-        to_value.setFixedHeight(45)
-        to_value.setObjectName("conversion_result")
-        to_value.setReadOnly(True)  # Result field should be read-only
+        self.converter_to_value = QLineEdit()
+        self.converter_to_value.setFixedHeight(45)
+        self.converter_to_value.setObjectName("conversion_result")
+        self.converter_to_value.setReadOnly(True)  # Result field should be read-only
 
-        to_unit = QComboBox()
-        to_unit.setFixedWidth(125)
-        to_unit.setObjectName("conversion_combo")
+        self.converter_to_unit = QComboBox()
+        self.converter_to_unit.setFixedWidth(125)
+        self.converter_to_unit.setObjectName("conversion_combo")
 
         to_label = QLabel("To:")
         to_label.setStyleSheet("font-size: 16px;"
@@ -2997,23 +4112,54 @@ class Calculator(QMainWindow):
         to_label.setFixedWidth(50)
 
         to_layout.addWidget(to_label)
-
-        to_layout.addWidget(to_value)
-        to_layout.addWidget(to_unit)
+        to_layout.addWidget(self.converter_to_value)
+        to_layout.addWidget(self.converter_to_unit)
         conversion_layout.addLayout(to_layout)
 
         # Add the conversion layout to main layout
         layout.addLayout(conversion_layout)
 
-        layout.addSpacing(0)
-
-        # NUMPAD SECTION
+        options_layout = QHBoxLayout()
+
+        # "All units" view: shows the input converted into every unit of the category at once
+        self.all_units_button = QPushButton("Show all units")
+        self.all_units_button.setCheckable(True)
+        self.all_units_button.setStyleSheet("font-size: 16px;"
+                                            'font-family: "Segoe UI", -apple-system, Roboto, sans-serif;')
+        self.all_units_button.toggled.connect(self.toggle_all_units)
+        options_layout.addWidget(self.all_units_button)
+
+        # High precision converts with exact fractions instead of floats
+        self.converter_precision = QComboBox()
+        self.converter_precision.setObjectName("conversion_combo")
+        self.converter_precision.addItems(["Standard", "High precision"])
+        self.converter_precision.setToolTip("High precision converts exactly and shows up to 30 significant digits")
+        self.converter_precision.currentTextChanged.connect(self.schedule_conversion)
+        options_layout.addWidget(self.converter_precision)
+
+        # Currencies can be converted with the rates of any past day (only shown for Currency)
+        self.converter_date = QLineEdit()
+        self.converter_date.setPlaceholderText("Date (YYYY-MM-DD)")
+        self.converter_date.setStyleSheet("font-size: 16px;"
+                                          'font-family: "Segoe UI", -apple-system, Roboto, sans-serif;')
+        self.converter_date.textChanged.connect(self.schedule_conversion)
+        self.converter_date.hide()
+        options_layout.addWidget(self.converter_date)
+
+        layout.addLayout(options_layout)
+
+        self.converter_all_units = QListWidget()
+        self.converter_all_units.setObjectName("conversion_all_units")
+        self.converter_all_units.setStyleSheet('font-size: 16px; font-family: "SF Mono", "Segoe UI", Consolas, monospace;')
+        self.converter_all_units.hide()
+        layout.addWidget(self.converter_all_units)
+
+        # NUMPAD SECTION (only one numpad exists no matter how many categories there are)
         numpad_widget = QWidget()
         numpad_layout = QGridLayout()
 
-        numpad_layout.setHorizontalSpacing(0)  
-        numpad_layout.setVerticalSpacing(10)   
-
+        numpad_layout.setHorizontalSpacing(0)
+        numpad_layout.setVerticalSpacing(10)
 
         # Define numpad buttons
         numpad_buttons = [
@@ -3024,8 +4170,6 @@ class Calculator(QMainWindow):
             ['.', '0', '00']
         ]
 
-        self.num_buttons = []
-
         # Create numpad buttons
         for row, button_row in enumerate(numpad_buttons):
             for col, button_text in enumerate(button_row):
@@ -3035,7 +4179,8 @@ class Calculator(QMainWindow):
 
                 self.numpad_buttons.append(button)
                 # Connect button clicks using lambda
-                button.clicked.connect(lambda checked, text=button_text: self.handle_numpad_input(text, from_value))
+                button.clicked.connect(lambda checked, text=button_text:
+                                       self.handle_numpad_input(text, self.converter_from_value))
                 numpad_layout.addWidget(button, row, col)
 
                 numpad_layout.setColumnStretch(col, 0)
@@ -3044,25 +4189,19 @@ class Calculator(QMainWindow):
         numpad_widget.setLayout(numpad_layout)
         layout.addWidget(numpad_widget)
 
-        # Store references for this conversion type
-        setattr(self, f"{conversion_type.lower().replace(' ', '_')}_from_value", from_value)
-        setattr(self, f"{conversion_type.lower().replace(' ', '_')}_to_value", to_value)
-        setattr(self, f"{conversion_type.lower().replace(' ', '_')}_from_unit", from_unit)
-        setattr(self, f"{conversion_type.lower().replace(' ', '_')}_to_unit", to_unit)
+        # Pasting text or switching category fires several of these signals at once;
+        # they only schedule a conversion, which then runs once on the next frame
+        self.conversion_timer = QTimer(self)
+        self.conversion_timer.setSingleShot(True)
+        self.conversion_timer.setInterval(16)  # ~1 frame at 60 Hz
+        self.conversion_timer.timeout.connect(self.perform_current_conversion)
 
-        # Setup units for the dropdowns
-        self.setup_conversion_units(conversion_type, from_unit, to_unit)
-
-        # Connect to parameterless methods using instance variables
-        from_value.textChanged.connect(self.perform_current_conversion)
-        from_unit.currentTextChanged.connect(self.perform_current_conversion)
-        to_unit.currentTextChanged.connect(self.perform_current_conversion)
+        self.converter_from_value.textChanged.connect(self.schedule_conversion)
+        self.converter_from_unit.currentTextChanged.connect(self.schedule_conversion)
+        self.converter_to_unit.currentTextChanged.connect(self.schedule_conversion)
 
         layout.addStretch()
         page.setLayout(layout)
-
-        # Apply the currently selected theme so conversion widgets get the correct styles
-        self.change_theme(self.current_theme)
         return page
 
     def handle_numpad_input(self, button_text, target_field):
@@ -3086,10 +4225,16 @@ class Calculator(QMainWindow):
                 return  # Prevent multiple decimal points
             target_field.setText(current_text + button_text)
 
+    def schedule_conversion(self):
+        """Convert on the next frame; changes made before then are converted together"""
+        # Not restarted when it's already running, so typing fast still updates every frame
+        if not self.conversion_timer.isActive():
+            self.conversion_timer.start()
+
     def perform_current_conversion(self):
-        """Perform conversion using the stored current_conversion_type"""
-        if hasattr(self, 'current_conversion_type'):
-            self.perform_specific_conversion(self.current_conversion_type)
+        """Perform conversion using the stored current_category"""
+        if hasattr(self, 'current_category'):
+            self.perform_specific_conversion(self.current_category)
 
     def go_back_to_conversions(self):
         """Return to the main conversions list"""
@@ -3099,132 +4244,62 @@ class Calculator(QMainWindow):
         self.history_button.show()
         self.theme_button.show()
 
-    def setup_conversion_units(self, conversion_type, from_combo, to_combo):
-        """Setup the units for a specific conversion type"""
-        
-        if conversion_type in self.conversion_data:
-            # Handle special conversion types (Temperature and Number Systems)
-            if self.conversion_data[conversion_type].get("special"):
-                units = self.conversion_data[conversion_type]["units"]
-                from_combo.addItems(units)
-                to_combo.addItems(units)
-                # Set different defaults
-                if len(units) > 1:
-                    to_combo.setCurrentIndex(1)
-            else:
-                # Handle normal conversion types (Length, Weight, Volume, etc.)
-                units = list(self.conversion_data[conversion_type]["units"].keys())
-                from_combo.addItems(units)
-                to_combo.addItems(units)
-                # Set different defaults
-                if len(units) > 1:
-                    to_combo.setCurrentIndex(1)
-
-    def perform_specific_conversion(self, conversion_type):
-        """Perform conversion for a specific type"""
-        try:
-            # Get the widgets for this conversion type
-            attr_base = conversion_type.lower().replace(' ', '_')
-            from_value = getattr(self, f"{attr_base}_from_value")
-            to_value = getattr(self, f"{attr_base}_to_value")
-            from_unit = getattr(self, f"{attr_base}_from_unit")
-            to_unit = getattr(self, f"{attr_base}_to_unit")
-
-            input_text = from_value.text().strip()
-            if not input_text:
-                to_value.clear()
-                return
-
-            from_unit_name = from_unit.currentText()
-            to_unit_name = to_unit.currentText()
-
-            if conversion_type == "Number Systems":
-                result = self.convert_number_systems(input_text, from_unit_name, to_unit_name)
-                to_value.setText(result)
-                return
-
-            # For all other conversions, convert to float
-            value = float(input_text)
+    def perform_specific_conversion(self, category):
+        """Perform conversion for a specific category"""
+        if isinstance(category, CurrencyCategory):
+            category.date = self.converter_date.text().strip() or None
 
-            # Perform conversion
-            if conversion_type == "Temperature":
-                result = self.convert_temperature(value, from_unit_name, to_unit_name)
-            else:
-                # Standard conversion
-                units_data = self.conversion_data[conversion_type]["units"]
-                from_factor = units_data[from_unit_name]
-                to_factor = units_data[to_unit_name]
-
-                # Convert to base unit, then to target unit
-                base_value = value * from_factor
-                result = base_value / to_factor
+        input_text = self.converter_from_value.text().strip()
+        if not input_text:
+            self.converter_to_value.clear()
+            self.update_all_units(category, None)
+            return
 
-            # Display result
-            result_text = self.format_result(result)
-            to_value.setText(result_text)
+        try:
+            result_text = category.convert_text(input_text,
+                                                self.converter_from_unit.currentText(),
+                                                self.converter_to_unit.currentText(),
+                                                exact=self.high_precision())
+            self.converter_to_value.setText(result_text)
+            self.update_all_units(category, input_text)
 
         except ValueError:
-            to_value.setText("Invalid input")
+            self.converter_to_value.setText("Invalid input")
+            self.update_all_units(category, None)
         except Exception:
-            to_value.setText("Error")
+            self.converter_to_value.setText("Error")
+            self.update_all_units(category, None)
+
+    def toggle_all_units(self, checked):
+        """Show or hide the list with the value converted into every unit"""
+        self.converter_all_units.setVisible(checked)
+        self.all_units_button.setText("Hide all units" if checked else "Show all units")
+        self.perform_current_conversion()
+
+    def update_all_units(self, category, input_text):
+        """Fill the "All units" view (only while it is visible)"""
+        if not self.converter_all_units.isVisible():
+            return
 
-    def convert_number_systems(self, value, from_unit, to_unit):
-        """Handle number system conversions"""
-        if from_unit == to_unit:
-            return value
+        if input_text is None:
+            # Nothing valid to convert, just show the unit names
+            for row, unit in enumerate(category.units):
+                self.converter_all_units.item(row).setText(unit)
+            return
 
-        try:
-            # Convert to decimal first
-            if from_unit == "Binary":
-                decimal = int(value, 2)
-            elif from_unit == "Octal":
-                decimal = int(value, 8)
-            elif from_unit == "Decimal":
-                decimal = int(value)
-            elif from_unit == "Hexadecimal":
-                decimal = int(value, 16)
-            else:
-                return "Error"
-
-            # Convert from decimal to target
-            if to_unit == "Binary":
-                return bin(decimal)[2:]  # Remove '0b' prefix
-            elif to_unit == "Octal":
-                return oct(decimal)[2:]  # Remove '0o' prefix
-            elif to_unit == "Decimal":
-                return str(decimal)
-            elif to_unit == "Hexadecimal":
-                return hex(decimal)[2:].upper()  # Remove '0x' prefix and uppercase
-            else:
-                return "Error"
+        if self.high_precision() and category.exact:
+            value, formatter = Fraction(input_text), format_exact
+        else:
+            value, formatter = category.parse(input_text), category.formatter
 
-        except ValueError:
-            return "Invalid input"
-
-    def convert_temperature(self, value, from_unit, to_unit):
-        """Handle temperature conversions"""
-        if from_unit == to_unit:
-            return value
-
-        # Convert to Celsius first
-        if from_unit == "Fahrenheit":
-            celsius = (value - 32) * 5 / 9
-        elif from_unit == "Kelvin":
-            celsius = value - 273.15
-        elif from_unit == "Rankine":
-            celsius = (value - 491.67) * 5 / 9
-        else:  # Celsius
-            celsius = value
-
-        # Convert from Celsius to target
-        if to_unit == "Fahrenheit":
-            return celsius * 9 / 5 + 32
-        elif to_unit == "Kelvin":
-            return celsius + 273.15
-        elif to_unit == "Rankine":
-            return celsius * 9 / 5 + 491.67
-        else:  # Celsius
-            return celsius
+        # Every unit is converted in a single pass over the category's ratio row
+        values = category.convert_to_all(value, self.converter_from_unit.currentText())
+        for row, (unit, value) in enumerate(zip(category.units, values)):
+            self.converter_all_units.item(row).setText(f"{formatter(value)} {unit}")
+
+    def high_precision(self):
+        """True if the converter should use exact fractions"""
+        return self.converter_precision.currentText() == "High precision"
 
 def main():
     app = QApplication(sys.argv)
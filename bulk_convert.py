@@ -0,0 +1,284 @@
+"""
+Command line tool for converting whole files of values with the calculator's unit data.
+
+Examples:
+    python bulk_convert.py Temperature Fahrenheit Celsius sensors.csv --column temp -o sensors_celsius.csv
+    python bulk_convert.py "Number Systems" Decimal Hexadecimal ids.csv --column 0 --no-header --in-place
+    python bulk_convert.py Data Byte Megabyte sizes.npy -o sizes_mb.npy
+    python bulk_convert.py Length Mile Kilometer distances.f64 --dtype float64 --in-place
+    python bulk_convert.py Currency USD EUR invoices.csv --column amount --date-column date -o invoices_eur.csv
+
+CSV files are streamed a chunk of rows at a time. .npy files and raw binary
+arrays are memory mapped, so files larger than RAM can be converted.
+"""
+
+import argparse
+import csv
+import math
+import os
+import sys
+import tempfile
+from itertools import islice
+
+from conversions import affine_coefficients, apply_affine, build_categories, np
+from currency import CurrencyCategory, day_number, open_rate_store
+from unit_packs import load_unit_packs
+
+DEFAULT_CHUNK_SIZE = 1 << 16  # rows (CSV) or values (arrays) converted at a time
+
+
+def find_name(name, options, what):
+    """Match a category/unit name without caring about upper or lower case"""
+    for option in options:
+        if option.lower() == name.lower():
+            return option
+    raise ValueError(f"Unknown {what} '{name}'. Choose from: {', '.join(options)}")
+
+
+def coefficients(category, from_unit, to_unit):
+    """(scale, offset) of a conversion; currencies use the rates of category.date"""
+    if isinstance(category, CurrencyCategory):
+        return category.store.rate(from_unit, to_unit, category.date), 0.0
+    return affine_coefficients(category, from_unit, to_unit)
+
+
+def positive_int(text):
+    """argparse type for counts that have to be at least 1"""
+    value = int(text)
+    if value < 1:
+        raise argparse.ArgumentTypeError(f"has to be at least 1, not {value}")
+    return value
+
+
+def check_chunk_size(chunk_size):
+    if chunk_size < 1:
+        raise ValueError(f"The chunk size has to be at least 1, not {chunk_size}")
+
+
+def find_column(column, header):
+    """Index of a column given by its name in the header or by its number (from 0)"""
+    if column in header:
+        return header.index(column)
+    try:
+        index = int(column)
+    except ValueError:
+        raise ValueError(f"There is no column '{column}'")
+    if index < 0:
+        raise ValueError("Columns are numbered from 0")
+    if header and index >= len(header):
+        raise ValueError(f"There is no column {index}, the file has {len(header)} columns (numbered from 0)")
+    return index
+
+
+def convert_csv(category, from_unit, to_unit, source, destination, column, has_header=True,
+                chunk_size=DEFAULT_CHUNK_SIZE, date_column=None):
+    """
+    Convert one column of a CSV file, chunk by chunk.
+    Returns (converted, skipped) where skipped counts cells that couldn't be converted.
+    With a date column (currencies only) every row is converted with the rates of its own date.
+    """
+    check_chunk_size(chunk_size)
+    converted = skipped = 0
+    by_text = not category.exact and not isinstance(category, CurrencyCategory)
+
+    if date_column is None and not by_text:
+        scale, offset = coefficients(category, from_unit, to_unit)
+
+    check_destination(source, destination)
+    with open(source, newline="") as infile:
+        reader = csv.reader(infile)
+        header = next(reader, []) if has_header else []
+        index = find_column(column, header)
+        date_index = find_column(date_column, header) if date_column is not None else None
+
+        # The output is only created once the input turned out to be usable
+        with open(destination, "w", newline="") as outfile:
+            writer = csv.writer(outfile)
+            if has_header:
+                writer.writerow(header)
+
+            while True:
+                rows = list(islice(reader, chunk_size))
+                if not rows:
+                    break
+
+                # Find the cells in this chunk that can be converted
+                positions, values, days = [], [], []
+                for position, row in enumerate(rows):
+                    if index >= len(row) or not row[index].strip():
+                        continue  # Missing / empty cells are left as they are
+                    text = row[index].strip()
+
+                    if by_text:
+                        # Number Systems: digits are converted as text
+                        result = category.convert_text(text, from_unit, to_unit)
+                        if result == "Invalid input":
+                            skipped += 1
+                        else:
+                            row[index] = result
+                            converted += 1
+                        continue
+
+                    try:
+                        value = float(text)
+                        if date_index is not None:
+                            days.append(day_number(row[date_index]))
+                        values.append(value)
+                        positions.append(position)
+                    except (ValueError, IndexError):
+                        skipped += 1
+
+                if values and date_index is not None:
+                    # One vectorized lookup of every row's rates (by binary search on the dates)
+                    results = category.store.convert_many(values, days, from_unit, to_unit)
+                    for position, result in zip(positions, results):
+                        if math.isnan(result):
+                            skipped += 1  # No rate on that date
+                        else:
+                            rows[position][index] = repr(float(result))
+                            converted += 1
+
+                elif values:
+                    if np is not None:
+                        results = (np.array(values) * scale + offset).tolist()
+                    else:
+                        results = [value * scale + offset for value in values]
+
+                    for position, result in zip(positions, results):
+                        rows[position][index] = repr(result)
+                    converted += len(values)
+
+                writer.writerows(rows)
+
+    return converted, skipped
+
+
+def check_destination(source, destination):
+    """Writing to the file being read would wipe it before it is read"""
+    if os.path.exists(destination) and os.path.samefile(source, destination):
+        raise ValueError("The output file is the input file, use --in-place to convert it in place")
+
+
+def open_array(path, dtype, mode):
+    """Memory map a .npy file or a raw binary file of numbers"""
+    if path.endswith(".npy"):
+        return np.load(path, mmap_mode=mode)
+    return np.memmap(path, dtype=dtype, mode=mode)
+
+
+def convert_array_file(category, from_unit, to_unit, source, destination=None, dtype="float64",
+                       chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Convert a .npy / raw binary array of numbers through a memory map.
+    With no destination the file is converted in place. Returns the number of values converted.
+    """
+    if np is None:
+        raise RuntimeError("NumPy is needed to convert .npy and binary files (pip install numpy)")
+    check_chunk_size(chunk_size)
+
+    scale, offset = coefficients(category, from_unit, to_unit)
+
+    if destination is None:
+        data = open_array(source, dtype, "r+")
+        if not np.issubdtype(data.dtype, np.floating):
+            raise ValueError(f"Can't convert {data.dtype} values in place, write to a new file instead")
+        target = data
+    else:
+        check_destination(source, destination)
+        data = open_array(source, dtype, "r")
+        # Integer input gets a float output, float input keeps its precision
+        out_dtype = data.dtype if np.issubdtype(data.dtype, np.floating) else np.float64
+        if destination.endswith(".npy"):
+            target = np.lib.format.open_memmap(destination, mode="w+", dtype=out_dtype, shape=data.shape)
+        else:
+            target = np.memmap(destination, dtype=out_dtype, mode="w+", shape=data.shape)
+
+    # Only one block at a time is ever paged in
+    apply_affine(data, scale, offset, out=target, block_size=chunk_size)
+
+    target.flush()
+    return data.size
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert every value in a CSV, .npy or binary file.")
+    parser.add_argument("category", help="Conversion type, e.g. Length or Temperature")
+    parser.add_argument("from_unit", help="Unit the values are in")
+    parser.add_argument("to_unit", help="Unit to convert the values into")
+    parser.add_argument("file", help="CSV, .npy or raw binary file")
+    parser.add_argument("-o", "--output", help="File to write the converted values to")
+    parser.add_argument("--in-place", action="store_true", help="Overwrite the input file")
+    parser.add_argument("--column", default="0", help="CSV column name or index (default: 0)")
+    parser.add_argument("--no-header", action="store_true", help="The CSV file has no header row")
+    parser.add_argument("--dtype", default="float64", help="Number type of raw binary files (default: float64)")
+    parser.add_argument("--date", help="Currency only: use the rates of this day (YYYY-MM-DD)")
+    parser.add_argument("--date-column", help="Currency only: CSV column with the date of every row")
+    parser.add_argument("--chunk-size", type=positive_int, default=DEFAULT_CHUNK_SIZE, help="Rows/values per chunk")
+    args = parser.parse_args(argv)
+
+    if args.in_place == bool(args.output):
+        parser.error("Give either --output or --in-place")
+
+    # Units from the user's unit packs can be converted too
+    library, pack_errors = load_unit_packs()
+    for error in pack_errors:
+        print(f"Skipped unit pack {error}", file=sys.stderr)
+    categories = build_categories(library.conversion_data, library.conversion_types)
+    conversion_types = library.conversion_types
+
+    # Currencies need a rates file (see currency.py)
+    try:
+        rate_store = open_rate_store()
+    except (OSError, ValueError) as error:
+        print(f"Can't read the currency rates: {error}", file=sys.stderr)
+        rate_store = None
+    if rate_store is not None:
+        categories["Currency"] = CurrencyCategory(rate_store)
+        conversion_types = conversion_types + ["Currency"]
+
+    try:
+        category = categories[find_name(args.category, conversion_types, "conversion type")]
+        if isinstance(category, CurrencyCategory):
+            category.date = args.date
+        elif args.date or args.date_column:
+            raise ValueError("--date and --date-column only work for currencies")
+        from_unit = find_name(args.from_unit, category.units, "unit")
+        to_unit = find_name(args.to_unit, category.units, "unit")
+
+        if args.file.lower().endswith(".csv"):
+            # CSV files can't be rewritten while reading, so in place means "write a copy, then swap"
+            destination = args.output
+            if args.in_place:
+                handle, destination = tempfile.mkstemp(suffix=".csv", dir=os.path.dirname(os.path.abspath(args.file)))
+                os.close(handle)
+
+            try:
+                converted, skipped = convert_csv(category, from_unit, to_unit, args.file, destination, args.column,
+                                                 has_header=not args.no_header, chunk_size=args.chunk_size,
+                                                 date_column=args.date_column)
+            except BaseException:
+                if args.in_place:
+                    os.remove(destination)
+                raise
+
+            if args.in_place:
+                os.replace(destination, args.file)
+            print(f"Converted {converted} values ({skipped} skipped)")
+
+        else:
+            if args.date_column:
+                raise ValueError("--date-column only works for CSV files")
+            converted = convert_array_file(category, from_unit, to_unit, args.file,
+                                           None if args.in_place else args.output,
+                                           dtype=args.dtype, chunk_size=args.chunk_size)
+            print(f"Converted {converted} values")
+
+    except (ValueError, RuntimeError, OSError) as error:
+        print(f"Error: {error}", file=sys.stderr)
+        return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
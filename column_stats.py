@@ -0,0 +1,247 @@
+"""
+Summary statistics of a column of numbers, for the Statistics page.
+
+    summary = Summary()
+    for chunk in read_column("measurements.csv", "temperature"):
+        summary.add(chunk)
+    summary.mean, summary.stddev(), summary.histogram()
+
+The numbers are read a chunk at a time (.npy and raw float files are memory
+mapped, text and CSV files are streamed) and every chunk is folded into the
+summary in one pass, so a file of many gigabytes is summarised with the
+memory of a single chunk:
+
+- the mean and variance are merged chunk by chunk with Welford's update in
+  the form of Chan et al., which doesn't lose precision like sum(x²) - n·mean²;
+- within a chunk NumPy adds pairwise, and the chunk sums are added with
+  Neumaier's compensation, so the sum doesn't drift over billions of values;
+- the histogram keeps HISTOGRAM_BINS bins and doubles their width (merging
+  neighbours) whenever a value falls outside, so it needs neither the range
+  in advance nor a second pass.
+
+Cells that aren't numbers, NaN and ±inf are counted as skipped.
+Works without NumPy too (slower, and .npy files can't be read).
+"""
+
+import csv
+import math
+import os
+import sys
+from itertools import islice
+
+from bulk_convert import find_column
+from conversions import np
+
+CHUNK_SIZE = 1 << 16   # values read and added at a time
+HISTOGRAM_BINS = 128   # has to be even, so neighbouring bins can be merged in pairs
+RAW_DTYPES = {".f64": "float64", ".f32": "float32"}  # Files of bare numbers in machine format
+DATA_FILE_FILTER = "Data files (*.csv *.tsv *.txt *.npy *.f64 *.f32)"
+
+
+class Summary:
+    """Count, mean, variance, min, max, sum and a histogram, updated a chunk at a time"""
+
+    def __init__(self, bins=HISTOGRAM_BINS):
+        self.count = 0
+        self.skipped = 0
+        self.mean = 0.0
+        self.m2 = 0.0            # Sum of squared differences from the mean
+        self.total = 0.0
+        self.compensation = 0.0  # What adding to `total` has rounded away
+        self.minimum = math.inf
+        self.maximum = -math.inf
+        self.bins = bins
+        self.counts = [0] * bins
+        self.low = None          # Left edge of the first bin
+        self.width = None
+
+    def add(self, values):
+        """Add a chunk of numbers (a NumPy array or a list of floats)"""
+        if np is not None:
+            values = np.asarray(values, dtype=np.float64).ravel()
+            finite = values[np.isfinite(values)]
+            self.skipped += len(values) - len(finite)
+            if not len(finite):
+                return
+            count = len(finite)
+            # Values near ±1e308 overflow to an infinite sum or variance, as they do without NumPy
+            with np.errstate(over="ignore", invalid="ignore"):
+                total = float(np.sum(finite))  # NumPy sums pairwise
+                mean = total / count
+                deviations = finite - mean
+                m2 = float(np.dot(deviations, deviations))
+            minimum, maximum = float(finite.min()), float(finite.max())
+        else:
+            finite = [value for value in values if math.isfinite(value)]
+            self.skipped += len(values) - len(finite)
+            if not finite:
+                return
+            count, total = len(finite), math.fsum(finite)
+            mean = total / count
+            m2 = math.fsum((value - mean) * (value - mean) for value in finite)
+            minimum, maximum = min(finite), max(finite)
+
+        # Merge the chunk's mean and squared deviations into the running ones
+        combined = self.count + count
+        delta = mean - self.mean
+        # (weighted rather than self.mean + delta * count / combined: delta overflows for means near ±1e308)
+        self.mean = self.mean * (self.count / combined) + mean * (count / combined)
+        self.m2 += m2 + delta * (self.count * count / combined) * delta  # (0, not inf · 0, for the first chunk)
+        self.count = combined
+        self.add_to_total(total)
+        self.minimum, self.maximum = min(self.minimum, minimum), max(self.maximum, maximum)
+        self.add_to_histogram(finite, minimum, maximum)
+
+    def add_to_total(self, value):
+        """Neumaier's compensated addition"""
+        total = self.total + value
+        if abs(self.total) >= abs(value):
+            self.compensation += (self.total - total) + value
+        else:
+            self.compensation += (value - total) + self.total
+        self.total = total
+
+    @property
+    def sum(self):
+        return self.total + self.compensation
+
+    def variance(self, sample=True):
+        """Sample variance (divided by n - 1), or the population variance (divided by n)"""
+        divisor = self.count - 1 if sample else self.count
+        return self.m2 / divisor if divisor > 0 else math.nan
+
+    def stddev(self, sample=True):
+        return math.sqrt(self.variance(sample))
+
+    def add_to_histogram(self, values, minimum, maximum):
+        if self.low is None:
+            # The first chunk sets the bins; later values outside of them make the bins wider
+            self.low = minimum
+            # (a hair wider than needed, so rounding doesn't leave the largest value out; divided
+            # before subtracting, as maximum - minimum overflows for values near ±1e308)
+            self.width = (maximum / self.bins - minimum / self.bins) * (1 + 1e-12) \
+                or max(abs(minimum) / self.bins, 1e-300)
+        while minimum < self.low:
+            self.widen(downwards=True)
+        while maximum >= self.low + self.width * self.bins:
+            self.widen(downwards=False)
+
+        # The bin of a value is value / width - low / width: value - low can overflow to inf, and
+        # the quotients that still do (inf, or NaN from inf - inf) are clamped to the first or last bin
+        low = self.low / self.width
+        if np is not None:
+            with np.errstate(over="ignore", invalid="ignore"):
+                positions = values / self.width - low
+            indexes = np.clip(np.nan_to_num(positions), 0, self.bins - 1).astype(np.int64)
+            counts = np.bincount(indexes, minlength=self.bins)
+            self.counts = [old + int(new) for old, new in zip(self.counts, counts)]
+        else:
+            for value in values:
+                position = value / self.width - low
+                self.counts[int(min(position, self.bins - 1)) if position > 0 else 0] += 1
+
+    def widen(self, downwards):
+        """Double the width of the bins, so they cover twice the range (extended down or up)"""
+        merged = [self.counts[index] + self.counts[index + 1] for index in range(0, self.bins, 2)]
+        empty = [0] * (self.bins // 2)
+        if downwards:
+            low = self.low - self.width * self.bins
+            # Past the largest float the bins can't reach any further down
+            self.low = low if math.isfinite(low) else -sys.float_info.max
+            self.counts = empty + merged
+        else:
+            self.counts = merged + empty
+        self.width *= 2
+
+    def histogram(self):
+        """(left edges, counts, width) of the bins from the first to the last that has values"""
+        used = [index for index, count in enumerate(self.counts) if count]
+        if not used:
+            return [], [], 0.0
+        first, last = used[0], used[-1]
+        edges = [self.low + self.width * index for index in range(first, last + 1)]
+        return edges, self.counts[first:last + 1], self.width
+
+
+def summarize(chunks):
+    """A Summary of every chunk"""
+    summary = Summary()
+    for chunk in chunks:
+        summary.add(chunk)
+    return summary
+
+
+def parse_numbers(text):
+    """Numbers typed or pasted: separated by spaces, new lines, commas or semicolons"""
+    cells = text.replace(",", " ").replace(";", " ").split()
+    return to_floats(cells)
+
+
+def to_floats(cells):
+    """Text cells as floats; NaN for the ones that aren't numbers, so they are counted as skipped"""
+    if np is not None:
+        try:
+            return np.array(cells, dtype=np.float64)
+        except ValueError:
+            pass
+    values = []
+    for cell in cells:
+        try:
+            values.append(float(cell))
+        except ValueError:
+            values.append(math.nan)
+    return np.array(values) if np is not None else values
+
+
+def read_column(path, column="0", chunk_size=CHUNK_SIZE):
+    """
+    Yield the numbers of a file a chunk at a time. `column` is a name or an index
+    for text files with several columns (a header row is found by its names).
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".npy" or extension in RAW_DTYPES:
+        if np is None:
+            raise RuntimeError("NumPy is needed to read .npy and binary files (pip install numpy)")
+        if extension == ".npy":
+            data = np.load(path, mmap_mode="r", allow_pickle=False)
+        else:
+            data = np.memmap(path, dtype=RAW_DTYPES[extension], mode="r")
+        if data.ndim == 2:
+            data = data[:, int(column)]
+        elif data.ndim != 1:
+            raise ValueError(f"Can't summarise an array with {data.ndim} dimensions")
+        # Only the chunk being added is paged in
+        for start in range(0, len(data), chunk_size):
+            yield data[start:start + chunk_size]
+        return
+
+    with open(path, newline="", encoding="utf-8") as file:
+        first_line = file.readline()
+        delimiter = next((character for character in ",\t;" if character in first_line), None)
+        file.seek(0)
+        if delimiter is not None:
+            rows = csv.reader(file, delimiter=delimiter)
+        else:
+            rows = (line.split() for line in file)
+        rows = (row for row in rows if row)
+
+        first = next(rows, None)
+        if first is None:
+            return
+        index = find_column(column, first)
+        header = column in first or not is_number(first[index])
+        pending = [] if header else [first]
+        while True:
+            chunk = pending + list(islice(rows, chunk_size))
+            pending = []
+            if not chunk:
+                return
+            yield to_floats([row[index] if index < len(row) else "" for row in chunk])
+
+
+def is_number(text):
+    try:
+        float(text)
+    except ValueError:
+        return False
+    return True
@@ -0,0 +1,198 @@
+"""
+Generate printable conversion tables as CSV, Markdown or HTML.
+
+Examples:
+    python conversion_tables.py Pressure PSI --to Bar Kilopascal Atmosphere --start 0 --stop 1000 --step 0.5 -o psi.md
+    python conversion_tables.py Temperature Celsius --start -40 --stop 100 --step 1 -o temperatures.html
+    python conversion_tables.py Length --matrix -o length.csv
+
+A range table is written a chunk of rows at a time: every column of a chunk is
+computed with one vectorized multiply-add and the chunk is turned into text
+with a single string formatting operation, so memory use doesn't depend on
+the number of rows. --jobs spreads the formatting over several processes.
+"""
+
+import argparse
+import csv
+import html
+import io
+import math
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from bulk_convert import find_name
+from conversions import affine_coefficients, build_categories, np
+from unit_packs import load_unit_packs
+
+CHUNK_ROWS = 1 << 16  # rows computed and formatted at a time
+TABLE_FORMATS = {".csv": "csv", ".md": "markdown", ".html": "html", ".htm": "html"}
+
+
+def row_template(table_format, columns, digits, label=False):
+    """%-format string for one row; label=True makes the first cell text instead of a number"""
+    number = f"%.{digits}g"
+    cells = (["%s"] if label else []) + [number] * (columns - label)
+    if table_format == "csv":
+        return ",".join(cells) + "\n"
+    if table_format == "markdown":
+        return "| " + " | ".join(cells) + " |\n"
+    return "<tr>" + "".join(f"<td>{cell}</td>" for cell in cells) + "</tr>\n"
+
+
+def table_header(table_format, names):
+    if table_format == "csv":
+        line = io.StringIO()
+        csv.writer(line, lineterminator="\n").writerow(names)
+        return line.getvalue()
+    if table_format == "markdown":
+        names = [name.replace("|", "\\|") for name in names]
+        return "| " + " | ".join(names) + " |\n|" + "---:|" * len(names) + "\n"
+    cells = "".join(f"<th>{html.escape(name)}</th>" for name in names)
+    return f"<table>\n<thead><tr>{cells}</tr></thead>\n<tbody>\n"
+
+
+def table_footer(table_format):
+    return "</tbody>\n</table>\n" if table_format == "html" else ""
+
+
+def row_count(start, stop, step):
+    """Number of rows from start to stop (inclusive) in steps of step"""
+    if step == 0 or (stop - start) / step < 0:
+        raise ValueError("The step has to go from the start towards the stop value")
+    # The small tolerance keeps stop itself when (stop - start) / step is 1999.9999999
+    return math.floor((stop - start) / step + 1e-9) + 1
+
+
+def render_rows(first, rows, start, step, coefficients, template):
+    """
+    Compute and format rows first .. first + rows - 1 of a range table.
+    Every row is computed from its index (not by adding up steps), so no rounding
+    error builds up and chunks can be rendered independently (in other processes).
+    """
+    if np is not None:
+        values = start + step * np.arange(first, first + rows, dtype=np.float64)
+        table = np.empty((rows, len(coefficients)))
+        for column, (scale, offset) in enumerate(coefficients):
+            np.multiply(values, scale, out=table[:, column])
+            if offset:
+                table[:, column] += offset
+        cells = table.ravel().tolist()
+    else:
+        cells = [value * scale + offset
+                 for value in (start + step * i for i in range(first, first + rows))
+                 for scale, offset in coefficients]
+
+    # One C-level formatting call for the whole chunk instead of one call per cell
+    return (template * rows) % tuple(cells)
+
+
+def write_range_table(out, category, from_unit, to_units, start, stop, step, table_format="csv",
+                      digits=10, jobs=1, chunk_rows=CHUNK_ROWS):
+    """Write a table of start..stop (in from_unit) converted into to_units. Returns the number of rows."""
+    coefficients = [(1.0, 0.0)] + [affine_coefficients(category, from_unit, unit) for unit in to_units]
+    template = row_template(table_format, len(coefficients), digits)
+    count = row_count(start, stop, step)
+    chunks = [(first, min(chunk_rows, count - first)) for first in range(0, count, chunk_rows)]
+
+    out.write(table_header(table_format, [from_unit, *to_units]))
+
+    if jobs <= 1:
+        for first, rows in chunks:
+            out.write(render_rows(first, rows, start, step, coefficients, template))
+    else:
+        with ProcessPoolExecutor(jobs) as executor:
+            # At most two chunks per process are waiting, so memory stays bounded
+            pending = deque()
+            for first, rows in chunks:
+                pending.append(executor.submit(render_rows, first, rows, start, step, coefficients, template))
+                if len(pending) >= 2 * jobs:
+                    out.write(pending.popleft().result())
+            while pending:
+                out.write(pending.popleft().result())
+
+    out.write(table_footer(table_format))
+    return count
+
+
+def write_unit_matrix(out, category, value=1, table_format="csv", digits=10):
+    """Write `value` of every unit converted into every other unit of the category"""
+    if not category.exact:
+        raise ValueError(f"{category.name} can't be written as a table of numbers")
+    template = row_template(table_format, len(category.units) + 1, digits, label=True)
+    out.write(table_header(table_format, [f"{value:g} of", *category.units]))
+    for unit in category.units:
+        label = unit
+        if table_format == "html":
+            label = html.escape(unit)
+        elif table_format == "markdown":
+            label = unit.replace("|", "\\|")  # Like the names in table_header()
+        cells = [label]
+        cells += [float(converted) for converted in category.convert_to_all(value, unit)]
+        out.write(template % tuple(cells))
+    out.write(table_footer(table_format))
+    return len(category.units)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate conversion tables as CSV, Markdown or HTML.")
+    parser.add_argument("category", help="Conversion type, e.g. Pressure")
+    parser.add_argument("from_unit", nargs="?", help="Unit of the first column (not needed with --matrix)")
+    parser.add_argument("--to", nargs="+", metavar="UNIT", help="Units of the other columns (default: all)")
+    parser.add_argument("--start", type=float, default=0.0)
+    parser.add_argument("--stop", type=float, default=100.0)
+    parser.add_argument("--step", type=float, default=1.0)
+    parser.add_argument("--matrix", action="store_true", help="Every unit against every other unit")
+    parser.add_argument("--value", type=float, default=1.0, help="Value converted in the --matrix table")
+    parser.add_argument("--format", choices=sorted(set(TABLE_FORMATS.values())),
+                        help="Output format (default: from the file name, else csv)")
+    parser.add_argument("--digits", type=int, default=10, help="Significant digits (default: 10)")
+    parser.add_argument("--jobs", type=int, default=1, help="Processes used to format the rows")
+    parser.add_argument("-o", "--output", help="File to write (default: print the table)")
+    args = parser.parse_args(argv)
+
+    table_format = args.format
+    if table_format is None and args.output:
+        extension = args.output[args.output.rfind("."):].lower() if "." in args.output else ""
+        table_format = TABLE_FORMATS.get(extension)
+    table_format = table_format or "csv"
+
+    library, pack_errors = load_unit_packs()
+    for error in pack_errors:
+        print(f"Skipped unit pack {error}", file=sys.stderr)
+    categories = build_categories(library.conversion_data, library.conversion_types)
+
+    try:
+        category = categories[find_name(args.category, library.conversion_types, "conversion type")]
+        if not category.exact:
+            raise ValueError(f"{category.name} can't be written as a table of numbers")
+        # Everything is checked before the output is opened, so a mistake doesn't empty an existing file
+        if not args.matrix:
+            if not args.from_unit:
+                raise ValueError("Give the unit of the first column, or use --matrix")
+            from_unit = find_name(args.from_unit, category.units, "unit")
+            to_units = [find_name(unit, category.units, "unit") for unit in args.to] if args.to \
+                else [unit for unit in category.units if unit != from_unit]
+            row_count(args.start, args.stop, args.step)
+
+        out = open(args.output, "w", newline="", encoding="utf-8") if args.output else sys.stdout
+        try:
+            if args.matrix:
+                rows = write_unit_matrix(out, category, args.value, table_format, args.digits)
+            else:
+                rows = write_range_table(out, category, from_unit, to_units, args.start, args.stop, args.step,
+                                         table_format, args.digits, args.jobs)
+        finally:
+            if out is not sys.stdout:
+                out.close()
+    except (ValueError, OSError) as error:
+        print(f"Error: {error}", file=sys.stderr)
+        return 1
+
+    if args.output:
+        print(f"Wrote {rows} rows to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,571 @@
+"""
+Unit conversion data and category models for the Conversions page.
+
+Nothing in here depends on Qt, so the same data and conversion functions
+can be reused by the GUI and by command line tools.
+"""
+
+from collections import OrderedDict
+from decimal import Decimal, localcontext
+from fractions import Fraction as F
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional, plain Python lists are used without it
+    np = None
+
+# Order in which the categories are listed on the Conversions page
+CONVERSION_TYPES = ["Length", "Weight and Mass", "Volume", "Temperature", "Temperature Difference", "Energy",
+                    "Area", "Speed", "Time", "Power", "Data", "Pressure", "Angle", "Number Systems"]
+
+# Exact definitions that several categories are built from
+PI = F("3.14159265358979323846264338327950288419716939937510")  # π to 50 decimals
+STANDARD_GRAVITY = F("9.80665")  # m/s²
+INCH = F("0.0254")  # m
+FOOT = F("0.3048")  # m
+POUND = F("0.45359237")  # kg
+FOOT_POUND = FOOT * POUND * STANDARD_GRAVITY  # J
+BTU = F("1055.05585262")  # International Table BTU in J
+CUBIC_INCH = (INCH * 10) ** 3  # in liters (1 liter = 1 dm³)
+US_GALLON = 231 * CUBIC_INCH  # in liters
+
+# Absolute temperatures: kelvin = value * scale + offset
+TEMPERATURE_SCALES = {
+    "Celsius": (F(1), F("273.15")),
+    "Fahrenheit": (F(5, 9), F("459.67") * F(5, 9)),
+    "Kelvin": (F(1), F(0)),
+    "Rankine": (F(5, 9), F(0)),
+    "Delisle": (F(-2, 3), F("373.15")),  # Counts down from the boiling point of water
+    "Newton": (F(100, 33), F("273.15")),
+    "Réaumur": (F(5, 4), F("273.15")),
+}
+
+# Conversion data for all types.
+# Linear categories store the exact factor (as a Fraction) that converts one unit into the base unit.
+CONVERSION_DATA = {
+    "Length": {
+        "base_unit": "meter",
+        "units": {
+            "Nanometer": F("1e-9"),
+            "Micrometer": F("1e-6"),
+            "Millimeter": F("0.001"),
+            "Centimeter": F("0.01"),
+            "Meter": F(1),
+            "Kilometer": F(1000),
+            "Inch": INCH,
+            "Foot": FOOT,
+            "Yard": 3 * FOOT,
+            "Mile": 5280 * FOOT,
+            "Nautical Mile": F(1852)
+        }
+    },
+    "Weight and Mass": {
+        "base_unit": "kilogram",
+        "units": {
+            "Microgram": F("1e-9"),
+            "Milligram": F("1e-6"),
+            "Gram": F("0.001"),
+            "Kilogram": F(1),
+            "Metric Ton": F(1000),
+            "Ounce": POUND / 16,
+            "Pound": POUND,
+            "Stone": 14 * POUND,
+            "Short Ton": 2000 * POUND,
+            "Long Ton": 2240 * POUND
+        }
+    },
+    "Temperature": {
+        "special": True,  # Special handling needed
+        "units": list(TEMPERATURE_SCALES)
+    },
+    "Temperature Difference": {
+        # A change of 1 °C is a change of 1 K, whatever the starting temperature
+        "base_unit": "kelvin",
+        "units": {name: scale for name, (scale, offset) in TEMPERATURE_SCALES.items()}
+    },
+    "Area": {
+        "base_unit": "square meter",
+        "units": {
+            "Square Millimeter": F("1e-6"),
+            "Square Centimeter": F("1e-4"),
+            "Square Meter": F(1),
+            "Hectare": F(10000),
+            "Square Kilometer": F(10 ** 6),
+            "Square Inch": INCH ** 2,
+            "Square Foot": FOOT ** 2,
+            "Square Yard": (3 * FOOT) ** 2,
+            "Acre": 43560 * FOOT ** 2,
+            "Square Mile": (5280 * FOOT) ** 2
+        }
+    },
+    "Volume": {
+        "base_unit": "liter",
+        "units": {
+            "Milliliter": F("0.001"),
+            "Liter": F(1),
+            "Cubic Centimeter": F("0.001"),
+            "Cubic Meter": F(1000),
+            "Fluid Ounce (US)": US_GALLON / 128,
+            "Cup (US)": US_GALLON / 16,
+            "Pint (US)": US_GALLON / 8,
+            "Quart (US)": US_GALLON / 4,
+            "Gallon (US)": US_GALLON,
+            "Cubic Inch": CUBIC_INCH,
+            "Cubic Foot": 1728 * CUBIC_INCH
+        }
+    },
+    "Speed": {
+        "base_unit": "meter per second",
+        "units": {
+            "Meter per Second": F(1),
+            "Kilometer per Hour": F(1000, 3600),
+            "Mile per Hour": 5280 * FOOT / 3600,
+            "Knot": F(1852, 3600),
+            "Foot per Second": FOOT,
+            "Mach": F(343)
+        }
+    },
+    "Time": {
+        "base_unit": "second",
+        "units": {
+            "Nanosecond": F("1e-9"),
+            "Microsecond": F("1e-6"),
+            "Millisecond": F("0.001"),
+            "Second": F(1),
+            "Minute": F(60),
+            "Hour": F(3600),
+            "Day": F(86400),
+            "Week": F(604800),
+            "Month": F(365 * 86400, 12),  # 1/12 of a 365 day year
+            "Year": F(365 * 86400)
+        }
+    },
+    "Power": {
+        "base_unit": "watt",
+        "units": {
+            "Watt": F(1),
+            "Kilowatt": F(1000),
+            "Horsepower": 550 * FOOT_POUND,  # Mechanical horsepower
+            "BTU per Hour": BTU / 3600,
+            "Calorie per Second": F("4.184"),
+            "Foot-Pound per Second": FOOT_POUND
+        }
+    },
+    "Data": {
+        "base_unit": "byte",
+        "units": {
+            "Bit": F(1, 8),
+            "Byte": F(1),
+            "Kilobyte": F(1024),
+            "Megabyte": F(1024 ** 2),
+            "Gigabyte": F(1024 ** 3),
+            "Terabyte": F(1024 ** 4),
+            "Petabyte": F(1024 ** 5)
+        }
+    },
+    "Pressure": {
+        "base_unit": "pascal",
+        "units": {
+            "Pascal": F(1),
+            "Kilopascal": F(1000),
+            "Bar": F(100000),
+            "PSI": POUND * STANDARD_GRAVITY / INCH ** 2,
+            "Atmosphere": F(101325),
+            "Torr": F(101325, 760),
+            "mmHg": F("133.322387415")
+        }
+    },
+    "Angle": {
+        "base_unit": "radian",
+        "units": {
+            "Degree": PI / 180,
+            "Radian": F(1),
+            "Gradian": PI / 200,
+            "Turn": 2 * PI,
+            "Arcminute": PI / (180 * 60),
+            "Arcsecond": PI / (180 * 3600)
+        }
+    },
+    "Energy": {
+        "base_unit": "joule",
+        "units": {
+            "Joule": F(1),
+            "Kilojoule": F(1000),
+            "Calorie": F("4.184"),
+            "Kilocalorie": F(4184),
+            "BTU": BTU,
+            "Watt Hour": F(3600),
+            "Kilowatt Hour": F(3600000),
+            "Electronvolt": F("1.602176634e-19"),
+            "Foot-Pound": FOOT_POUND
+        }
+    },
+    "Number Systems": {
+        "special": True,  # Special handling needed
+        "units": ["Binary", "Octal", "Decimal", "Hexadecimal"]
+    }
+}
+
+
+def format_result(value):
+    """
+    Format calculation results:
+    - If the number is an integer (like 16.0), drop the .0
+    - Otherwise, show up to 10 decimal places (strip trailing zeros)
+    """
+    try:
+        # Convert to float to handle both strings and floats
+        value = float(value)
+
+        # Check if it's effectively an integer (16.0 → 16)
+        if value == int(value):
+            return str(int(value))
+        else:
+            # Format to 10 decimal places and strip extra zeros
+            return f"{value:.10f}".rstrip("0").rstrip(".")
+    except Exception:
+        return str(value)  # Fallback for safety
+
+
+def format_exact(value, digits=30):
+    """
+    Format an exact (Fraction) result for high precision output:
+    - Values that have a finite decimal expansion are shown in full
+    - Everything else is rounded to `digits` significant digits
+    """
+    value = F(value)
+
+    # Only powers of 2 and 5 in the denominator mean the decimal expansion ends
+    denominator = value.denominator
+    places = 0
+    for prime in (2, 5):
+        count = 0
+        while denominator % prime == 0:
+            denominator //= prime
+            count += 1
+        places = max(places, count)
+
+    if denominator == 1:
+        # Building the Decimal from a string keeps every digit (no context rounding)
+        decimal = Decimal(f"{value.numerator * 10 ** places // value.denominator}e-{places}")
+    else:
+        with localcontext() as context:
+            context.prec = digits
+            decimal = Decimal(value.numerator) / Decimal(value.denominator)
+
+    text = format(decimal, "f")
+    return text.rstrip("0").rstrip(".") if "." in text else text
+
+
+def convert_number_systems(value, from_unit, to_unit):
+    """Handle number system conversions"""
+    if from_unit == to_unit:
+        return value
+
+    try:
+        # Convert to decimal first
+        if from_unit == "Binary":
+            decimal = int(value, 2)
+        elif from_unit == "Octal":
+            decimal = int(value, 8)
+        elif from_unit == "Decimal":
+            decimal = int(value)
+        elif from_unit == "Hexadecimal":
+            decimal = int(value, 16)
+        else:
+            return "Error"
+
+        # Convert from decimal to target
+        if to_unit == "Binary":
+            return bin(decimal)[2:]  # Remove '0b' prefix
+        elif to_unit == "Octal":
+            return oct(decimal)[2:]  # Remove '0o' prefix
+        elif to_unit == "Decimal":
+            return str(decimal)
+        elif to_unit == "Hexadecimal":
+            return hex(decimal)[2:].upper()  # Remove '0x' prefix and uppercase
+        else:
+            return "Error"
+
+    except ValueError:
+        return "Invalid input"
+
+
+class ConversionCache:
+    """
+    Bounded LRU of converted results: (category, input text, units, precision) → result text.
+    Flipping back and forth between the same units and values then skips parsing,
+    converting and formatting. hits/misses are shown under Settings → Diagnostics.
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()  # Least recently used first
+        self.hits = self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        """Return the cached result or None"""
+        result = self.entries.get(key)
+        if result is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.entries.move_to_end(key)
+        return result
+
+    def put(self, key, result):
+        self.entries[key] = result
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def resize(self, maxsize):
+        self.maxsize = maxsize
+        while len(self.entries) > maxsize:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        """Forget every result (and the counters), e.g. after the unit definitions changed"""
+        self.entries.clear()
+        self.hits = self.misses = 0
+
+
+# Shared by every category; emptied whenever the categories are built again
+CONVERSION_CACHE = ConversionCache()
+
+
+class ConversionCategory:
+    """
+    Everything the converter page needs to know about one category:
+    its units, how to read the input, how to convert and how to show the result.
+    """
+
+    def __init__(self, name, units, convert, parse=float, formatter=format_result, exact=False):
+        self.name = name
+        self.units = list(units)
+        self.convert = convert      # convert(value, from_unit, to_unit)
+        self.parse = parse          # turns the input text into a value
+        self.formatter = formatter  # turns the converted value back into text
+        self.exact = exact          # True if convert() also accepts Fractions and keeps them exact
+
+    def convert_text(self, text, from_unit, to_unit, exact=False):
+        """Convert the text typed by the user and return the text to display"""
+        exact = exact and self.exact
+        key = (self.name, self.cache_key(), text, from_unit, to_unit, exact)
+        result = CONVERSION_CACHE.get(key)
+        if result is None:
+            # Invalid input raises here, so only successful conversions are cached
+            result = self.convert_uncached(text, from_unit, to_unit, exact)
+            CONVERSION_CACHE.put(key, result)
+        return result
+
+    def convert_uncached(self, text, from_unit, to_unit, exact=False):
+        if exact:
+            # High precision output: the input is read as an exact Fraction
+            return format_exact(self.convert(F(text), from_unit, to_unit))
+
+        value = self.parse(text)
+        return self.formatter(self.convert(value, from_unit, to_unit))
+
+    def cache_key(self):
+        """Anything besides the units that changes the result (e.g. the date of currency rates)"""
+        return None
+
+    def convert_to_all(self, value, from_unit):
+        """Convert a value into every unit of the category (in the same order as self.units)"""
+        return [self.convert(value, from_unit, unit) for unit in self.units]
+
+
+class LinearCategory(ConversionCategory):
+    """
+    A category where every conversion is a single multiplication (Length, Area, Energy, ...).
+
+    The ratio between every pair of units is worked out once here, so converting
+    only needs one lookup and one multiplication. Fraction values are multiplied
+    by the exact ratios and floats by the float ones, so both paths cost the same.
+    """
+
+    def __init__(self, name, units):
+        super().__init__(name, units.keys(), self.convert_linear, exact=True)
+        self.factors = [F(factor) for factor in units.values()]
+        self.index = {unit: i for i, unit in enumerate(self.units)}
+
+        # exact_ratios[i][j] converts a value in unit i into unit j without any rounding
+        self.exact_ratios = [[from_factor / to_factor for to_factor in self.factors]
+                             for from_factor in self.factors]
+
+        # The same ratios rounded once to floats for the normal (float) path
+        self.ratios = [[float(ratio) for ratio in row] for row in self.exact_ratios]
+
+        # The same N×N matrix as a NumPy array for converting into all units in one pass
+        self.ratio_array = np.array(self.ratios) if np is not None else None
+
+    def convert_linear(self, value, from_unit, to_unit):
+        ratios = self.exact_ratios if isinstance(value, F) else self.ratios
+        return value * ratios[self.index[from_unit]][self.index[to_unit]]
+
+    def convert_to_all(self, value, from_unit):
+        row = self.index[from_unit]
+        if isinstance(value, F):
+            return [value * ratio for ratio in self.exact_ratios[row]]
+        if self.ratio_array is not None:
+            return (value * self.ratio_array[row]).tolist()
+        return [value * ratio for ratio in self.ratios[row]]
+
+
+class AffineCategory(ConversionCategory):
+    """
+    A category where every conversion is value * scale + offset (absolute temperatures).
+
+    The (scale, offset) of every pair of units is worked out once from the exact
+    definitions, so a conversion is one lookup and one multiply-add; there is no
+    chain of unit name comparisons and no detour through a middle unit.
+    """
+
+    def __init__(self, name, scales):
+        super().__init__(name, scales.keys(), self.convert_affine, exact=True)
+        self.index = {unit: i for i, unit in enumerate(self.units)}
+
+        # exact_table[i][j] = (scale, offset) that converts unit i into unit j
+        self.exact_table = [[(from_scale / to_scale, (from_offset - to_offset) / to_scale)
+                             for to_scale, to_offset in scales.values()]
+                            for from_scale, from_offset in scales.values()]
+        self.table = [[(float(scale), float(offset)) for scale, offset in row] for row in self.exact_table]
+
+        # Rows of scales and offsets for converting into every unit in one pass
+        if np is not None:
+            self.scale_array = np.array([[scale for scale, _ in row] for row in self.table])
+            self.offset_array = np.array([[offset for _, offset in row] for row in self.table])
+
+    def convert_affine(self, value, from_unit, to_unit):
+        table = self.exact_table if isinstance(value, F) else self.table
+        scale, offset = table[self.index[from_unit]][self.index[to_unit]]
+        return value * scale + offset
+
+    def convert_to_all(self, value, from_unit):
+        row = self.index[from_unit]
+        if isinstance(value, F):
+            return [value * scale + offset for scale, offset in self.exact_table[row]]
+        if np is not None:
+            return (value * self.scale_array[row] + self.offset_array[row]).tolist()
+        return [value * scale + offset for scale, offset in self.table[row]]
+
+
+def build_categories(conversion_data=CONVERSION_DATA, conversion_types=CONVERSION_TYPES):
+    """Create a ConversionCategory for every entry of the conversion data (in display order)"""
+    # New categories mean the unit definitions may have changed, old results can't be trusted
+    CONVERSION_CACHE.clear()
+    categories = {}
+
+    for name in conversion_types:
+        data = conversion_data[name]
+
+        if name == "Number Systems":
+            # Values stay as text so that binary/hex digits are not parsed as floats
+            categories[name] = ConversionCategory(name, data["units"], convert_number_systems,
+                                                  parse=str, formatter=str)
+        elif name == "Temperature":
+            categories[name] = AffineCategory(name, {unit: TEMPERATURE_SCALES[unit] for unit in data["units"]})
+        else:
+            categories[name] = LinearCategory(name, data["units"])
+
+    return categories
+
+
+def affine_coefficients(category, from_unit, to_unit):
+    """
+    Return (scale, offset) so that converted = value * scale + offset.
+
+    This works for every category whose conversion is a straight line
+    (the linear ones and Temperature) and lets whole arrays be converted at once.
+    """
+    if not category.exact:
+        raise ValueError(f"{category.name} conversions can't be applied to arrays of numbers")
+    if isinstance(category, AffineCategory):
+        return category.table[category.index[from_unit]][category.index[to_unit]]
+
+    # Worked out with Fractions so the only rounding is the final float()
+    offset = category.convert(F(0), from_unit, to_unit)
+    scale = category.convert(F(1), from_unit, to_unit) - offset
+    return float(scale), float(offset)
+
+
+# Number of values converted per block; small enough that the multiply and
+# the add both run while the block is still in the CPU cache
+BLOCK_SIZE = 1 << 15
+
+
+def apply_affine(values, scale, offset, out=None, block_size=BLOCK_SIZE):
+    """
+    Compute values * scale + offset into `out` (or into `values` itself) block by block.
+    Both arrays must be NumPy arrays of the same size; no temporary arrays are created.
+    """
+    if out is None:
+        out = values
+
+    if not (values.flags.c_contiguous and out.flags.c_contiguous):
+        # Strided views can't be flattened without a copy, so convert them in one go
+        np.multiply(values, scale, out=out, casting="unsafe")
+        if offset:
+            np.add(out, offset, out=out)
+        return out
+
+    flat_values = values.reshape(-1)
+    flat_out = out.reshape(-1)
+
+    for start in range(0, flat_values.size, block_size):
+        block = flat_out[start:start + block_size]
+        np.multiply(flat_values[start:start + block_size], scale, out=block, casting="unsafe")
+        if offset:
+            np.add(block, offset, out=block)
+
+    return out
+
+
+def convert_buffer(buffer, category, from_unit, to_unit, dtype="float64"):
+    """
+    Convert every number in a writable buffer in place, without copying it.
+
+    `buffer` can be anything that supports the buffer protocol: a NumPy array,
+    array.array, memoryview, bytearray or mmap. Buffers of raw bytes (bytearray,
+    mmap) are read as `dtype` values; typed buffers keep their own type.
+    Returns the number of values converted.
+    """
+    scale, offset = affine_coefficients(category, from_unit, to_unit)
+
+    view = memoryview(buffer)
+    if view.readonly:
+        raise ValueError("The buffer is read-only, it can't be converted in place")
+
+    if np is None:
+        # Without NumPy: walk the values through a typed memoryview (much slower, but no copies)
+        if view.format in ("B", "b", "c"):
+            view = view.cast(float_type_code(dtype))
+        elif view.ndim != 1:
+            view = view.cast("B").cast(view.format)
+        if view.format not in ("d", "f"):
+            raise ValueError(f"Only float buffers can be converted in place (got '{view.format}')")
+        for i in range(len(view)):
+            view[i] = view[i] * scale + offset
+        return len(view)
+
+    # NumPy reads the buffer's own format and shape, and shares its memory
+    values = buffer if isinstance(buffer, np.ndarray) else np.asarray(view)
+    if values.dtype == np.uint8 and view.format in ("B", "c"):
+        values = values.view(dtype)
+    if not np.issubdtype(values.dtype, np.floating):
+        raise ValueError(f"Only float buffers can be converted in place (got {values.dtype})")
+
+    apply_affine(values, scale, offset)
+    return values.size
+
+
+def float_type_code(dtype):
+    """struct/array type code for a float dtype name ('float64' → 'd')"""
+    codes = {"float64": "d", "double": "d", "d": "d", "float32": "f", "single": "f", "f": "f"}
+    if str(dtype) not in codes:
+        raise ValueError(f"Only float64 and float32 buffers can be converted in place (got {dtype})")
+    return codes[str(dtype)]
@@ -0,0 +1,328 @@
+"""
+Offline currency conversion from a local, memory-mapped table of historical rates.
+
+The rates are refreshed separately (e.g. from the ECB's eurofxref-hist.csv)
+and compiled into a compact binary file:
+
+    python currency.py build eurofxref-hist.csv rates.bin
+    python currency.py convert 100 EUR JPY --date 2019-03-04
+
+File layout (little-endian), stored column by column so that converting
+between two currencies only pages in those two columns:
+
+    header      b"PCRATES1", number of dates, number of currencies (uint32)
+    currencies  3 ASCII letters per currency, padded to 8 bytes
+    dates       int32 days since 1970-01-01, sorted, padded to 8 bytes
+    columns     float64 per date for every currency: units of it per 1 base currency (NaN = no rate)
+
+The file is memory mapped, so opening it costs the same for ten years of
+rates as for one day, and a date is found by binary search on the dates column.
+"""
+
+import argparse
+import csv
+import math
+import mmap
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_right
+from datetime import date
+from functools import lru_cache
+
+from conversions import ConversionCategory, format_result, np
+
+MAGIC = b"PCRATES1"
+HEADER = struct.Struct("<8sII")
+EPOCH = date(1970, 1, 1).toordinal()
+MISSING_DAY = -2 ** 31  # Day number of dates that can't be read: before every rate
+
+# The rates file next to the program is used first, then the one in the user's home folder
+RATE_FILES = [os.path.join(os.path.dirname(os.path.abspath(__file__)), "rates.bin"),
+              os.path.join(os.path.expanduser("~"), ".python_calculator", "rates.bin")]
+
+
+def padded(size):
+    """Round a byte size up so the next column starts 8-byte aligned"""
+    return (size + 7) // 8 * 8
+
+
+@lru_cache(maxsize=4096)
+def day_number(text):
+    """Days since 1970-01-01 of a "2019-03-04" date (bulk files repeat the same dates a lot)"""
+    return date.fromisoformat(text.strip()).toordinal() - EPOCH
+
+
+def to_day(value):
+    """Day number of a date, a "YYYY-MM-DD" string or an existing day number"""
+    if isinstance(value, date):
+        return value.toordinal() - EPOCH
+    if isinstance(value, int):
+        return value
+    return day_number(value)
+
+
+def day_or_missing(value):
+    """Day number of a date, or MISSING_DAY (before any rate) when it can't be read"""
+    try:
+        return to_day(value)
+    except ValueError:
+        return MISSING_DAY
+
+
+class RateStore:
+    """Read-only view of a rates file; nothing is read until a rate is looked up"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as file:
+            if os.fstat(file.fileno()).st_size < HEADER.size:
+                raise ValueError(f"{path} is not a rates file")
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, self.date_count, currency_count = HEADER.unpack_from(self.map)
+        offset = HEADER.size
+        # A cut-off download would otherwise only fail on the first lookup
+        size = offset + padded(3 * currency_count) + padded(4 * self.date_count) + 8 * self.date_count * currency_count
+        try:
+            if magic != MAGIC:
+                raise ValueError(f"{path} is not a rates file")
+            if not self.date_count or not currency_count:
+                raise ValueError(f"{path} has no rates")
+            if len(self.map) < size:
+                raise ValueError(f"{path} is damaged: it has {len(self.map)} bytes instead of {size}")
+            try:
+                codes = bytes(self.map[offset:offset + 3 * currency_count]).decode("ascii")
+            except UnicodeDecodeError:
+                raise ValueError(f"{path} is damaged: the currency codes aren't letters")
+        except ValueError:
+            self.map.close()
+            raise
+        self.currencies = [codes[i:i + 3] for i in range(0, len(codes), 3)]
+        self.index = {code: i for i, code in enumerate(self.currencies)}
+        offset += padded(3 * currency_count)
+
+        # Views straight into the mapped file, no copies
+        self.buffer = memoryview(self.map)
+        self.dates = self.buffer[offset:offset + 4 * self.date_count].cast("i")
+        self.columns_offset = offset + padded(4 * self.date_count)
+        self.columns = {}
+
+    def close(self):
+        # Every view has to be released before the map can be closed
+        for column in self.columns.values():
+            column.release()
+        self.columns.clear()
+        self.dates.release()
+        self.buffer.release()
+        self.map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self.date_count
+
+    def first_date(self):
+        return date.fromordinal(self.dates[0] + EPOCH)
+
+    def last_date(self):
+        return date.fromordinal(self.dates[-1] + EPOCH)
+
+    def column(self, code):
+        """The rates of one currency for every date (a view into the file)"""
+        if code not in self.columns:
+            if code not in self.index:
+                raise ValueError(f"Unknown currency '{code}'")
+            start = self.columns_offset + 8 * self.date_count * self.index[code]
+            self.columns[code] = self.buffer[start:start + 8 * self.date_count].cast("d")
+        return self.columns[code]
+
+    def row(self, on=None):
+        """Row of the rates valid on a date: the last published day on or before it"""
+        if on is None:
+            return self.date_count - 1
+        row = bisect_right(self.dates, to_day(on)) - 1
+        if row < 0:
+            raise ValueError(f"No rates before {self.first_date()}")
+        return row
+
+    def rate(self, from_code, to_code, on=None):
+        """How many to_code one from_code was worth on a date (latest rates without a date)"""
+        row = self.row(on)
+        source = self.column(from_code)[row]
+        # A source rate of 0 is as missing as a NaN one
+        rate = self.column(to_code)[row] / source if source else math.nan
+        if math.isnan(rate):
+            published = date.fromordinal(self.dates[row] + EPOCH)
+            raise ValueError(f"No {from_code}/{to_code} rate on {published}")
+        return rate
+
+    def convert(self, amount, from_code, to_code, on=None):
+        return amount * self.rate(from_code, to_code, on)
+
+    def convert_many(self, amounts, dates, from_code, to_code):
+        """
+        Convert many amounts, each on its own date. Returns a list (a NumPy array when
+        NumPy is installed) with NaN where there was no rate or the date can't be read.
+        """
+        if np is not None:
+            dates = np.fromiter((day_or_missing(day) for day in dates), dtype=np.int32) \
+                if not isinstance(dates, np.ndarray) else dates.astype(np.int32)
+            rows = np.searchsorted(np.frombuffer(self.dates, dtype=np.int32), dates, side="right") - 1
+            from_column = np.frombuffer(self.column(from_code), dtype=np.float64)
+            to_column = np.frombuffer(self.column(to_code), dtype=np.float64)
+
+            # Only the rows that are used get paged in
+            valid = rows >= 0
+            rows = np.where(valid, rows, 0)
+            sources = from_column[rows]
+            valid &= sources != 0
+            with np.errstate(divide="ignore", invalid="ignore"):
+                results = np.asarray(amounts, dtype=np.float64) * to_column[rows] / sources
+            results[~valid] = np.nan
+            return results
+
+        results = []
+        for amount, day in zip(amounts, dates):
+            try:
+                results.append(self.convert(amount, from_code, to_code, day))
+            except ValueError:
+                results.append(math.nan)
+        return results
+
+
+def build_rate_store(source, destination, base="EUR"):
+    """
+    Compile a CSV of daily rates ("Date,USD,JPY,..." with one row per day, values
+    per 1 base currency, "N/A" or empty when missing) into a rates file.
+    Returns the number of dates written.
+    """
+    with open(source, newline="") as file:
+        reader = csv.reader(file)
+        header = next(reader, None)
+        if header is None:
+            raise ValueError(f"{source} is empty")
+        header = [name.strip() for name in header]
+        # The ECB file ends every row with a comma, which gives an empty column
+        columns = [i for i, name in enumerate(header) if i > 0 and name]
+        codes = [header[i].upper() for i in columns]
+        for code in codes:
+            if len(code) != 3 or not code.isascii() or not code.isalpha():
+                raise ValueError(f"'{code}' is not a three letter currency code")
+
+        rows = []
+        for line in reader:
+            if not line or not line[0].strip():
+                continue
+            values = []
+            for i in columns:
+                text = line[i].strip() if i < len(line) else ""
+                try:
+                    values.append(float(text))
+                except ValueError:
+                    values.append(math.nan)
+            rows.append((day_number(line[0]), values))
+
+    if not rows:
+        # RateStore couldn't open a file without dates
+        raise ValueError(f"{source} has no rates")
+
+    # One row per date, sorted; a date listed twice keeps its last row
+    rows = sorted(dict(rows).items())
+
+    if base.upper() not in codes:
+        # The base currency is always worth exactly 1 of itself
+        codes.append(base.upper())
+        rows = [(day, values + [1.0]) for day, values in rows]
+
+    dates = array("i", [day for day, _ in rows])
+
+    temporary = destination + ".tmp"
+    with open(temporary, "wb") as file:
+        file.write(HEADER.pack(MAGIC, len(dates), len(codes)))
+        names = "".join(codes).encode("ascii")
+        file.write(names.ljust(padded(len(names)), b"\0"))
+        file.write(dates.tobytes().ljust(padded(4 * len(dates)), b"\0"))
+        for i in range(len(codes)):
+            file.write(array("d", [values[i] for _, values in rows]).tobytes())
+
+    # Readers that still have the old file mapped keep seeing the old rates
+    os.replace(temporary, destination)
+    return len(dates)
+
+
+def open_rate_store(paths=None):
+    """Open the first rates file that exists, or return None when there is none"""
+    for path in RATE_FILES if paths is None else paths:
+        if os.path.exists(path):
+            return RateStore(path)
+    return None
+
+
+class CurrencyCategory(ConversionCategory):
+    """The Currency entry of the Conversions page, converting on self.date (None = latest rates)"""
+
+    def __init__(self, store):
+        super().__init__("Currency", store.currencies, self.convert_currency, formatter=format_amount)
+        self.store = store
+        self.date = None
+
+    def cache_key(self):
+        # Converted amounts depend on the day and on which rates file is open
+        return self.store.path, self.date
+
+    def convert_currency(self, value, from_unit, to_unit):
+        return self.store.convert(value, from_unit, to_unit, self.date)
+
+    def convert_to_all(self, value, from_unit):
+        # Some currencies have no rate on some days, that shouldn't hide the others
+        row = self.store.row(self.date)
+        from_rate = self.store.column(from_unit)[row]
+        return [value * self.store.column(unit)[row] / from_rate for unit in self.units]
+
+
+def format_amount(value):
+    return "no rate" if math.isnan(value) else format_result(value)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build and use the offline currency rates file")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build = commands.add_parser("build", help="Compile a CSV of daily rates into a rates file")
+    build.add_argument("source", help="CSV file, e.g. the ECB's eurofxref-hist.csv")
+    build.add_argument("destination", nargs="?", default=RATE_FILES[0], help="Rates file to write")
+    build.add_argument("--base", default="EUR", help="Currency the CSV rates are given in (default: EUR)")
+
+    convert = commands.add_parser("convert", help="Convert an amount")
+    convert.add_argument("amount", type=float)
+    convert.add_argument("from_code")
+    convert.add_argument("to_code")
+    convert.add_argument("--date", help="YYYY-MM-DD (default: the latest rates)")
+    convert.add_argument("--rates", help="Rates file to use")
+
+    args = parser.parse_args(argv)
+    try:
+        if args.command == "build":
+            count = build_rate_store(args.source, args.destination, args.base)
+            print(f"Wrote {count} days of rates to {args.destination}")
+        else:
+            store = open_rate_store([args.rates] if args.rates else None)
+            if store is None:
+                raise ValueError("No rates file found, create one with 'currency.py build'")
+            with store:
+                result = store.convert(args.amount, args.from_code.upper(), args.to_code.upper(), args.date)
+            print(f"{result:.2f} {args.to_code.upper()}")
+    except (ValueError, OSError) as error:
+        print(f"Error: {error}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
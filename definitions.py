@@ -0,0 +1,229 @@
+"""
+User variables and functions, shared by the Standard and Advanced displays.
+
+    r = 5 km                  a variable (keeps its unit)
+    f(x) = x² + sin(x)        a function of plain numbers
+    fib(0) = 0                values for particular arguments...
+    fib(1) = 1
+    fib(n) = fib(n - 1) + fib(n - 2)   ...and the general rule, which may call itself
+
+Expressions then use them like built-in names: "f(r / 1 km)", "2 r", "fib(90)".
+
+A function only depends on its arguments and on the other definitions, so
+every function is pure: each one remembers its latest results in a bounded
+cache, and since a recursive call goes through the same cache, fib(n) is
+worked out once per n (linear time) instead of once per call. Changing any
+definition starts with empty caches.
+"""
+
+import re
+from functools import lru_cache
+
+from expression import CONSTANTS, FUNCTIONS, check_variable_name, compile_expression, tokenize
+from units import DIMENSIONLESS, format_dimensions
+
+FUNCTION_CACHE_SIZE = 10000  # results remembered per function
+
+DEFINITION = re.compile(r"\s*([^\W\d]\w*)\s*(?:\(([^()]*)\))?\s*=(.*)")
+NUMBER = re.compile(r"[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?")
+
+
+def is_definition(text):
+    """Whether a line defines a variable or function ("=" isn't used in expressions otherwise)"""
+    return "=" in text
+
+
+class Variable:
+    """A value in SI base units and what the compiler needs to know about it"""
+
+    __slots__ = ("value", "dims", "angle")
+
+    def __init__(self, value, dims, angle=False):
+        self.value = value
+        self.dims = dims
+        self.angle = angle
+
+
+class UserFunction:
+    """
+    A function of plain numbers: values given for particular arguments (`cases`,
+    in base units) and a general rule (`body`, an expression of the parameters)
+    """
+
+    __slots__ = ("name", "parameters", "body", "cases", "dims")
+
+    def __init__(self, name, arity):
+        self.name = name
+        self.parameters = ("x",) * arity  # Replaced by the names of the general rule
+        self.body = None
+        self.cases = {}
+        self.dims = None  # Result dimensions, None until something is defined
+
+    def copy(self):
+        function = UserFunction(self.name, len(self.parameters))
+        function.parameters, function.body, function.dims = self.parameters, self.body, self.dims
+        function.cases = dict(self.cases)
+        return function
+
+    def signature(self):
+        """What the head of the definition looks like: f(x, y)"""
+        return f"{self.name}({', '.join(self.parameters)})"
+
+
+class Definitions:
+    """The variables and functions the user defined, and the compiled scope expressions are evaluated in"""
+
+    def __init__(self, cache_size=FUNCTION_CACHE_SIZE):
+        self.variables = {}  # name → Variable
+        self.functions = {}  # name → UserFunction, in the order they were defined
+        self.cache_size = cache_size
+        self.scopes = {}     # angle mode → {name: value or cached function}, built when needed
+
+    def __contains__(self, name):
+        return name in self.variables or name in self.functions
+
+    def compile(self, text, angle_mode="deg", parameters=()):
+        """Compile an expression that may use the definitions (and `parameters`, plain numbers)"""
+        names = set()
+        for kind, value, _ in tokenize(text):
+            if kind == "name":
+                names.add(value)
+        variables = tuple(sorted(
+            [(name, DIMENSIONLESS, False) for name in parameters if name in names] +
+            [(name, variable.dims, variable.angle) for name, variable in self.variables.items()
+             if name in names and name not in parameters]))
+        functions = tuple(sorted((name, len(function.parameters), function.dims)
+                                 for name, function in self.functions.items() if name in names))
+        return compile_expression(text, angle_mode, variables, functions)
+
+    def scope(self, angle_mode="deg"):
+        """The mapping compiled expressions get: variable values and callable functions"""
+        scope = self.scopes.get(angle_mode)
+        if scope is None:
+            scope = {name: variable.value for name, variable in self.variables.items()}
+            for name, function in self.functions.items():
+                scope[name] = self.bind(function, angle_mode, scope)
+            self.scopes[angle_mode] = scope
+        return scope
+
+    def bind(self, function, angle_mode, scope):
+        """A callable for a function with its own bounded cache of results"""
+        compiled = None if function.body is None else self.compile(function.body, angle_mode, function.parameters)
+        name, parameters, cases = function.name, function.parameters, function.cases
+
+        def call(*arguments):
+            if arguments in cases:
+                return cases[arguments]
+            if compiled is None:
+                raise ValueError(f"{name} has no value for {', '.join(map(str, arguments))}")
+            values = dict(scope)
+            values.update(zip(parameters, arguments))
+            return compiled.function(values)
+
+        return lru_cache(maxsize=self.cache_size)(call)
+
+    def evaluate(self, text, angle_mode="deg"):
+        """Compile and evaluate an expression; returns (compiled, value in its display unit)"""
+        compiled = self.compile(text, angle_mode)
+        try:
+            return compiled, compiled.evaluate(self.scope(angle_mode))
+        except RecursionError:
+            raise ValueError("Too many nested function calls")
+
+    def define(self, text, angle_mode="deg"):
+        """
+        Add or replace a definition like "r = 5 km", "f(x) = x² + 1" or "f(0) = 1".
+        Returns the text to show (the variable's value, or the function's head);
+        raises ValueError (or ArithmeticError) and keeps the old definitions when it can't be used.
+        """
+        match = DEFINITION.fullmatch(text)
+        if not match:
+            raise ValueError(f"Can't read the definition '{text.strip()}'")
+        name, arguments, expression = match.group(1), match.group(2), match.group(3).strip()
+        check_variable_name(name)
+        if not expression:
+            raise ValueError(f"Nothing to define '{name}' as")
+
+        variables, functions = dict(self.variables), dict(self.functions)
+        try:
+            if arguments is None:
+                shown = self.define_variable(name, expression, angle_mode)
+            else:
+                shown = self.define_function(name, [argument.strip() for argument in arguments.split(",")],
+                                             expression, angle_mode)
+            self.check(angle_mode)
+        except RecursionError:
+            self.variables, self.functions, self.scopes = variables, functions, {}
+            raise ValueError("Too many nested function calls")
+        except Exception:
+            self.variables, self.functions, self.scopes = variables, functions, {}
+            raise
+        return shown
+
+    def define_variable(self, name, expression, angle_mode):
+        compiled = self.compile(expression, angle_mode)
+        value = compiled.evaluate_base(self.scope(angle_mode))
+        self.functions.pop(name, None)
+        self.variables[name] = Variable(value, compiled.dims, compiled.angle)
+        self.scopes = {}
+        return compiled.format(compiled.to_display(value))
+
+    def define_function(self, name, arguments, expression, angle_mode):
+        if name in FUNCTIONS or name in CONSTANTS:
+            raise ValueError(f"'{name}' is a built-in name")
+        if arguments == [""]:
+            raise ValueError(f"{name}() needs at least one value")
+        old = self.functions.get(name)
+        if old is not None and len(old.parameters) != len(arguments):
+            function = UserFunction(name, len(arguments))  # A different number of values starts over
+        else:
+            function = old.copy() if old is not None else UserFunction(name, len(arguments))
+
+        if all(NUMBER.fullmatch(argument) for argument in arguments):
+            # A value for particular arguments: fib(0) = 0
+            self.variables.pop(name, None)
+            compiled = self.compile(expression, angle_mode)
+            if compiled.dims != function.dims and function.dims is not None:
+                raise ValueError(f"{function.signature()} gives {format_dimensions(function.dims)}, "
+                                 f"not {format_dimensions(compiled.dims)}")
+            key = tuple(float(argument) for argument in arguments)
+            function.cases[key] = compiled.evaluate_base(self.scope(angle_mode))
+            function.dims = compiled.dims
+            self.functions[name] = function
+            self.scopes = {}
+            return f"{name}({', '.join(arguments)})"
+
+        for argument in arguments:
+            check_variable_name(argument)
+            if argument in self.functions or argument == name:
+                raise ValueError(f"'{argument}' is already a function")
+        if len(set(arguments)) != len(arguments):
+            raise ValueError(f"{name} has two values with the same name")
+
+        # While the rule is compiled, a call to the function itself is taken to give what its
+        # particular values give, or a plain number
+        self.variables.pop(name, None)
+        function.parameters, function.body = tuple(arguments), expression
+        if function.dims is None:
+            function.dims = DIMENSIONLESS
+        self.functions[name] = function
+        compiled = self.compile(expression, angle_mode, function.parameters)
+        if compiled.dims != function.dims:
+            if function.cases or name in {value for kind, value, _ in tokenize(expression) if kind == "name"}:
+                raise ValueError(f"{function.signature()} gives {format_dimensions(compiled.dims)}, but "
+                                 f"it has to give {format_dimensions(function.dims)} like its other values")
+            function.dims = compiled.dims
+        self.scopes = {}
+        return function.signature()
+
+    def check(self, angle_mode):
+        """Compile every function again: raises ValueError if a definition broke one of them"""
+        for function in self.functions.values():
+            if function.body is not None:
+                try:
+                    compiled = self.compile(function.body, angle_mode, function.parameters)
+                except ValueError as error:
+                    raise ValueError(f"{function.signature()} would stop working: {error}")
+                if compiled.dims != function.dims:
+                    raise ValueError(f"{function.signature()} would give {format_dimensions(compiled.dims)} "
+                                     f"instead of {format_dimensions(function.dims)}")
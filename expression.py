@@ -0,0 +1,531 @@
+"""
+Expression engine for the Standard / Advanced display.
+
+Expressions are parsed once and compiled into a small Python function.
+Numbers may carry units ("5 km + 300 m in ft", "3 kWh / 2 h", "100 km/h in mph"):
+every quantity is stored in SI base units and its dimension vector is only
+known to the compiler, so unit checks and scale factors are all resolved at
+compile time and evaluating the compiled function is plain float math.
+
+Names that aren't functions, constants or units can be variables and user
+functions (see worksheet.py and definitions.py): the compiler is told each
+variable's dimensions and each function's number of values and result
+dimensions, and the values (in SI base units) and the functions are passed
+when the compiled function is evaluated.
+"""
+
+import math
+import re
+from collections import namedtuple
+from fractions import Fraction
+from functools import lru_cache
+
+from conversions import format_result, np
+from units import DIMENSIONLESS, format_dimensions, parse_unit
+
+TOKEN = re.compile(r"""\s*(?:
+    (?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)
+  | (?P<superscript>[⁻⁰¹²³⁴⁵⁶⁷⁸⁹]+)
+  | (?P<operator>\*\*|[-+*/^%()!,×÷·√])
+  | (?P<name>°[A-Za-z]?|[^\W\d_⁰¹²³⁴⁵⁶⁷⁸⁹][^\W⁰¹²³⁴⁵⁶⁷⁸⁹]*)
+)""", re.VERBOSE)
+
+SUPERSCRIPTS = str.maketrans("⁻⁰¹²³⁴⁵⁶⁷⁸⁹", "-0123456789")
+
+# Function name typed by the user → name of the function in the namespace
+FUNCTIONS = {"sin": "sin", "cos": "cos", "tan": "tan", "asin": "asin", "acos": "acos", "atan": "atan",
+             "log": "log10", "ln": "ln", "sqrt": "sqrt", "exp": "exp", "abs": "abs"}
+TRIG_FUNCTIONS = ("sin", "cos", "tan")
+INVERSE_TRIG_FUNCTIONS = ("asin", "acos", "atan")
+CONSTANTS = {"pi": "pi", "π": "pi", "e": "e"}
+KEYWORDS = ("mod", "per")
+
+# SI units to show a result in when the expression doesn't name a suitable unit itself
+DERIVED_UNITS = ("N", "J", "W", "Pa", "Hz", "C", "V", "ohm")
+
+
+def factorial(value):
+    """math.factorial that also accepts whole floats like 5.0"""
+    if value != int(value) or value < 0:
+        raise ValueError("Factorial needs a whole number ≥ 0")
+    return math.factorial(int(value))
+
+
+# Everything a compiled expression can call when it is evaluated with floats
+FLOAT_NAMESPACE = {
+    "sin": math.sin, "cos": math.cos, "tan": math.tan,
+    "asin": math.asin, "acos": math.acos, "atan": math.atan,
+    "radians": math.radians, "degrees": math.degrees,
+    "log10": math.log10, "ln": math.log, "sqrt": math.sqrt, "exp": math.exp, "abs": abs,
+    "factorial": factorial, "pi": math.pi, "e": math.e,
+    "__builtins__": {},
+}
+
+
+def array_factorial(values):
+    """factorial for NumPy arrays: NaN where there is no factorial (floats can't hold above 170!)"""
+    values = np.asarray(values, dtype=float)
+    whole = (values == np.floor(values)) & (values >= 0) & (values <= 170)
+    result = np.full(values.shape, np.nan)
+    result[whole] = [float(math.factorial(int(value))) for value in values[whole]]
+    return result
+
+
+# The same names for NumPy arrays, so an expression can be evaluated for many x at once (see plotting.py)
+ARRAY_NAMESPACE = None if np is None else {
+    "sin": np.sin, "cos": np.cos, "tan": np.tan,
+    "asin": np.arcsin, "acos": np.arccos, "atan": np.arctan,
+    "radians": np.radians, "degrees": np.degrees,
+    "log10": np.log10, "ln": np.log, "sqrt": np.sqrt, "exp": np.exp, "abs": np.abs,
+    "factorial": array_factorial, "pi": math.pi, "e": math.e,
+    "__builtins__": {},
+}
+
+# What the compiler knows about every part of an expression:
+# code    - Python source that computes the value (in SI base units)
+# dims    - dimension vector of the value
+# angle   - True if the value came from an angle unit (so sin() must not convert it again)
+# const   - the value itself when it is a plain number literal (used for exponents)
+# offset  - True for a °C / °F literal, which can't take part in arithmetic
+Node = namedtuple("Node", "code dims angle const offset")
+
+
+class CompiledExpression:
+    """An expression compiled to a Python function, plus the unit its result is shown in"""
+
+    __slots__ = ("text", "source", "function", "dims", "angle", "unit_text", "scale", "offset", "angle_mode", "names",
+                 "array_function")
+
+    def __init__(self, text, source, dims, unit_text=None, namespace=FLOAT_NAMESPACE, angle_mode="deg",
+                 scale=1.0, offset=0.0, angle=False, names=()):
+        self.text = text
+        self.source = source        # Python source of the value in SI base units
+        self.dims = dims
+        self.angle = angle          # True if the value is an angle with a unit (30 deg), already in radians
+        self.unit_text = unit_text  # None for plain numbers
+        self.scale = scale          # The display unit is `scale` base units, plus `offset` for °C / °F
+        self.offset = offset
+        self.angle_mode = angle_mode  # What sin, cos, tan and their inverses were compiled for
+        self.names = names          # Variables and user functions it reads from the values passed to evaluate()
+        self.function = eval(f"lambda _values=None: {source}", dict(namespace))
+        self.array_function = None  # Compiled for NumPy arrays when it is first needed
+
+    def evaluate(self, values=None):
+        """Return the result in the display unit; `values` maps the variables to values in base units"""
+        return self.to_display(self.function(values))
+
+    def evaluate_base(self, values=None):
+        """Return the result in SI base units, the form variables hold"""
+        return self.function(values)
+
+    def evaluate_array(self, values=None):
+        """
+        Like evaluate(), with NumPy arrays among the values: the result is an array
+        (or a number, when it doesn't depend on them). Needs NumPy.
+        """
+        if self.array_function is None:
+            if ARRAY_NAMESPACE is None:
+                raise RuntimeError("NumPy is needed to evaluate arrays (pip install numpy)")
+            self.array_function = eval(f"lambda _values=None: {self.source}", dict(ARRAY_NAMESPACE))
+        return self.to_display(self.array_function(values))
+
+    def to_display(self, value):
+        """Convert a value in base units to the display unit"""
+        if self.offset:
+            value = value - self.offset
+        if self.scale != 1:
+            value = value / self.scale
+        return value
+
+    def format(self, value):
+        """Text for the display: plain numbers as before, quantities with their unit"""
+        if self.unit_text is None:
+            return str(value)
+        return f"{format_result(value)} {self.unit_text}"
+
+
+class Parser:
+    """Recursive descent parser that compiles while it parses"""
+
+    def __init__(self, text, angle_mode="deg", variables=(), functions=()):
+        self.text = text
+        self.angle_mode = angle_mode
+        self.variables = {name: (dims, angle) for name, dims, angle in variables}
+        self.functions = {name: (arity, dims) for name, arity, dims in functions}
+        self.names = set()  # Variables and user functions used
+        self.tokens = tokenize(text)
+        self.position = 0
+        self.literal_units = []  # (unit text, Unit) of every unit typed in the expression
+
+    # --- token helpers ---
+    def peek(self, offset=0):
+        index = self.position + offset
+        return self.tokens[index] if index < len(self.tokens) else (None, None, False)
+
+    def take(self):
+        token = self.peek()
+        self.position += 1
+        return token
+
+    def at(self, kind, value=None):
+        token_kind, token_value, _ = self.peek()
+        return token_kind == kind and (value is None or token_value == value)
+
+    def error(self, message=None):
+        return ValueError(message or f"Can't read the expression '{self.text}'")
+
+    # --- grammar ---
+    def parse(self):
+        node = self.additive()
+        if self.position != len(self.tokens):
+            raise self.error()
+        return node
+
+    def additive(self):
+        node = self.multiplicative()
+        while self.at("operator", "+") or self.at("operator", "-"):
+            operator = self.take()[1]
+            right = self.multiplicative()
+            node = self.combine_same_dims(node, operator, right, "add" if operator == "+" else "subtract")
+        return node
+
+    def multiplicative(self):
+        node = self.unary()
+        while True:
+            kind, value, _ = self.peek()
+            if kind == "operator" and value in ("*", "×", "·", "/", "÷", "%"):
+                self.take()
+                right = self.unary()
+                if value in ("*", "×", "·"):
+                    node = self.multiply(node, right, "*")
+                elif value in ("/", "÷"):
+                    node = self.multiply(node, right, "/")
+                else:
+                    node = self.combine_same_dims(node, "%", right, "take the modulus of")
+            elif kind == "name" and value == "mod":
+                self.take()
+                node = self.combine_same_dims(node, "%", self.unary(), "take the modulus of")
+            elif kind == "name" and value == "per":
+                self.take()
+                node = self.multiply(node, self.unary(), "/")  # 20 kWh per 100 km
+            elif (kind == "name" and value not in KEYWORDS) or (kind == "operator" and value in ("(", "√")):
+                # Implicit multiplication: 2π, 3(4 + 5), 2 sin(30)
+                node = self.multiply(node, self.unary(), "*")
+            else:
+                return node
+
+    def unary(self):
+        if self.at("operator", "-") or self.at("operator", "+"):
+            sign = self.take()[1]
+            node = self.unary()
+            if sign == "+":
+                return node
+            const = -node.const if node.const is not None else None
+            # The sign belongs to the number of a literal: -40 °C is 233.15 K, not -(313.15 K)
+            if node.offset:
+                return Node(node.code.replace("(", "(-", 1), node.dims, node.angle, const, True)
+            return Node(f"(-{node.code})", node.dims, node.angle, const, False)
+        if self.at("operator", "√"):
+            self.take()
+            return self.call("sqrt", [self.unary()])
+        return self.power()
+
+    def power(self):
+        base = self.postfix()
+        if self.at("operator", "**") or self.at("operator", "^"):
+            self.take()
+            exponent = self.unary()  # Right associative: 2^3^2 = 2^9
+            return self.raise_to(base, exponent)
+        return base
+
+    def postfix(self):
+        node = self.primary()
+        while True:
+            if self.at("operator", "!"):
+                self.take()
+                node = self.call("factorial", [node])
+            elif self.at("superscript"):
+                exponent = int(self.take()[1].translate(SUPERSCRIPTS))
+                node = self.raise_to(node, Node(repr(exponent), DIMENSIONLESS, False, exponent, False))
+            else:
+                return node
+
+    def primary(self):
+        kind, value, _ = self.take()
+
+        if kind == "number":
+            return self.number(value)
+
+        if kind == "operator" and value == "(":
+            node = self.additive()
+            if not self.at("operator", ")"):
+                raise self.error(f"Missing ')' in '{self.text}'")
+            self.take()
+            return Node(f"({node.code})", node.dims, node.angle, node.const, node.offset)
+
+        if kind == "name":
+            if value in self.functions:
+                return self.call_user_function(value, self.arguments())
+            if value in self.variables:
+                # A variable stands for its value: read from the values passed to the compiled function
+                dims, angle = self.variables[value]
+                self.names.add(value)
+                return Node(f"_values[{value!r}]", dims, angle, None, False)
+            if value in FUNCTIONS:
+                return self.call(value, self.arguments())
+            if value in CONSTANTS:
+                return Node(CONSTANTS[value], DIMENSIONLESS, False, None, False)
+            # A unit on its own counts as one of it: "kWh / h"
+            return self.unit_literal(Fraction(1), self.unit_text(value))
+
+        raise self.error()
+
+    def arguments(self):
+        if not self.at("operator", "("):
+            # sin 30 works like sin(30)
+            return [self.unary()]
+        self.take()
+        arguments = [self.additive()]
+        while self.at("operator", ","):
+            self.take()
+            arguments.append(self.additive())
+        if not self.at("operator", ")"):
+            raise self.error(f"Missing ')' in '{self.text}'")
+        self.take()
+        return arguments
+
+    def number(self, text):
+        # A unit written right after a number belongs to it: 5 km, 100 km/h, 3 ft²
+        kind, value, _ = self.peek()
+        if kind == "name" and value not in FUNCTIONS and value not in CONSTANTS and value not in KEYWORDS \
+                and value not in self.variables and value not in self.functions:  # 2 x multiplies by the variable x
+            return self.unit_literal(Fraction(text), self.unit_text(self.take()[1]))
+
+        # Whole numbers stay ints so results like 2 + 3 still show as 5
+        const = int(text) if text.isdigit() else float(text)
+        return Node(repr(const), DIMENSIONLESS, False, const, False)
+
+    def unit_text(self, first):
+        """Collect a unit written without spaces (km/h, m·s^-2, ft²) starting with the name `first`"""
+        parts = [first]
+        while True:
+            kind, value, spaced = self.peek()
+            next_kind, next_value, next_spaced = self.peek(1)
+            if kind == "superscript" and not spaced:
+                parts.append(self.take()[1])
+            elif kind == "operator" and value in ("/", "·") and not spaced and next_kind == "name" and not next_spaced:
+                parts.append(self.take()[1])
+                parts.append(self.take()[1])
+            elif kind == "operator" and value in ("^", "**") and not spaced and next_kind in ("number", "operator") \
+                    and self.unit_exponent_follows():
+                parts.append(self.take()[1])
+                if self.at("operator", "-"):
+                    parts.append(self.take()[1])
+                parts.append(self.take()[1])
+            else:
+                return "".join(parts)
+
+    def unit_exponent_follows(self):
+        # m^2 or m^-2 directly attached to the unit
+        kind, value, spaced = self.peek(1)
+        if kind == "operator" and value == "-":
+            kind, value, spaced = self.peek(2)
+        return kind == "number" and value.isdigit() and not spaced
+
+    def unit_literal(self, value, unit_text):
+        try:
+            unit = parse_unit(unit_text)
+        except ValueError:
+            raise self.error(f"Unknown name or unit '{unit_text}'")
+
+        self.literal_units.append((unit_text, unit))
+        is_angle = unit.dims == DIMENSIONLESS  # rad, deg, grad, turn, ...
+
+        if unit.offset:
+            # Absolute temperature (°C, °F): value * scale + offset kelvin
+            return Node(f"({float(value)!r} * {float(unit.scale)!r} + {float(unit.offset)!r})",
+                        unit.dims, False, None, True)
+        return Node(repr(float(value * unit.scale)), unit.dims, is_angle, None, False)
+
+    # --- compiling operations ---
+    def check_no_offset(self, *nodes):
+        if any(node.offset for node in nodes):
+            raise self.error("°C and °F values can't be used in calculations, convert them to K first")
+
+    def combine_same_dims(self, left, operator, right, verb):
+        self.check_no_offset(left, right)
+        if left.dims != right.dims:
+            raise self.error(f"Can't {verb} {format_dimensions(left.dims)} and {format_dimensions(right.dims)}")
+        return Node(f"({left.code} {operator} {right.code})", left.dims, left.angle or right.angle, None, False)
+
+    def multiply(self, left, right, operator):
+        self.check_no_offset(left, right)
+        sign = 1 if operator == "*" else -1
+        dims = tuple(a + sign * b for a, b in zip(left.dims, right.dims))
+        return Node(f"({left.code} {operator} {right.code})", dims, left.angle or right.angle, None, False)
+
+    def raise_to(self, base, exponent):
+        self.check_no_offset(base, exponent)
+        if exponent.dims != DIMENSIONLESS:
+            raise self.error("Exponents can't have units")
+
+        dims = base.dims
+        if dims != DIMENSIONLESS:
+            # The result's dimensions must be known while compiling, so the exponent must be a number
+            if exponent.const is None:
+                raise self.error("Quantities with units can only be raised to a plain number")
+            power = Fraction(exponent.const).limit_denominator(1000)
+            dims = tuple(d * power for d in dims)
+            if any(d.denominator != 1 for d in dims):
+                raise self.error(f"Can't raise {format_dimensions(base.dims)} to the power {exponent.const}")
+            dims = tuple(int(d) for d in dims)
+
+        return Node(f"({base.code} ** {exponent.code})", dims, False, None, False)
+
+    def call(self, name, arguments):
+        if len(arguments) != 1:
+            raise self.error(f"{name} takes one value")
+        argument = arguments[0]
+        self.check_no_offset(argument)
+        function = FUNCTIONS.get(name, name)
+
+        if name == "sqrt":
+            if any(d % 2 for d in argument.dims):
+                raise self.error(f"Can't take the square root of {format_dimensions(argument.dims)}")
+            dims = tuple(d // 2 for d in argument.dims)
+            return Node(f"sqrt({argument.code})", dims, False, None, False)
+
+        if name == "abs":
+            return Node(f"abs({argument.code})", argument.dims, argument.angle, None, False)
+
+        if argument.dims != DIMENSIONLESS:
+            raise self.error(f"{name} needs a plain number, not {format_dimensions(argument.dims)}")
+
+        code = argument.code
+        if name in TRIG_FUNCTIONS and self.angle_mode == "deg" and not argument.angle:
+            code = f"radians({code})"  # Angles with a unit (30 deg, 1 rad) are already in radians
+        code = f"{function}({code})"
+        if name in INVERSE_TRIG_FUNCTIONS and self.angle_mode == "deg":
+            code = f"degrees({code})"
+        return Node(code, DIMENSIONLESS, False, None, False)
+
+    def call_user_function(self, name, arguments):
+        arity, dims = self.functions[name]
+        if len(arguments) != arity:
+            raise self.error(f"{name} takes {arity} value{'s' if arity != 1 else ''}")
+        for argument in arguments:
+            self.check_no_offset(argument)
+            if argument.dims != DIMENSIONLESS:
+                raise self.error(f"{name} needs plain numbers, not {format_dimensions(argument.dims)}")
+        code = ", ".join(argument.code for argument in arguments)
+        self.names.add(name)
+        return Node(f"_values[{name!r}]({code})", dims, False, None, False)
+
+
+def tokenize(text):
+    """Split an expression into (kind, text, spaced_before) tokens"""
+    tokens = []
+    position = 0
+    while position < len(text):
+        match = TOKEN.match(text, position)
+        if not match or match.end() == position:
+            if text[position:].strip():
+                raise ValueError(f"Can't read the expression '{text}'")
+            break
+        kind = match.lastgroup
+        spaced = match.start(kind) > position
+        tokens.append((kind, match.group(kind), spaced))
+        position = match.end()
+    return tokens
+
+
+def split_target_unit(text):
+    """Split "5 km + 300 m in ft" into ("5 km + 300 m", "ft"); no target gives (text, None)"""
+    for match in reversed(list(re.finditer(r"(?<=\s)(in|to)(?=\s)", text))):
+        target = text[match.end():].strip()
+        if not is_unit_text(target):
+            continue
+        try:
+            parse_unit(target)
+        except ValueError:
+            continue
+        return text[:match.start()].strip(), target
+    return text, None
+
+
+def is_unit_text(text):
+    """
+    Whether a target could be units: it needs a unit symbol, and numbers only as
+    exponents or in 1/s. "2 to 3" and "3 m to 2 ft" aren't conversions.
+    """
+    if not re.search(r"[^\W\d_]|°", text):
+        return False
+    rest = re.sub(r"\^\s*[-+]?\d+(?:\.\d+)?", "", re.sub(r"^1\s*/", "", text))
+    return not re.search(r"\d", rest)
+
+
+def choose_display_unit(dims, literal_units):
+    """The unit a result without an explicit 'in ...' is shown in"""
+    if dims == DIMENSIONLESS:
+        # Plain numbers (angles typed in deg/rad also end up here)
+        return None
+
+    # The first unit typed in the expression that fits: 5 km + 300 m → km
+    for text, unit in literal_units:
+        if unit.dims == dims and not unit.offset:
+            return text
+    for text, unit in literal_units:
+        if unit.dims == dims:
+            return text
+
+    for text in DERIVED_UNITS:
+        if parse_unit(text).dims == dims:
+            return text
+    return format_dimensions(dims)
+
+
+def check_variable_name(name):
+    """Raise ValueError if `name` can't be used as a variable"""
+    tokens = tokenize(name) if name else []
+    if len(tokens) != 1 or tokens[0][0] != "name" or name.startswith("°"):
+        raise ValueError(f"'{name}' isn't a valid name")
+    if name in FUNCTIONS or name in CONSTANTS or name in KEYWORDS or name in ("in", "to"):
+        raise ValueError(f"'{name}' is a built-in name")
+
+
+@lru_cache(maxsize=512)
+def compile_expression(text, angle_mode="deg", variables=(), functions=()):
+    """
+    Parse and compile an expression (compiled expressions are cached per angle mode).
+    `variables` is a tuple of (name, dims, angle) and `functions` a tuple of
+    (name, number of values, result dims) for the names the expression may use;
+    their values and functions are passed to evaluate() in one mapping.
+    """
+    source_text, target = split_target_unit(text)
+    parser = Parser(source_text, angle_mode, variables, functions)
+    node = parser.parse()
+    names = tuple(sorted(parser.names))
+
+    unit_text = target or choose_display_unit(node.dims, parser.literal_units)
+    if unit_text is None:
+        return CompiledExpression(text, node.code, node.dims, angle_mode=angle_mode, angle=node.angle,
+                                  names=names)
+
+    unit = parse_unit(unit_text) if unit_text != format_dimensions(node.dims) else None
+    if unit is None:
+        # Shown in SI base units, e.g. "kg·m⁻¹"
+        return CompiledExpression(text, node.code, node.dims, unit_text, angle_mode=angle_mode, angle=node.angle,
+                                  names=names)
+
+    if unit.dims != node.dims:
+        raise ValueError(f"Can't convert {format_dimensions(node.dims)} to {unit_text} "
+                         f"({format_dimensions(unit.dims)})")
+
+    return CompiledExpression(text, node.code, node.dims, unit_text, angle_mode=angle_mode,
+                              scale=float(unit.scale), offset=float(unit.offset), angle=node.angle, names=names)
+
+
+def evaluate(text, angle_mode="deg"):
+    """Evaluate an expression and return the text to show on the display"""
+    compiled = compile_expression(text, angle_mode)
+    return compiled.format(compiled.evaluate())
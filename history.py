@@ -0,0 +1,245 @@
+"""
+Calculation history storage.
+
+Every calculation is kept as a small HistoryEntry (no widget per item) in a
+HistoryBuffer: a ring buffer with a fixed limit, so a long session never
+holds more than `limit` entries and adding one never moves the others.
+Nothing in here depends on Qt; the history list in the window shows the
+buffer through a model.
+
+An entry remembers the angle mode it was calculated in and keeps its
+compiled expression, so running it again (for instance in the other angle
+mode) evaluates the compiled form instead of parsing the text again.
+
+The search bar understands a small query language, parsed here so the
+database and the in-memory history answer it the same way:
+
+    sin cos          expressions containing words starting with "sin" and "cos"
+    result > 1e6     numeric comparison on the result (<, <=, =, !=, >=, >)
+    mode:advanced    only one mode
+"""
+
+import math
+import re
+import time
+from collections import namedtuple
+
+from expression import INVERSE_TRIG_FUNCTIONS, TRIG_FUNCTIONS, compile_expression
+
+DEFAULT_HISTORY_LIMIT = 10000
+HISTORY_LIMITS = [1000, 10000, 100000, 1000000]
+HISTORY_MODES = ["Standard", "Advanced"]
+SEARCH_LIMIT = 500  # results shown for a search, newest first
+ANGLE_MODE_NAMES = {"deg": "Degrees", "rad": "Radians"}
+
+# Only these functions give a different result in degrees and in radians
+ANGLE_FUNCTIONS = TRIG_FUNCTIONS + INVERSE_TRIG_FUNCTIONS
+ANGLE_FUNCTION = re.compile(r"\b(?:" + "|".join(ANGLE_FUNCTIONS) + r")\b")
+
+NUMBER = re.compile(r"[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?")
+WORD = re.compile(r"\w+")
+QUERY_TERM = re.compile(
+    r"\s*(?:mode:(?P<mode>\S*)"
+    r"|(?:result|value)\s*(?P<operator><=|>=|!=|==|=|<|>)\s*(?P<number>" + NUMBER.pattern + r")"
+    r"|(?P<term>\S+))", re.IGNORECASE)
+COMPARISONS = {
+    "<": lambda a, b: a < b, "<=": lambda a, b: a <= b, ">": lambda a, b: a > b,
+    ">=": lambda a, b: a >= b, "=": lambda a, b: a == b, "!=": lambda a, b: a != b,
+}
+
+
+def numeric_value(result):
+    """The result as a float for range searches ("12.5 km" counts as 12.5), None when it has no number"""
+    if isinstance(result, bool):
+        return None
+    if isinstance(result, int):
+        try:
+            return float(result)
+        except OverflowError:  # e.g. 200!
+            return math.copysign(math.inf, result)
+    if isinstance(result, float):
+        return None if math.isnan(result) else result
+    match = NUMBER.match(str(result).strip().replace(",", ""))
+    return float(match.group()) if match else None
+
+
+# words: lowercase prefixes looked up in the expression index; symbols: other terms
+# (like "√") matched as plain text; comparisons: (operator, number) pairs on the result
+HistoryQuery = namedtuple("HistoryQuery", "words symbols mode comparisons")
+
+
+def parse_history_query(text):
+    """Split a search into its parts; raises ValueError for an unknown mode"""
+    words, symbols, comparisons = [], [], []
+    mode = None
+    for match in QUERY_TERM.finditer(text):
+        if match.group("mode") is not None:
+            name = match.group("mode").capitalize()
+            if name not in HISTORY_MODES:
+                raise ValueError(f"Unknown mode '{match.group('mode')}'")
+            mode = name
+        elif match.group("operator"):
+            operator = "=" if match.group("operator") == "==" else match.group("operator")
+            comparisons.append((operator, float(match.group("number"))))
+        elif match.group("term"):
+            term_words = WORD.findall(match.group("term").lower())
+            if term_words:
+                words += term_words
+            else:
+                symbols.append(match.group("term"))
+    return HistoryQuery(words, symbols, mode, comparisons)
+
+
+def matches_query(entry, query):
+    """Whether an entry is found by a search (for histories that aren't in the database)"""
+    if query.mode is not None and entry.mode != query.mode:
+        return False
+    if query.comparisons:
+        value = numeric_value(entry.result)
+        if value is None or not all(COMPARISONS[operator](value, number) for operator, number in query.comparisons):
+            return False
+    expression = str(entry.expression)
+    return all(symbol in expression for symbol in query.symbols) and matches_words(expression, query.words)
+
+
+def matches_words(expression, words):
+    """Like the database index: every word has to start one of the words of the expression"""
+    expression_words = WORD.findall(expression.lower())
+    return all(any(word.startswith(prefix) for word in expression_words) for prefix in words)
+
+
+def search_entries(histories, query, limit=SEARCH_LIMIT):
+    """Newest entries of in-memory histories that match a query"""
+    found = [entry for history in histories for entry in history if matches_query(entry, query)]
+    found.sort(key=lambda entry: entry.timestamp, reverse=True)
+    return found[:limit]
+
+
+class HistoryEntry:
+    """
+    One calculation: what was typed, the result (int, float or text), the mode, when,
+    and the angle mode ("deg" / "rad", None when unknown) it was calculated in
+    """
+
+    __slots__ = ("expression", "result", "mode", "timestamp", "angle_mode", "compiled")
+
+    def __init__(self, expression, result, mode, timestamp=None, angle_mode=None, compiled=None):
+        self.expression = expression
+        self.result = result
+        self.mode = mode
+        self.timestamp = time.time() if timestamp is None else timestamp
+        self.angle_mode = angle_mode
+        self.compiled = compiled  # CompiledExpression, only kept in memory
+
+    def __repr__(self):
+        return (f"HistoryEntry({self.expression!r}, {self.result!r}, {self.mode!r}, {self.timestamp!r}, "
+                f"{self.angle_mode!r})")
+
+    def text(self):
+        """The line shown in the history list"""
+        return f"{self.expression} = {self.result}"
+
+    def depends_on_angle_mode(self):
+        return ANGLE_FUNCTION.search(str(self.expression)) is not None
+
+    def compile(self, angle_mode):
+        """The compiled expression for an angle mode; the one kept with the entry is reused"""
+        if self.compiled is None or self.compiled.angle_mode != angle_mode:
+            self.compiled = compile_expression(str(self.expression), angle_mode)
+        return self.compiled
+
+    def recalculate(self, angle_mode):
+        """
+        Run the calculation again in an angle mode and keep the new result.
+        Returns True if the result changed; raises ValueError or ArithmeticError
+        when the expression can't be calculated.
+        """
+        compiled = self.compile(angle_mode)
+        value = compiled.evaluate()
+        # Results typed on the buttons were kept as numbers, results of typed expressions as text
+        result = value if compiled.unit_text is None and not isinstance(self.result, str) else compiled.format(value)
+        changed = result != self.result
+        self.result = result
+        self.angle_mode = angle_mode
+        return changed
+
+
+class HistoryBuffer:
+    """
+    Ring buffer of the newest `limit` entries, oldest first.
+    Once it is full, every new entry takes the slot of the oldest one.
+    """
+
+    def __init__(self, limit=DEFAULT_HISTORY_LIMIT):
+        self.limit = limit
+        self.slots = []  # Grows up to limit, then slots are reused
+        self.start = 0   # Slot of the oldest entry
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, row):
+        """Entry number `row`, counting from the oldest"""
+        if not 0 <= row < self.count:
+            raise IndexError("history row out of range")
+        return self.slots[(self.start + row) % self.limit]
+
+    def __iter__(self):
+        for row in range(self.count):
+            yield self.slots[(self.start + row) % self.limit]
+
+    def is_full(self):
+        return self.count == self.limit
+
+    def append(self, entry):
+        """Add an entry as the newest one (the oldest is dropped when the buffer is full)"""
+        if self.count == self.limit:
+            self.popleft()
+        slot = (self.start + self.count) % self.limit
+        if slot == len(self.slots):
+            self.slots.append(entry)
+        else:
+            self.slots[slot] = entry
+        self.count += 1
+
+    def popleft(self):
+        """Remove and return the oldest entry"""
+        if not self.count:
+            raise IndexError("pop from an empty history")
+        entry = self.slots[self.start]
+        self.slots[self.start] = None
+        self.start = (self.start + 1) % self.limit
+        self.count -= 1
+        return entry
+
+    def clear(self):
+        self.slots = []
+        self.start = self.count = 0
+
+    def out_of_sync(self):
+        """Only PersistentHistory can be changed by another process"""
+        return False
+
+    def recalculate(self, row, angle_mode):
+        """Run entry `row` again in an angle mode; returns True if its result changed"""
+        return self[row].recalculate(angle_mode)
+
+    def recalculate_all(self, angle_mode):
+        """Run every entry that depends on the angle mode again; returns the number of changed results"""
+        changed = 0
+        for entry in self:
+            if entry.angle_mode != angle_mode and entry.depends_on_angle_mode():
+                try:
+                    changed += entry.recalculate(angle_mode)
+                except (ValueError, ArithmeticError):
+                    pass  # e.g. asin(2) in degrees; the entry keeps its old result
+        return changed
+
+    def resize(self, limit):
+        """Change the limit, keeping the newest entries that still fit"""
+        entries = list(self)[-limit:]
+        self.limit = limit
+        self.slots = entries
+        self.start = 0
+        self.count = len(entries)
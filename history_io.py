@@ -0,0 +1,155 @@
+"""
+Export the calculation history to CSV or JSON Lines, and import it back.
+
+    python history_io.py export history.csv
+    python history_io.py export advanced.jsonl --mode advanced
+    python history_io.py import history.csv
+
+Both directions stream: an export writes the rows while the database reads
+them, and an import reads the file while the store adds it in batches (see
+HistoryStore.import_entries), so neither keeps the whole history in memory.
+Timestamps are written as Unix seconds with every digit, so importing an
+export again recognizes every entry as one that is already there.
+"""
+
+import argparse
+import csv
+import json
+import math
+import re
+import sqlite3
+import sys
+
+from history import HISTORY_MODES, HistoryEntry
+from history_store import HISTORY_PATH, HistoryStore, storable
+
+HISTORY_FORMATS = {".csv": "csv", ".jsonl": "jsonl", ".ndjson": "jsonl"}
+FIELDS = ["mode", "expression", "result", "timestamp"]  # needed to import a CSV file
+ANGLE_MODES = ("deg", "rad")
+
+INTEGER = re.compile(r"[-+]?\d+")
+
+
+def file_format(path, history_format=None):
+    """The format given, else the one the file name ends with"""
+    if history_format is not None:
+        return history_format
+    extension = path[path.rfind("."):].lower() if "." in path else ""
+    if extension not in HISTORY_FORMATS:
+        raise ValueError(f"Can't tell the format of {path}, use .csv or .jsonl")
+    return HISTORY_FORMATS[extension]
+
+
+def csv_result(text):
+    """CSV only has text: turn numbers back into int or float results"""
+    if INTEGER.fullmatch(text):
+        return int(text)
+    try:
+        value = float(text)
+    except ValueError:
+        return text
+    # "nan" and "inf" stay text, they are results like any other message
+    return value if math.isfinite(value) else text
+
+
+def write_history(out, entries, history_format):
+    """Write entries to an open text file; returns how many were written"""
+    count = 0
+    if history_format == "csv":
+        writer = csv.writer(out, lineterminator="\n")
+        writer.writerow(FIELDS + ["angle_mode"])
+        for entry in entries:
+            writer.writerow([entry.mode, entry.expression, entry.result, repr(entry.timestamp), entry.angle_mode or ""])
+            count += 1
+    else:
+        for entry in entries:
+            out.write(json.dumps({"mode": entry.mode, "expression": entry.expression,
+                                  "result": storable(entry.result), "timestamp": entry.timestamp,
+                                  "angle_mode": entry.angle_mode},
+                                 ensure_ascii=False) + "\n")
+            count += 1
+    return count
+
+
+def read_history(file, history_format, where="history file"):
+    """Yield the entries of an open text file one at a time"""
+    if history_format == "csv":
+        reader = csv.DictReader(file)
+        missing = set(FIELDS) - set(reader.fieldnames or ())
+        if missing:
+            raise ValueError(f"{where}: no '{sorted(missing)[0]}' column")
+        records = ((reader.line_num, row) for row in reader)
+    else:
+        records = ((number, line) for number, line in enumerate(file, 1) if line.strip())
+
+    for number, record in records:
+        try:
+            if history_format == "jsonl":
+                record = json.loads(record)
+            mode = str(record["mode"]).capitalize()
+            if mode not in HISTORY_MODES:
+                raise ValueError(f"unknown mode '{record['mode']}'")
+            result = record["result"]
+            if history_format == "csv":
+                result = csv_result(result)
+            # Files written before the angle mode was kept don't have it
+            angle_mode = record.get("angle_mode") or None
+            if angle_mode not in ANGLE_MODES + (None,):
+                raise ValueError(f"unknown angle mode '{angle_mode}'")
+            yield HistoryEntry(str(record["expression"]), result, mode, float(record["timestamp"]), angle_mode)
+        except (KeyError, TypeError, ValueError) as error:  # JSON syntax errors are ValueErrors too
+            raise ValueError(f"{where}, line {number}: {error}")
+
+
+def export_history(store, path, history_format=None, mode=None):
+    """Write the stored history (or one mode of it) to a file; returns the number of entries"""
+    history_format = file_format(path, history_format)
+    store.flush()  # Entries still waiting for the writer belong in the export too
+    with open(path, "w", newline="", encoding="utf-8") as out:
+        return write_history(out, store.entries(mode), history_format)
+
+
+def import_history(store, path, history_format=None):
+    """Add the entries of a file to the store; returns (added, skipped as already stored)"""
+    history_format = file_format(path, history_format)
+    with open(path, newline="", encoding="utf-8") as file:
+        return store.import_entries(read_history(file, history_format, path))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export or import the calculation history")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export = commands.add_parser("export", help="Write the history to a CSV or JSON Lines file")
+    export.add_argument("path")
+    export.add_argument("--mode", choices=[mode.lower() for mode in HISTORY_MODES], help="Only one mode")
+
+    load = commands.add_parser("import", help="Add the entries of a CSV or JSON Lines file to the history")
+    load.add_argument("path")
+
+    for command in (export, load):
+        command.add_argument("--format", choices=sorted(set(HISTORY_FORMATS.values())),
+                             help="File format (default: from the file name)")
+        command.add_argument("--database", default=HISTORY_PATH, help="History database to use")
+
+    args = parser.parse_args(argv)
+    try:
+        store = HistoryStore(args.database)
+        try:
+            if args.command == "export":
+                mode = args.mode.capitalize() if args.mode else None
+                count = export_history(store, args.path, args.format, mode)
+                print(f"Exported {count} entries to {args.path}")
+            else:
+                added, skipped = import_history(store, args.path, args.format)
+                print(f"Imported {added} entries, skipped {skipped} that were already in the history")
+        finally:
+            store.close()
+    except (ValueError, OSError, sqlite3.Error) as error:
+        print(f"Error: {error}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
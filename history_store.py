@@ -0,0 +1,518 @@
+"""
+History that survives restarts: a SQLite database in WAL mode.
+
+The window never waits for the disk. New entries go into a queue and a
+background thread writes whatever has piled up in one transaction. Reading
+is lazy: PersistentHistory only asks the database for the bounds of the
+stored history when it is created (two index lookups, however long the
+history is) and loads rows a page at a time when the list scrolls to them.
+
+Every mode numbers its entries with a running `seq`, so row n of the list is
+simply seq first + n and a page of rows is one range scan on (mode, seq).
+
+Searches use indexes too: words are looked up in an FTS5 index of the
+expressions and result comparisons in an index on the numeric value of the
+result (see parse_history_query in history.py for the query language). Only
+symbols that aren't words, like "√", are found by reading the expressions.
+"""
+
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from itertools import islice
+
+from history import ANGLE_FUNCTIONS, DEFAULT_HISTORY_LIMIT, SEARCH_LIMIT, HistoryBuffer, HistoryEntry, \
+    matches_words, numeric_value
+
+HISTORY_PATH = os.path.join(os.path.expanduser("~"), ".python_calculator", "history.sqlite3")
+
+BATCH_SIZE = 500     # entries written per transaction at most
+BATCH_DELAY = 0.05   # seconds the writer waits for more entries before writing
+PAGE_SIZE = 256      # rows read from the database at a time
+CACHED_PAGES = 64
+RANGE_SCAN_LIMIT = 5000  # a word search within a result range this small reads the range instead
+IMPORT_BATCH = 10000     # imported entries written per transaction
+
+# Bump when the tables change; migrate() brings older databases up to date
+SCHEMA_VERSION = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS history (
+    id INTEGER PRIMARY KEY,      -- in the order the entries were added
+    mode TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    expression TEXT NOT NULL,
+    result,                      -- no type: integers, floats and text are stored as they are
+    value REAL,                  -- the result as a number for range searches, NULL if it has none
+    timestamp REAL NOT NULL,
+    angle_mode TEXT,             -- "deg" / "rad" the result was calculated in
+    UNIQUE (mode, seq)
+);
+CREATE INDEX IF NOT EXISTS history_value ON history (value);
+CREATE INDEX IF NOT EXISTS history_timestamp ON history (timestamp);  -- finds duplicates when importing
+
+-- Full-text index of the expressions; it stores no text itself, only the index.
+-- Rows are indexed a whole batch per statement (see index_new_rows), not by triggers:
+-- with a trigger FTS5 updates its index one row at a time, which is several times slower
+CREATE VIRTUAL TABLE IF NOT EXISTS history_fts USING fts5(expression, content='history', content_rowid='id');
+
+CREATE TABLE IF NOT EXISTS settings (
+    key TEXT PRIMARY KEY,
+    value
+);
+"""
+
+# Adds the imported entries that aren't stored yet (nor earlier in the same batch), numbered
+# on from the last seq of their mode. SQLite runs the whole SELECT before it inserts anything.
+INSERT_IMPORTED = """
+INSERT INTO history (mode, seq, expression, result, value, timestamp, angle_mode)
+SELECT mode,
+       (SELECT coalesce(max(seq) + 1, 0) FROM history h WHERE h.mode = i.mode)
+           + row_number() OVER (PARTITION BY mode ORDER BY i.rowid) - 1,
+       expression, result, value, timestamp, angle_mode
+FROM incoming i
+WHERE i.rowid = (SELECT min(d.rowid) FROM incoming d
+                 WHERE d.timestamp = i.timestamp AND d.mode = i.mode AND d.expression = i.expression)
+  AND NOT EXISTS (SELECT 1 FROM history h
+                  WHERE h.timestamp = i.timestamp AND h.mode = i.mode AND h.expression = i.expression)
+"""
+
+
+def last_id(connection):
+    return connection.execute("SELECT coalesce(max(id), 0) FROM history").fetchone()[0]
+
+
+def index_new_rows(connection, after_id):
+    """Add the rows with an id above after_id to the search index"""
+    connection.execute("INSERT INTO history_fts (rowid, expression) SELECT id, expression FROM history WHERE id > ?",
+                       (after_id,))
+
+
+def delete_rows(connection, where, parameters):
+    """Delete history rows, and take them out of the search index first"""
+    connection.execute("INSERT INTO history_fts (history_fts, rowid, expression) "
+                       f"SELECT 'delete', id, expression FROM history WHERE {where}", parameters)
+    connection.execute(f"DELETE FROM history WHERE {where}", parameters)
+
+
+def storable(result):
+    """SQLite stores 64-bit integers, floats and text; anything else is stored as text"""
+    if isinstance(result, bool) or not isinstance(result, (int, float, str)):
+        return str(result)
+    if isinstance(result, int) and not -2 ** 63 <= result < 2 ** 63:
+        return str(result)  # e.g. 30!
+    return result
+
+
+class HistoryStore:
+    """The history database: reads on the calling thread, writes on a background thread"""
+
+    def __init__(self, path=HISTORY_PATH):
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        self.connection = sqlite3.connect(path)
+        # WAL lets the list read while the writer thread is in the middle of a transaction
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.migrate()
+
+        self.queue = queue.Queue()
+        # Modes whose new entries the writer stored after entries another process
+        # (an import from the command line) added, not at the seq the window gave them
+        self.renumbered = set()
+        self.writer = threading.Thread(target=self.write_batches, name="history-writer", daemon=True)
+        self.writer.start()
+
+    def migrate(self):
+        """Create the tables, or update the ones written by an older version"""
+        version = self.connection.execute("PRAGMA user_version").fetchone()[0]
+        # Version 0 had no id, numeric value or search index
+        old_history = version < 1 and self.connection.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'history'").fetchone() is not None
+        # All in one transaction, so an interrupted migration leaves the old table as it was
+        rename = "ALTER TABLE history RENAME TO history_v0;" if old_history else ""
+        # Version 1 kept the search index up to date with triggers
+        triggers = "DROP TRIGGER IF EXISTS history_insert; DROP TRIGGER IF EXISTS history_delete;"
+        # Versions 1 and 2 didn't keep the angle mode
+        angle_mode = "ALTER TABLE history ADD COLUMN angle_mode TEXT;" if 1 <= version < 3 else ""
+        self.connection.executescript("BEGIN;" + rename + triggers + SCHEMA + angle_mode)
+        if old_history:
+            rows = self.connection.execute(
+                "SELECT mode, seq, expression, result, timestamp FROM history_v0 ORDER BY timestamp, seq")
+            self.connection.executemany(
+                "INSERT INTO history (mode, seq, expression, result, value, timestamp) VALUES (?, ?, ?, ?, ?, ?)",
+                ((mode, seq, expression, result, numeric_value(result), timestamp)
+                 for mode, seq, expression, result, timestamp in rows))
+            self.connection.execute("DROP TABLE history_v0")
+            index_new_rows(self.connection, 0)
+        self.connection.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self.connection.commit()
+
+    # --- Reading (on the UI thread) ---
+
+    def bounds(self, mode):
+        """(first seq, next seq) of a mode; both are single lookups on the (mode, seq) index"""
+        # Two queries: SQLite only answers min() or max() from the end of an index when it is alone
+        first = self.connection.execute("SELECT min(seq) FROM history WHERE mode = ?", (mode,)).fetchone()[0]
+        last = self.connection.execute("SELECT max(seq) FROM history WHERE mode = ?", (mode,)).fetchone()[0]
+        if first is None:
+            return 0, 0
+        return first, last + 1
+
+    def fetch(self, mode, first_seq, last_seq):
+        """Entries with first_seq <= seq <= last_seq as {seq: HistoryEntry}"""
+        rows = self.connection.execute(
+            "SELECT seq, expression, result, timestamp, angle_mode FROM history "
+            "WHERE mode = ? AND seq BETWEEN ? AND ?", (mode, first_seq, last_seq))
+        return {seq: HistoryEntry(expression, result, mode, timestamp, angle_mode)
+                for seq, expression, result, timestamp, angle_mode in rows}
+
+    def search(self, query, limit=SEARCH_LIMIT):
+        """
+        Entries found by a HistoryQuery, newest first. A search made only of result
+        comparisons comes in order of the result, straight from the value index.
+        """
+        conditions, parameters = [], []
+        for symbol in query.symbols:
+            conditions.append("instr(h.expression, ?) > 0")  # symbols aren't in the word index
+            parameters.append(symbol)
+        if query.mode is not None:
+            conditions.append("h.mode = ?")
+            parameters.append(query.mode)
+        ranges, range_parameters = [], []
+        for operator, number in query.comparisons:
+            ranges.append(f"h.value {operator} ?")  # operator is one of the COMPARISONS in history.py
+            range_parameters.append(number)
+
+        columns = "h.mode, h.expression, h.result, h.timestamp, h.angle_mode"
+        # Without INDEXED BY SQLite may rather walk the whole table in id order or by mode
+        in_range = "history h INDEXED BY history_value"
+        if query.comparisons and not query.words:
+            rows = self.connection.execute(
+                f"SELECT {columns} FROM {in_range} WHERE {' AND '.join(ranges + conditions)} "
+                "ORDER BY h.value LIMIT ?", range_parameters + parameters + [limit])
+        elif query.words and not (query.comparisons and self.few_in_range(ranges, range_parameters)):
+            # Walk the word index from the newest match and stop at the limit (CROSS JOIN: see angle_dependent)
+            conditions.insert(0, "history_fts MATCH ?")
+            parameters.insert(0, " AND ".join(f'"{word}"*' for word in query.words))  # prefix searches
+            rows = self.connection.execute(
+                f"SELECT {columns} FROM history_fts CROSS JOIN history h ON h.id = history_fts.rowid "
+                f"WHERE {' AND '.join(conditions + ranges)} ORDER BY history_fts.rowid DESC LIMIT ?",
+                parameters + range_parameters + [limit])
+        elif query.words:
+            # Only a few results are in range: read them all and match the words here
+            rows = self.connection.execute(
+                f"SELECT {columns} FROM {in_range} WHERE {' AND '.join(ranges + conditions)} ORDER BY h.id DESC",
+                range_parameters + parameters)
+            rows = [row for row in rows if matches_words(row[1], query.words)][:limit]
+        else:
+            where = " WHERE " + " AND ".join(conditions) if conditions else ""
+            # Within a mode seq follows the order of id, and (mode, seq) is indexed
+            order = "h.seq" if query.mode is not None else "h.id"
+            rows = self.connection.execute(
+                f"SELECT {columns} FROM history h{where} ORDER BY {order} DESC LIMIT ?", parameters + [limit])
+        return [HistoryEntry(expression, result, mode, timestamp, angle_mode)
+                for mode, expression, result, timestamp, angle_mode in rows]
+
+    def few_in_range(self, ranges, parameters):
+        """Whether at most RANGE_SCAN_LIMIT entries are in range (a short count on the value index)"""
+        count = self.connection.execute(
+            f"SELECT count(*) FROM (SELECT 1 FROM history h WHERE {' AND '.join(ranges)} LIMIT ?)",
+            parameters + [RANGE_SCAN_LIMIT + 1]).fetchone()[0]
+        return count <= RANGE_SCAN_LIMIT
+
+    def entries(self, mode=None):
+        """Every stored entry (or those of one mode), oldest first, read as the caller goes"""
+        if mode is None:
+            rows = self.connection.execute(
+                "SELECT mode, expression, result, timestamp, angle_mode FROM history ORDER BY id")
+        else:
+            rows = self.connection.execute(
+                "SELECT mode, expression, result, timestamp, angle_mode FROM history WHERE mode = ? ORDER BY seq",
+                (mode,))
+        for mode, expression, result, timestamp, angle_mode in rows:
+            yield HistoryEntry(expression, result, mode, timestamp, angle_mode)
+
+    def angle_dependent(self, mode, angle_mode, first_seq=0):
+        """
+        (seq, entry) of the entries of a mode that use sin, cos, tan or their inverses and
+        were calculated in another angle mode; the search index finds them
+        """
+        # CROSS JOIN keeps the word index as the outer loop: looking up every row of
+        # the mode in the index instead would take a full-text query per row
+        rows = self.connection.execute(
+            "SELECT h.seq, h.expression, h.result, h.timestamp, h.angle_mode "
+            "FROM history_fts CROSS JOIN history h ON h.id = history_fts.rowid "
+            "WHERE history_fts MATCH ? AND h.mode = ? AND h.seq >= ? AND h.angle_mode IS NOT ?",
+            (" OR ".join(ANGLE_FUNCTIONS), mode, first_seq, angle_mode))
+        for seq, expression, result, timestamp, entry_angle_mode in rows:
+            yield seq, HistoryEntry(expression, result, mode, timestamp, entry_angle_mode)
+
+    def setting(self, key, default=None):
+        row = self.connection.execute("SELECT value FROM settings WHERE key = ?", (key,)).fetchone()
+        return default if row is None else row[0]
+
+    # --- Importing (on the calling thread, the histories are reloaded afterwards) ---
+
+    def import_entries(self, entries):
+        """
+        Add entries after the stored ones, IMPORT_BATCH per transaction. Entries with the
+        mode, time and expression of one that is already stored are skipped.
+        Returns (added, skipped); when reading the entries fails, the batches written
+        so far stay.
+        """
+        self.flush()  # Imported entries are numbered after everything that is queued
+        self.connection.execute("PRAGMA temp_store = MEMORY")
+        self.connection.executescript("""
+            CREATE TEMP TABLE IF NOT EXISTS incoming (mode, expression, result, value, timestamp, angle_mode);
+            CREATE INDEX IF NOT EXISTS temp.incoming_timestamp ON incoming (timestamp);
+        """)
+
+        added = skipped = 0
+        entries = iter(entries)
+        while True:
+            batch = [(entry.mode, entry.expression, storable(entry.result), numeric_value(entry.result),
+                      entry.timestamp, entry.angle_mode) for entry in islice(entries, IMPORT_BATCH)]
+            if not batch:
+                break
+            with self.connection:
+                self.connection.execute("DELETE FROM incoming")
+                self.connection.executemany("INSERT INTO incoming VALUES (?, ?, ?, ?, ?, ?)", batch)
+                after_id = last_id(self.connection)
+                batch_added = self.connection.execute(INSERT_IMPORTED).rowcount
+                index_new_rows(self.connection, after_id)
+            added += batch_added
+            skipped += len(batch) - batch_added
+        return added, skipped
+
+    # --- Writing (queued for the writer thread) ---
+
+    def set_setting(self, key, value):
+        self.queue.put(("setting", (key, value)))
+
+    def add(self, mode, seq, entry):
+        self.queue.put(("add", (mode, seq, entry.expression, storable(entry.result),
+                                numeric_value(entry.result), entry.timestamp, entry.angle_mode)))
+
+    def update(self, mode, entry):
+        """Store the new result of an entry that was calculated again"""
+        # Found by its time and expression, like duplicates are when importing: its seq may
+        # not be the one the window knows (see write_adds)
+        self.queue.put(("update", (storable(entry.result), numeric_value(entry.result), entry.angle_mode,
+                                   mode, entry.timestamp, entry.expression)))
+
+    def trim(self, mode, first_seq):
+        """Delete the entries of a mode before first_seq"""
+        self.queue.put(("trim", (mode, first_seq)))
+
+    def clear(self, mode):
+        self.queue.put(("clear", (mode,)))
+
+    def flush(self):
+        """Wait until everything queued so far is on disk"""
+        self.queue.join()
+
+    def close(self):
+        if self.writer.is_alive():
+            self.queue.put(("close", None))
+            self.writer.join()
+            self.connection.close()
+
+    def write_batches(self):
+        connection = sqlite3.connect(self.path)
+        running = True
+        while running:
+            batch = [self.queue.get()]
+            # Entries that arrive while we wait a moment are written in the same transaction
+            deadline = time.monotonic() + BATCH_DELAY
+            while len(batch) < BATCH_SIZE and batch[-1][0] != "close":
+                try:
+                    batch.append(self.queue.get(timeout=max(0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+
+            try:
+                running = self.write(connection, batch)
+            except sqlite3.Error as error:
+                # A failed write loses those entries but must not stop the history
+                print(f"Couldn't save {len(batch)} history changes: {error}", file=sys.stderr)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+        connection.close()
+
+    def write(self, connection, batch):
+        """Write one batch in one transaction; returns False when the store is closing"""
+        running = True
+        with connection:
+            adds = []
+            trims = {}
+            for command, arguments in batch:
+                if command == "add":
+                    adds.append(arguments)
+                    continue
+                if command == "trim":
+                    # Only the last trim of a mode matters
+                    trims[arguments[0]] = arguments[1]
+                    continue
+
+                # Keep the order: entries added before a clear are cleared too
+                self.write_adds(connection, adds, trims)
+                adds, trims = [], {}
+                if command == "update":
+                    connection.execute("UPDATE history SET result = ?, value = ?, angle_mode = ? "
+                                       "WHERE mode = ? AND timestamp = ? AND expression = ?", arguments)
+                elif command == "clear":
+                    delete_rows(connection, "mode = ?", arguments)
+                elif command == "setting":
+                    connection.execute("INSERT OR REPLACE INTO settings VALUES (?, ?)", arguments)
+                elif command == "close":
+                    running = False
+            self.write_adds(connection, adds, trims)
+        return running
+
+    def write_adds(self, connection, adds, trims):
+        if adds:
+            after_id = last_id(connection)
+            # Entries imported by another process (bulk import from the command line) may have
+            # taken the seqs the window gave its entries; they then go after them instead of being
+            # lost, and the window has to read its bounds again (PersistentHistory.out_of_sync)
+            first_seqs = {}
+            for mode, seq, *_ in adds:
+                first_seqs.setdefault(mode, seq)
+            for mode, seq in first_seqs.items():
+                last = connection.execute("SELECT max(seq) FROM history WHERE mode = ?", (mode,)).fetchone()[0]
+                if last is not None and last >= seq:
+                    self.renumbered.add(mode)
+            connection.executemany(
+                "INSERT INTO history (mode, seq, expression, result, value, timestamp, angle_mode) "
+                "VALUES (?1, max(?2, (SELECT coalesce(max(seq) + 1, 0) FROM history WHERE mode = ?1)), "
+                "?3, ?4, ?5, ?6, ?7)", adds)
+            index_new_rows(connection, after_id)
+        for mode, first_seq in trims.items():
+            delete_rows(connection, "mode = ? AND seq < ?", (mode, first_seq))
+
+
+class PersistentHistory:
+    """
+    The history of one mode, with the same interface as HistoryBuffer.
+    Entries from this session are kept in memory, older ones are read from the
+    database a page at a time when they are needed.
+    """
+
+    def __init__(self, store, mode, limit=DEFAULT_HISTORY_LIMIT):
+        self.store = store
+        self.mode = mode
+        self.limit = limit
+        self.recent = HistoryBuffer(limit)
+        self.pages = OrderedDict()  # page number → {seq: entry}, least recently used first
+        self.load_bounds()
+
+    def load_bounds(self):
+        self.first, self.next_seq = self.store.bounds(self.mode)
+        if self.next_seq - self.first > self.limit:
+            self.first = self.next_seq - self.limit
+            self.store.trim(self.mode, self.first)
+
+    def __len__(self):
+        return self.next_seq - self.first
+
+    def __getitem__(self, row):
+        if not 0 <= row < len(self):
+            raise IndexError("history row out of range")
+        seq = self.first + row
+
+        recent_first = self.next_seq - len(self.recent)
+        if seq >= recent_first:
+            return self.recent[seq - recent_first]
+
+        page_number = seq // PAGE_SIZE
+        page = self.pages.get(page_number)
+        if page is None:
+            page = self.store.fetch(self.mode, page_number * PAGE_SIZE, page_number * PAGE_SIZE + PAGE_SIZE - 1)
+            self.pages[page_number] = page
+            if len(self.pages) > CACHED_PAGES:
+                self.pages.popitem(last=False)
+        else:
+            self.pages.move_to_end(page_number)
+        # A row can only be missing if writing it failed
+        return page.get(seq) or HistoryEntry("", "", self.mode, 0)
+
+    def __iter__(self):
+        for row in range(len(self)):
+            yield self[row]
+
+    def is_full(self):
+        return len(self) >= self.limit
+
+    def append(self, entry):
+        if self.is_full():
+            self.popleft()
+        self.store.add(self.mode, self.next_seq, entry)
+        self.recent.append(entry)
+        self.next_seq += 1
+
+    def popleft(self):
+        entry = self[0]
+        self.first += 1
+        if len(self.recent) > len(self):
+            self.recent.popleft()
+        self.store.trim(self.mode, self.first)
+        return entry
+
+    def clear(self):
+        self.store.clear(self.mode)
+        self.recent.clear()
+        self.pages.clear()
+        self.first = self.next_seq
+
+    def recalculate(self, row, angle_mode):
+        """Run entry `row` again in an angle mode; returns True if its result changed"""
+        entry = self[row]
+        changed = entry.recalculate(angle_mode)
+        self.store.update(self.mode, entry)
+        return changed
+
+    def recalculate_all(self, angle_mode):
+        """Run every entry that depends on the angle mode again; returns the number of changed results"""
+        self.store.flush()
+        if self.out_of_sync():
+            self.reload()
+        changed = 0
+        for _, entry in self.store.angle_dependent(self.mode, angle_mode, self.first):
+            try:
+                changed += entry.recalculate(angle_mode)
+            except (ValueError, ArithmeticError):
+                continue  # The entry keeps its old result
+            self.store.update(self.mode, entry)
+        # The entries of this session are also in memory, with their compiled expressions
+        self.recent.recalculate_all(angle_mode)
+        # The cached pages are read again, so the new results have to be on disk first
+        self.store.flush()
+        self.pages.clear()
+        return changed
+
+    def out_of_sync(self):
+        """Whether another process added entries at seqs this history gave its own; reload() then"""
+        return self.mode in self.store.renumbered
+
+    def reload(self):
+        """Start over from the database, after entries were imported into it"""
+        self.store.flush()
+        self.store.renumbered.discard(self.mode)
+        self.recent.clear()
+        self.pages.clear()
+        self.load_bounds()
+
+    def resize(self, limit):
+        self.limit = limit
+        self.recent.resize(limit)
+        self.pages.clear()
+        # Rows that were dropped before can't come back, only the ones still stored count
+        self.store.flush()
+        self.load_bounds()
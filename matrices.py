@@ -0,0 +1,161 @@
+"""
+Matrices for the Matrix page: NumPy float64 arrays and the linear algebra on them.
+
+The grid editor writes every cell straight into a C-contiguous float64 array
+(no list of strings to convert before each operation), and every operation is
+one call into NumPy, which hands it to BLAS / LAPACK: a 1000×1000 product,
+inverse or solve takes milliseconds. NumPy is needed.
+"""
+
+import math
+
+from conversions import np
+
+MAX_SIZE = 5000  # rows or columns of a matrix in the editor
+MATRIX_FILE_FILTER = "Matrices (*.txt *.csv *.tsv *.npy)"
+
+
+def require_numpy():
+    if np is None:
+        raise RuntimeError("NumPy is needed for matrices (pip install numpy)")
+
+
+def new_matrix(rows, columns):
+    require_numpy()
+    return np.zeros((rows, columns))
+
+
+def resized(matrix, rows, columns):
+    """A copy with another size: the overlapping cells are kept, new ones are 0"""
+    result = np.zeros((rows, columns), dtype=matrix.dtype)
+    keep_rows, keep_columns = min(rows, matrix.shape[0]), min(columns, matrix.shape[1])
+    result[:keep_rows, :keep_columns] = matrix[:keep_rows, :keep_columns]
+    return result
+
+
+def as_matrix(values):
+    """A 2-D C-contiguous float64 array (a vector becomes one column)"""
+    matrix = np.ascontiguousarray(values, dtype=np.float64)
+    if matrix.ndim == 1:
+        matrix = matrix.reshape(-1, 1)
+    if matrix.ndim != 2 or not matrix.size:
+        raise ValueError("A matrix needs rows and columns of numbers")
+    if max(matrix.shape) > MAX_SIZE:
+        raise ValueError(f"Matrices can have at most {MAX_SIZE} rows and columns")
+    return matrix
+
+
+def parse_matrix(text):
+    """Rows on lines (or separated by ;), numbers separated by spaces, commas or tabs"""
+    require_numpy()
+    rows = [row for row in text.replace(";", "\n").splitlines() if row.strip()]
+    if not rows:
+        raise ValueError("There is no matrix to read")
+    width = len(rows[0].replace(",", " ").split())
+    try:
+        values = np.array(" ".join(rows).replace(",", " ").split(), dtype=np.float64)
+    except ValueError as error:
+        raise ValueError(f"Can't read the matrix: {error}")
+    if width == 0 or len(values) != width * len(rows):
+        raise ValueError("Every row of a matrix needs the same number of values")
+    return as_matrix(values.reshape(len(rows), width))
+
+
+def load_matrix(path):
+    """Read a matrix from a .npy file or a text file of rows"""
+    require_numpy()
+    if path.lower().endswith(".npy"):
+        return as_matrix(np.load(path, allow_pickle=False))
+    with open(path, encoding="utf-8") as file:
+        return parse_matrix(file.read())
+
+
+def save_matrix(path, matrix):
+    require_numpy()
+    if path.lower().endswith(".npy"):
+        np.save(path, matrix)
+    else:
+        np.savetxt(path, matrix, fmt="%.17g", delimiter="," if path.lower().endswith(".csv") else " ")
+
+
+def check_square(matrix, name="A"):
+    if matrix.shape[0] != matrix.shape[1]:
+        raise ValueError(f"{name} has to be square, it is {matrix.shape[0]}×{matrix.shape[1]}")
+
+
+def multiply(a, b):
+    if a.shape[1] != b.shape[0]:
+        raise ValueError(f"Can't multiply {a.shape[0]}×{a.shape[1]} by {b.shape[0]}×{b.shape[1]}: "
+                         f"A needs as many columns as B has rows")
+    return a @ b
+
+
+def inverse(a):
+    check_square(a)
+    try:
+        return np.linalg.inv(a)
+    except np.linalg.LinAlgError:
+        raise ValueError("A is singular, it has no inverse")
+
+
+def determinant(a):
+    """det A as a float, or as text like "-3.2e+512" when it is too big (or too small) for a float"""
+    check_square(a)
+    # From the LU factorization as a sign and a logarithm, so big matrices don't overflow
+    sign, log = np.linalg.slogdet(a)
+    if sign == 0:
+        return 0.0
+    if -708 < log < 709:
+        return float(sign * math.exp(log))
+    exponent, fraction = divmod(log / math.log(10), 1)
+    mantissa = round(10 ** fraction, 5)
+    if mantissa >= 10:  # 9.999996 rounds up to the next power of ten
+        mantissa, exponent = mantissa / 10, exponent + 1
+    return f"{sign * mantissa:.6g}e{int(exponent):+d}"
+
+
+def rank(a):
+    return int(np.linalg.matrix_rank(a))
+
+
+def eigen(a):
+    """(eigenvalues, eigenvectors as columns); real for symmetric matrices, complex otherwise"""
+    check_square(a)
+    try:
+        if np.array_equal(a, a.T):
+            return np.linalg.eigh(a)  # Faster, and the values come out real and sorted
+        return np.linalg.eig(a)
+    except np.linalg.LinAlgError:
+        raise ValueError("The eigenvalues of A didn't converge")
+
+
+def solve(a, b):
+    """x with A x = B (B can have several columns)"""
+    check_square(a)
+    if b.shape[0] != a.shape[0]:
+        raise ValueError(f"B needs {a.shape[0]} rows to solve A x = B, it has {b.shape[0]}")
+    try:
+        return np.linalg.solve(a, b)
+    except np.linalg.LinAlgError:
+        raise ValueError("A is singular, A x = B has no single solution")
+
+
+def format_value(value):
+    """Text of one cell (complex values from eigen() too)"""
+    if isinstance(value, complex) or np.iscomplexobj(value):
+        value = complex(value)
+        if value.imag == 0:
+            return f"{value.real:.10g}"
+        return f"{value.real:.6g}{value.imag:+.6g}i"
+    return f"{value:.10g}"
+
+
+# Operation on the Matrix page → function of (A, B) giving [(title, matrix or number), ...]
+OPERATIONS = {
+    "A × B": lambda a, b: [("A × B", multiply(a, b))],
+    "A⁻¹": lambda a, b: [("A⁻¹", inverse(a))],
+    "det A": lambda a, b: [("det A", determinant(a))],
+    "rank A": lambda a, b: [("rank A", rank(a))],
+    "eig A": lambda a, b: list(zip(("Eigenvalues", "Eigenvectors"), eigen(a))),
+    "Solve A x = B": lambda a, b: [("x", solve(a, b))],
+}
@@ -0,0 +1,175 @@
+"""
+Sampling curves y = f(x) for the Graph page.
+
+A Curve keeps the samples it has evaluated (sorted by x) and only adds to
+them when the view needs more:
+
+- a range that comes into view when panning is sampled on a coarse grid;
+- the visible samples are refined where the curve bends: an interval is
+  split when a sample is further than TOLERANCE pixels from the straight
+  line through its neighbours (and where the function starts or stops
+  having values), so straight stretches stay sparse and only the new
+  midpoints are evaluated, all at once with NumPy;
+- what is drawn is decimated to the pixel columns of the view: the first,
+  lowest, highest and last sample of each column, which draws exactly like
+  every sample but stays a few points per column however dense the cache is.
+
+Nothing in here depends on Qt. NumPy is needed.
+"""
+
+from collections import namedtuple
+
+from conversions import np
+
+BASE_SPACING = 8.0     # pixels between the samples of a newly visible range
+MIN_SPACING = 0.5      # narrower intervals (in pixels) aren't split any further
+MAX_SPACING = 12.0     # wider intervals are split even where the curve looks straight (after zooming in)
+TOLERANCE = 0.25       # how far (in pixels) a curve may bend away from the line between two samples
+MAX_PASSES = 16        # refinement passes per frame: each one halves the intervals that need it
+CACHE_LIMIT = 200000   # samples a curve keeps before it starts over from the visible range
+
+# The visible range in data units and the size of the widget in pixels
+Viewport = namedtuple("Viewport", "x0 x1 y0 y1 width height")
+
+
+def x_scale(view):
+    """Data units per pixel along x"""
+    return (view.x1 - view.x0) / view.width
+
+
+def y_scale(view):
+    return (view.y1 - view.y0) / view.height
+
+
+class Curve:
+    """One y = f(x) and the samples evaluated so far"""
+
+    def __init__(self, text, compiled, scope=None):
+        if np is None:
+            raise RuntimeError("NumPy is needed to plot graphs (pip install numpy)")
+        self.text = text
+        self.compiled = compiled   # Compiled with x as a variable (a plain number)
+        self.scope = scope or {}   # User variables and functions (see definitions.py)
+        self.vectorized = True     # False once it turns out to call functions that take one number at a time
+        self.evaluations = 0       # Number of x evaluated, to see how much the cache saves
+        self.xs = np.empty(0)
+        self.ys = np.empty(0)
+
+    def evaluate(self, xs):
+        """f for an array of x; NaN where there is no value"""
+        self.evaluations += len(xs)
+        values = dict(self.scope)
+        if self.vectorized:
+            values["x"] = xs
+            try:
+                with np.errstate(all="ignore"):
+                    ys = self.compiled.evaluate_array(values)
+                ys = np.asarray(ys)
+                if not np.iscomplexobj(ys):
+                    return np.broadcast_to(ys.astype(float), xs.shape).copy()
+            except (TypeError, ValueError, ArithmeticError):
+                pass
+            # e.g. user functions, which are cached per number: evaluate one x at a time
+            self.vectorized = False
+
+        ys = np.empty(len(xs))
+        for index, x in enumerate(xs.tolist()):
+            values["x"] = x
+            try:
+                ys[index] = self.compiled.evaluate(values)
+            except (TypeError, ValueError, ArithmeticError, RecursionError):
+                ys[index] = np.nan
+        return ys
+
+    def samples(self, view):
+        """The points to draw for a view: sampled, refined and decimated to its pixels"""
+        self.cover(view.x0, view.x1, x_scale(view))
+        self.refine(view)
+        return self.decimate(view)
+
+    def cover(self, x0, x1, spacing):
+        """Make sure [x0, x1] is sampled, evaluating only the part that isn't yet"""
+        step = BASE_SPACING * spacing
+        if len(self.xs) > CACHE_LIMIT or not len(self.xs) or self.xs[0] > x1 or self.xs[-1] < x0:
+            # Nothing cached near the view (or too much): start over
+            self.xs = grid(x0, x1, step, True)
+            self.ys = self.evaluate(self.xs)
+            return
+        if x0 < self.xs[0]:
+            xs = grid(x0, self.xs[0], step, False)
+            self.xs, self.ys = np.concatenate((xs, self.xs)), np.concatenate((self.evaluate(xs), self.ys))
+        if x1 > self.xs[-1]:
+            xs = grid_after(self.xs[-1], x1, step)
+            self.xs, self.ys = np.concatenate((self.xs, xs)), np.concatenate((self.ys, self.evaluate(xs)))
+
+    def refine(self, view):
+        """Split the visible intervals where the curve bends more than the tolerance"""
+        sx, sy = x_scale(view), y_scale(view)
+        for _ in range(MAX_PASSES):
+            start, stop = visible_slice(self.xs, view.x0, view.x1)
+            xs, ys = self.xs[start:stop], self.ys[start:stop]
+            if len(xs) < 2:
+                return
+            split = intervals_to_split(xs / sx, ys / sy)
+            if not split.any():
+                return
+            positions = np.flatnonzero(split) + 1
+            midpoints = (xs[positions - 1] + xs[positions]) / 2
+            self.xs = np.insert(self.xs, start + positions, midpoints)
+            self.ys = np.insert(self.ys, start + positions, self.evaluate(midpoints))
+
+    def decimate(self, view):
+        """The visible samples, at most about four per pixel column"""
+        start, stop = visible_slice(self.xs, view.x0, view.x1)
+        xs, ys = self.xs[start:stop], self.ys[start:stop]
+        if len(xs) <= 4 * view.width:
+            return xs, ys
+
+        columns = np.floor((xs - view.x0) / x_scale(view)).astype(np.int64)
+        starts = np.concatenate(([0], np.flatnonzero(np.diff(columns)) + 1))
+        ends = np.concatenate((starts[1:], [len(xs)])) - 1
+        with np.errstate(all="ignore"):
+            lows = np.fmin.reduceat(ys, starts)
+            highs = np.fmax.reduceat(ys, starts)
+        # first, lowest, highest, last of every column; the line between them covers every sample
+        out_x = np.column_stack((xs[starts], xs[starts], xs[starts], xs[ends])).ravel()
+        out_y = np.column_stack((ys[starts], lows, highs, ys[ends])).ravel()
+        return out_x, out_y
+
+
+def grid(x0, x1, step, inclusive):
+    """Points from x0 towards x1 about `step` apart (x1 itself only when inclusive)"""
+    count = max(1, int(np.ceil((x1 - x0) / step)))
+    return np.linspace(x0, x1, count + 1) if inclusive else np.linspace(x0, x1, count, endpoint=False)
+
+
+def grid_after(x0, x1, step):
+    """Points after x0 up to x1, about `step` apart"""
+    count = max(1, int(np.ceil((x1 - x0) / step)))
+    return np.linspace(x0, x1, count + 1)[1:]
+
+
+def visible_slice(xs, x0, x1):
+    """Indexes of the samples in [x0, x1] plus one on each side, so the lines leaving the view are kept"""
+    start = max(0, int(np.searchsorted(xs, x0, "left")) - 1)
+    stop = min(len(xs), int(np.searchsorted(xs, x1, "right")) + 1)
+    return start, stop
+
+
+def intervals_to_split(px, py):
+    """
+    For samples in pixel units, which of the intervals between them need a sample in
+    the middle: wide ones, ones next to a sample off the line through its neighbours,
+    and ones where the curve starts or stops having values
+    """
+    width = np.diff(px)
+    finite = np.isfinite(py)
+    with np.errstate(all="ignore"):
+        # Distance of each inner sample from the line through its neighbours
+        t = (px[1:-1] - px[:-2]) / (px[2:] - px[:-2])
+        bend = np.abs(py[1:-1] - (py[:-2] + t * (py[2:] - py[:-2]))) > TOLERANCE
+    bent = np.zeros(len(width), dtype=bool)
+    bent[:-1] |= bend
+    bent[1:] |= bend
+    edge = finite[:-1] != finite[1:]
+    return (width > MIN_SPACING) & (bent | edge | (width > MAX_SPACING))
@@ -0,0 +1,122 @@
+import math
+import random
+import warnings
+
+import pytest
+
+import column_stats
+from column_stats import Summary, summarize
+
+
+@pytest.fixture(params=["numpy", "no numpy"])
+def numpy(request, monkeypatch):
+    """Run a test with NumPy, and again with the pure Python fallback"""
+    if request.param == "numpy":
+        if column_stats.np is None:
+            pytest.skip("NumPy isn't installed")
+    else:
+        monkeypatch.setattr(column_stats, "np", None)
+    return request.param
+
+
+def numbers(count, seed=1):
+    generator = random.Random(seed)
+    return [generator.gauss(1e6, 3.0) for _ in range(count)]
+
+
+def test_chunked_equals_one_shot(numpy):
+    values = numbers(10000)
+    # The first chunk has the smallest and the largest value, so both histograms get the same bins
+    values.insert(0, min(values) - 1)
+    values.insert(1, max(values) + 1)
+    whole = summarize([values])
+    chunked = summarize(values[start:start + 999] for start in range(0, len(values), 999))
+
+    assert chunked.count == whole.count == len(values)
+    assert chunked.mean == pytest.approx(whole.mean, rel=1e-15)
+    assert chunked.variance() == pytest.approx(whole.variance(), rel=1e-9)
+    assert chunked.sum == pytest.approx(math.fsum(values), rel=1e-15)
+    assert (chunked.minimum, chunked.maximum) == (whole.minimum, whole.maximum) == (min(values), max(values))
+    assert chunked.histogram() == whole.histogram()
+
+
+def test_statistics(numpy):
+    summary = summarize([[2.0, 4.0, 4.0], [4.0, 5.0, 5.0, 7.0, 9.0]])
+    assert summary.count == 8
+    assert summary.mean == 5
+    assert summary.variance(sample=False) == 4
+    assert summary.stddev(sample=False) == 2
+    assert summary.variance() == pytest.approx(32 / 7)
+    assert summary.sum == 40
+
+
+def test_skipped(numpy):
+    summary = summarize([[1.0, math.nan, math.inf], [-math.inf, 3.0]])
+    assert (summary.count, summary.skipped, summary.mean) == (2, 3, 2)
+    assert summarize([[math.nan]]).histogram() == ([], [], 0.0)
+
+
+def test_histogram_widens_upwards(numpy):
+    summary = Summary(bins=8)
+    summary.add([0.0, 8.0])
+    width = summary.width
+    summary.add([100.0])
+    edges, counts, new_width = summary.histogram()
+    assert summary.low == 0
+    assert new_width == width * 16
+    assert sum(counts) == 3
+    assert counts[0] == 2 and counts[-1] == 1
+    assert edges[-1] <= 100 < edges[-1] + new_width
+
+
+def test_histogram_widens_downwards(numpy):
+    summary = Summary(bins=8)
+    summary.add([0.0, 8.0])
+    summary.add([-20.0])
+    edges, counts, width = summary.histogram()
+    assert summary.low <= -20
+    assert edges[0] <= -20 < edges[0] + width
+    assert counts[0] == 1 and counts[-1] >= 1
+    assert sum(counts) == 3
+    assert edges[-1] <= 8 < edges[-1] + width
+
+
+def test_constant_data(numpy):
+    summary = summarize([[5.0] * 10, [5.0] * 10])
+    edges, counts, width = summary.histogram()
+    assert counts == [20]
+    assert width > 0
+    assert edges[0] <= 5 < edges[0] + width
+    assert summary.variance() == 0
+    assert summarize([[0.0, 0.0]]).histogram()[1] == [2]
+
+
+@pytest.mark.parametrize("chunks", [
+    [[-1e308], [1e308]],
+    [[1e308], [-1e308]],
+    [[-1e308, 1e308]],
+    [[0.0], [1e308], [-1e308]],
+])
+def test_histogram_of_huge_values(numpy, chunks):
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        summary = summarize(chunks)
+    edges, counts, width = summary.histogram()
+    assert sum(counts) == len(sum(chunks, []))
+    assert len(counts) > 1  # The smallest and the largest value are in different bins
+    assert counts[0] == counts[-1] == 1
+    assert math.isfinite(width)
+    assert summary.mean == 0
+
+
+def test_parse_numbers(numpy):
+    values = column_stats.parse_numbers("1, 2;3\n4 x")
+    assert list(values[:4]) == [1, 2, 3, 4]
+    assert math.isnan(values[4])
+
+
+def test_read_column(tmp_path, numpy):
+    path = tmp_path / "data.csv"
+    path.write_text("name,value\na,1\nb,2\nc,x\nd,4\n", encoding="utf-8")
+    summary = summarize(column_stats.read_column(str(path), "value", chunk_size=2))
+    assert (summary.count, summary.skipped, summary.sum) == (3, 1, 7)
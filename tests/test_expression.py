@@ -0,0 +1,180 @@
+import math
+
+import pytest
+
+from expression import check_variable_name, compile_expression, evaluate, split_target_unit, tokenize
+from units import parse_unit
+
+
+def value_of(text, angle_mode="deg"):
+    """(value in the display unit, the unit shown)"""
+    compiled = compile_expression(text, angle_mode)
+    return compiled.evaluate(), compiled.unit_text
+
+
+@pytest.mark.parametrize("text, result", [
+    # precedence and associativity
+    ("2 + 3 * 4", "14"),
+    ("(2 + 3) * 4", "20"),
+    ("10 - 2 - 3", "5"),
+    ("8 / 2 / 2", "2.0"),
+    ("2 ^ 3 ^ 2", "512"),
+    ("2 ** 3", "8"),
+    ("2 × 3 ÷ 4", "1.5"),
+    # unary minus
+    ("-2 ^ 2", "-4"),
+    ("2 ^ -1", "0.5"),
+    ("--3", "3"),
+    ("-(2 + 3)", "-5"),
+    ("+4", "4"),
+    # implicit multiplication
+    ("3(4 + 5)", "27"),
+    ("2 √9", "6.0"),
+    ("(1 + 1)(2 + 2)", "8"),
+    # superscripts
+    ("3²", "9"),
+    ("2³ + 1", "9"),
+    ("10⁻¹", "0.1"),
+    ("(1 + 2)²", "9"),
+    # factorial and modulus
+    ("5!", "120"),
+    ("0!", "1"),
+    ("3! + 1", "7"),
+    ("10 mod 3", "1"),
+    ("10 % 4", "2"),
+    ("-7 mod 3", "2"),
+    # numbers and functions
+    ("2e3", "2000.0"),
+    (".5 + .5", "1.0"),
+    ("sqrt(16)", "4.0"),
+    ("√16", "4.0"),
+    ("abs(-3)", "3"),
+    ("log(1000)", "3.0"),
+    ("ln(e)", "1.0"),
+    ("asin(1)", "90.0"),
+])
+def test_plain_numbers(text, result):
+    assert evaluate(text) == result
+
+
+@pytest.mark.parametrize("text, value", [
+    ("2π", 2 * math.pi),
+    ("2 sin(30)", 1),
+    ("sin 30", 0.5),
+    ("cos(60) + 1", 1.5),
+    ("sin(30 deg)", 0.5),
+])
+def test_functions_in_degrees(text, value):
+    assert value_of(text) == (pytest.approx(value), None)
+
+
+@pytest.mark.parametrize("text, value", [
+    ("sin(pi / 2)", 1),
+    ("asin(1)", math.pi / 2),
+    ("sin(90 deg)", 1),  # An angle with a unit is the same in either mode
+])
+def test_functions_in_radians(text, value):
+    assert value_of(text, "rad") == (pytest.approx(value), None)
+
+
+@pytest.mark.parametrize("text, value, unit", [
+    ("5 km + 300 m", 5.3, "km"),
+    ("3 kWh / 2 h", 1500, "W"),
+    ("2 m * 3 m", 6, "m²"),
+    ("(2 m)²", 4, "m²"),
+    ("√(9 m²)", 3, "m"),
+    ("10 m mod 3 m", 1, "m"),
+    ("9.81 m/s^2 * 2 kg", 19.62, "N"),
+    ("20 kWh per 100 km", 720, "N"),
+    ("2 ft²", 2, "ft²"),
+    ("-40 °C in °F", -40, "°F"),
+])
+def test_units(text, value, unit):
+    assert value_of(text) == (pytest.approx(value), unit)
+
+
+@pytest.mark.parametrize("text, value, unit", [
+    ("1 km in m", 1000, "m"),
+    ("3 m to ft", 3 / 0.3048, "ft"),
+    ("100 km/h in mph", 62.1371192237, "mph"),
+    ("5 Hz in 1/min", 300, "1/min"),
+    ("100 °C in °F", 212, "°F"),
+    ("3 m² to ft²", 3 / 0.3048 ** 2, "ft²"),
+    ("1 rad in deg", 180 / math.pi, "deg"),
+    ("9.81 m/s^2 in m·s^-2", 9.81, "m·s^-2"),
+])
+def test_conversion_targets(text, value, unit):
+    assert value_of(text) == (pytest.approx(value), unit)
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("5 km + 300 m in ft", ("5 km + 300 m", "ft")),
+    ("3 m to ft²", ("3 m", "ft²")),
+    ("5 Hz in 1/min", ("5 Hz", "1/min")),
+    ("2 in to cm", ("2 in", "cm")),
+    # Numbers aren't units, so these aren't conversions
+    ("2 to 3", ("2 to 3", None)),
+    ("5 in 2", ("5 in 2", None)),
+    ("3 m to 2 ft", ("3 m to 2 ft", None)),
+    ("1 + 1", ("1 + 1", None)),
+    ("5 m in nothing", ("5 m in nothing", None)),
+])
+def test_split_target_unit(text, expected):
+    assert split_target_unit(text) == expected
+
+
+@pytest.mark.parametrize("text, message", [
+    ("1 + ", "Can't read the expression '1 + '"),
+    ("2 @ 3", "Can't read the expression '2 @ 3'"),
+    ("(1 + 2", "Missing ')' in '(1 + 2'"),
+    ("sqrt(1, 2)", "sqrt takes one value"),
+    ("foo", "Unknown name or unit 'foo'"),
+    ("2 to 3", "Unknown name or unit 'to'"),
+    ("5 in 2", "Can't read the expression '5 in 2'"),
+    ("3 m to 2 ft", "Unknown name or unit 'to'"),
+    ("5 m + 2 s", "Can't add m and s"),
+    ("5 m - 2 s", "Can't subtract m and s"),
+    ("2 m mod 3 s", "Can't take the modulus of m and s"),
+    ("5 m in s", "Can't convert m to s (s)"),
+    ("sin(3 m)", "sin needs a plain number, not m"),
+    ("2 ^ (1 m)", "Exponents can't have units"),
+    ("sqrt(2 m)", "Can't take the square root of m"),
+    ("(2 m) ^ 0.5", "Can't raise m to the power 0.5"),
+    ("10 °C + 5 °C", "°C and °F values can't be used in calculations, convert them to K first"),
+    ("1.5!", "Factorial needs a whole number ≥ 0"),
+])
+def test_errors(text, message):
+    with pytest.raises(ValueError) as error:
+        evaluate(text)
+    assert str(error.value) == message
+
+
+def test_tokenize():
+    assert tokenize("2 km/h+3²") == [("number", "2", False), ("name", "km", True), ("operator", "/", False),
+                                     ("name", "h", False), ("operator", "+", False), ("number", "3", False),
+                                     ("superscript", "²", False)]
+
+
+@pytest.mark.parametrize("name, message", [
+    ("x", None),
+    ("speed_2", None),
+    ("2x", "'2x' isn't a valid name"),
+    ("a b", "'a b' isn't a valid name"),
+    ("°C", "'°C' isn't a valid name"),
+    ("sin", "'sin' is a built-in name"),
+    ("to", "'to' is a built-in name"),
+])
+def test_check_variable_name(name, message):
+    if message is None:
+        check_variable_name(name)
+    else:
+        with pytest.raises(ValueError, match=message):
+            check_variable_name(name)
+
+
+def test_variables_and_functions():
+    metre = parse_unit("m").dims
+    compiled = compile_expression("2 x + f(3)", variables=(("x", metre, False),), functions=(("f", 1, metre),))
+    assert compiled.names == ("f", "x")
+    assert compiled.evaluate({"x": 1.5, "f": lambda value: value * 10}) == 33
+    assert compiled.unit_text == "m"
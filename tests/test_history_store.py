@@ -0,0 +1,272 @@
+import sqlite3
+import threading
+
+import pytest
+
+from history import HistoryEntry, parse_history_query
+from history_io import export_history, import_history
+from history_store import PAGE_SIZE, SCHEMA_VERSION, HistoryStore, PersistentHistory
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "history.sqlite3")
+
+
+@pytest.fixture
+def store(path):
+    store = HistoryStore(path)
+    yield store
+    store.close()
+
+
+def entry(number, mode="Advanced", expression=None, angle_mode="deg"):
+    return HistoryEntry(expression or f"{number} + 1", number + 1, mode, 1000.0 + number, angle_mode)
+
+
+def stored(store, mode="Advanced"):
+    store.flush()
+    return store.connection.execute(
+        "SELECT seq, expression FROM history WHERE mode = ? ORDER BY seq", (mode,)).fetchall()
+
+
+def test_add_and_read_back_after_restart(path):
+    store = HistoryStore(path)
+    history = PersistentHistory(store, "Advanced")
+    for number in range(3 * PAGE_SIZE + 5):
+        history.append(entry(number))
+    store.close()
+
+    store = HistoryStore(path)
+    history = PersistentHistory(store, "Advanced")
+    assert len(history) == 3 * PAGE_SIZE + 5
+    assert len(history.recent) == 0  # Nothing read yet
+    assert history[0].expression == "0 + 1"
+    assert history[PAGE_SIZE + 1].result == PAGE_SIZE + 2
+    assert history[len(history) - 1].expression == f"{3 * PAGE_SIZE + 4} + 1"
+    assert len(history.pages) == 3
+    with pytest.raises(IndexError):
+        history[len(history)]
+    store.close()
+
+
+def test_modes_are_separate(store):
+    standard = PersistentHistory(store, "Standard")
+    advanced = PersistentHistory(store, "Advanced")
+    standard.append(entry(1, "Standard"))
+    advanced.append(entry(2))
+    advanced.append(entry(3))
+    store.flush()
+    assert store.bounds("Standard") == (0, 1)
+    assert store.bounds("Advanced") == (0, 2)
+    assert store.bounds("Nothing") == (0, 0)
+
+
+def test_limit_trims_the_oldest(path):
+    store = HistoryStore(path)
+    history = PersistentHistory(store, "Advanced", limit=10)
+    for number in range(25):
+        history.append(entry(number))
+    assert len(history) == 10
+    assert [item.expression for item in history][0] == "15 + 1"
+    assert [seq for seq, _ in stored(store)] == list(range(15, 25))
+    store.close()
+
+    # A smaller limit after a restart trims the stored rows too
+    store = HistoryStore(path)
+    history = PersistentHistory(store, "Advanced", limit=4)
+    assert [item.expression for item in history] == [f"{number} + 1" for number in range(21, 25)]
+    assert len(stored(store)) == 4
+    store.close()
+
+
+def test_clear(store):
+    history = PersistentHistory(store, "Advanced")
+    for number in range(5):
+        history.append(entry(number))
+    history.clear()
+    assert len(history) == 0
+    history.append(entry(9))
+    assert [item.expression for item in history] == ["9 + 1"]
+    assert [expression for _, expression in stored(store)] == ["9 + 1"]
+
+
+def test_search(store):
+    history = PersistentHistory(store, "Advanced")
+    for number, expression in enumerate(["sin(30)", "cos(60) + sin(10)", "2 ^ 40", "√16", "sinh(1)"]):
+        history.append(HistoryEntry(expression, number * 1000, "Advanced", 1000.0 + number))
+    PersistentHistory(store, "Standard").append(HistoryEntry("sin(1)", 7, "Standard", 2000.0))
+    store.flush()
+
+    def search(text):
+        return [item.expression for item in store.search(parse_history_query(text))]
+
+    assert search("sin") == ["sin(1)", "sinh(1)", "cos(60) + sin(10)", "sin(30)"]  # prefixes, newest first
+    assert search("sin mode:advanced") == ["sinh(1)", "cos(60) + sin(10)", "sin(30)"]
+    assert search("sin cos") == ["cos(60) + sin(10)"]
+    assert search("√") == ["√16"]
+    assert search("result >= 2000") == ["2 ^ 40", "√16", "sinh(1)"]
+    assert search("sin result > 500") == ["sinh(1)", "cos(60) + sin(10)"]
+    assert search("tan") == []
+
+
+def test_deleted_rows_leave_the_search_index(store):
+    history = PersistentHistory(store, "Advanced", limit=2)
+    for expression in ["tan(1)", "1 + 1", "2 + 2"]:
+        history.append(HistoryEntry(expression, 0, "Advanced"))
+    store.flush()
+    assert store.search(parse_history_query("tan")) == []
+    store.connection.execute("INSERT INTO history_fts (history_fts) VALUES ('integrity-check')")
+
+
+def test_export_import_round_trip(store, tmp_path):
+    history = PersistentHistory(store, "Advanced")
+    for number in range(50):
+        history.append(entry(number))
+    PersistentHistory(store, "Standard").append(entry(1, "Standard"))
+
+    for name in ("history.csv", "history.jsonl"):
+        file = str(tmp_path / name)
+        assert export_history(store, file) == 51
+        assert import_history(store, file) == (0, 51)  # Everything is already stored
+    assert len(stored(store)) == 50
+
+    other = HistoryStore(str(tmp_path / "other.sqlite3"))
+    assert import_history(other, str(tmp_path / "history.jsonl")) == (51, 0)
+    assert [(item.expression, item.result, item.timestamp, item.angle_mode) for item in other.entries("Advanced")] \
+        == [(item.expression, item.result, item.timestamp, item.angle_mode) for item in store.entries("Advanced")]
+    other.close()
+
+
+def test_import_skips_duplicates_within_the_file(store):
+    added, skipped = store.import_entries([entry(1), entry(1), entry(2)])
+    assert (added, skipped) == (2, 1)
+    assert [seq for seq, _ in stored(store)] == [0, 1]
+
+
+def test_import_while_the_window_appends(path):
+    window_store = HistoryStore(path)
+    window = PersistentHistory(window_store, "Advanced")
+    for number in range(3):
+        window.append(entry(number, expression=f"sin({number})"))
+    window_store.flush()
+
+    # The command line imports into the same database; it numbers its rows after the stored ones,
+    # which are the seqs the window gives its next entries
+    other = HistoryStore(path)
+    assert other.import_entries([entry(100 + number, expression=f"imported {number}") for number in range(2)]) \
+        == (2, 0)
+    other.close()
+    window.append(entry(3, expression="sin(90)"))
+    window_store.flush()
+
+    assert [expression for _, expression in stored(window_store)] == \
+        ["sin(0)", "sin(1)", "sin(2)", "imported 0", "imported 1", "sin(90)"]
+    assert window.out_of_sync()
+
+    # Recalculate All reads the bounds again and its results reach every entry of the window
+    assert window.recalculate_all("rad") == 4
+    assert not window.out_of_sync()
+    assert [item.expression for item in window] == \
+        ["sin(0)", "sin(1)", "sin(2)", "imported 0", "imported 1", "sin(90)"]
+    window_store.flush()
+    assert window_store.connection.execute(
+        "SELECT angle_mode FROM history WHERE expression = 'sin(90)'").fetchone() == ("rad",)
+    window_store.close()
+
+
+def test_concurrent_import_loses_nothing(path):
+    window_store = HistoryStore(path)
+    window = PersistentHistory(window_store, "Advanced")
+    results = []
+
+    def import_entries():
+        # A connection of its own, like the command line's
+        other = HistoryStore(path)
+        results.append(other.import_entries([entry(10000 + number) for number in range(5000)]))
+        other.close()
+
+    importing = threading.Thread(target=import_entries)
+    importing.start()
+    for number in range(500):
+        window.append(entry(number))
+    importing.join()
+    assert results == [(5000, 0)]
+
+    rows = stored(window_store)
+    assert len(rows) == 5500
+    assert len({seq for seq, _ in rows}) == 5500
+    window.reload()
+    assert len(window) == 5500
+    window_store.close()
+
+
+# Schemas of the earlier versions, as they were created
+OLD_SCHEMAS = {
+    0: """
+        CREATE TABLE history (mode TEXT NOT NULL, seq INTEGER NOT NULL, expression TEXT NOT NULL, result,
+                              timestamp REAL NOT NULL, PRIMARY KEY (mode, seq)) WITHOUT ROWID;
+        CREATE TABLE settings (key TEXT PRIMARY KEY, value);
+    """,
+    1: """
+        CREATE TABLE history (id INTEGER PRIMARY KEY, mode TEXT NOT NULL, seq INTEGER NOT NULL,
+                              expression TEXT NOT NULL, result, value REAL, timestamp REAL NOT NULL,
+                              UNIQUE (mode, seq));
+        CREATE INDEX history_value ON history (value);
+        CREATE VIRTUAL TABLE history_fts USING fts5(expression, content='history', content_rowid='id');
+        CREATE TRIGGER history_insert AFTER INSERT ON history BEGIN
+            INSERT INTO history_fts (rowid, expression) VALUES (new.id, new.expression);
+        END;
+        CREATE TRIGGER history_delete AFTER DELETE ON history BEGIN
+            INSERT INTO history_fts (history_fts, rowid, expression) VALUES ('delete', old.id, old.expression);
+        END;
+        CREATE TABLE settings (key TEXT PRIMARY KEY, value);
+        PRAGMA user_version = 1;
+    """,
+    2: """
+        CREATE TABLE history (id INTEGER PRIMARY KEY, mode TEXT NOT NULL, seq INTEGER NOT NULL,
+                              expression TEXT NOT NULL, result, value REAL, timestamp REAL NOT NULL,
+                              UNIQUE (mode, seq));
+        CREATE INDEX history_value ON history (value);
+        CREATE INDEX history_timestamp ON history (timestamp);
+        CREATE VIRTUAL TABLE history_fts USING fts5(expression, content='history', content_rowid='id');
+        CREATE TABLE settings (key TEXT PRIMARY KEY, value);
+        PRAGMA user_version = 2;
+    """,
+}
+
+
+@pytest.mark.parametrize("version", sorted(OLD_SCHEMAS))
+def test_migrate_older_databases(path, version):
+    connection = sqlite3.connect(path)
+    connection.executescript(OLD_SCHEMAS[version])
+    rows = [("Advanced", 0, "sin(30)", 0.5, 1000.0), ("Advanced", 1, "2 + 2", 4, 1001.0),
+            ("Standard", 0, "√16", "4", 1002.0)]
+    if version == 0:
+        connection.executemany("INSERT INTO history VALUES (?, ?, ?, ?, ?)", rows)
+    else:
+        connection.executemany("INSERT INTO history (mode, seq, expression, result, timestamp) "
+                               "VALUES (?, ?, ?, ?, ?)", rows)
+        if version == 2:
+            connection.execute("INSERT INTO history_fts (history_fts) VALUES ('rebuild')")
+    connection.execute("INSERT INTO settings VALUES ('history_limit', 1000)")
+    connection.commit()
+    connection.close()
+
+    store = HistoryStore(path)
+    assert store.connection.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION
+    assert store.connection.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'trigger'").fetchall() == []
+    assert store.setting("history_limit") == 1000
+    history = PersistentHistory(store, "Advanced")
+    assert [(item.expression, item.result, item.angle_mode) for item in history] == \
+        [("sin(30)", 0.5, None), ("2 + 2", 4, None)]
+    assert [item.expression for item in store.search(parse_history_query("sin"))] == ["sin(30)"]
+
+    # New entries are indexed and numbered after the migrated ones
+    history.append(HistoryEntry("sin(60)", 0.866, "Advanced", 2000.0, "deg"))
+    store.flush()
+    assert [item.expression for item in store.search(parse_history_query("sin"))] == ["sin(60)", "sin(30)"]
+    assert store.bounds("Advanced") == (0, 3)
+    store.connection.execute("INSERT INTO history_fts (history_fts) VALUES ('integrity-check')")
+    store.close()
@@ -0,0 +1,227 @@
+"""
+User-defined units and categories ("unit packs") loaded from TOML or JSON files.
+
+A pack adds units to the built-in categories or defines new ones:
+
+    [categories.Length.units]
+    Furlong = "201.168"          # in the category's base unit (meters)
+    Chain = "20.1168"
+
+    [categories.Length.symbols]
+    fur = "Furlong"
+
+    [categories."Fuel Economy"]
+    base_unit = "kilometer per liter"
+    dimension = "km/L"           # optional, lets the units be used in expressions
+    units = { "Kilometer per Liter" = 1, "Mile per Gallon (US)" = "0.425143707" }
+
+Factors are read as exact fractions ("201.168", "1/3" or plain numbers).
+A pack is checked and compiled once; the compiled form is pickled next to it
+(in __pycache__) and reused for as long as the file's mtime and size match.
+"""
+
+import json
+import os
+import pickle
+from collections import namedtuple
+from fractions import Fraction as F
+
+try:
+    import tomllib
+except ImportError:  # Python < 3.11 can still read JSON packs
+    tomllib = None
+
+import units
+from conversions import CONVERSION_DATA, CONVERSION_TYPES
+from expression import compile_expression
+from units import CATEGORY_BASE_UNITS, SYMBOLS
+
+# Packs next to the program and in the user's home folder, loaded in this order
+PACK_DIRS = [os.path.join(os.path.dirname(os.path.abspath(__file__)), "unit_packs"),
+             os.path.join(os.path.expanduser("~"), ".python_calculator", "unit_packs")]
+PACK_EXTENSIONS = (".toml", ".json")
+
+# Bump when the compiled form changes so old cache files are ignored
+CACHE_VERSION = 1
+
+CATEGORY_KEYS = {"base_unit", "dimension", "units", "symbols"}
+
+# Categories that aren't a single multiplication can't take extra units
+SPECIAL_CATEGORIES = [name for name, data in CONVERSION_DATA.items() if data.get("special")]
+
+# Everything the converter, the unit parser and the search need, with the packs merged in
+UnitLibrary = namedtuple("UnitLibrary", "conversion_data conversion_types category_base_units symbols")
+
+
+def read_pack(path):
+    """Read a pack file into plain dicts"""
+    if path.endswith(".toml"):
+        if tomllib is None:
+            raise ValueError("TOML unit packs need Python 3.11 or newer, use JSON instead")
+        with open(path, "rb") as file:
+            return tomllib.load(file)
+    with open(path, encoding="utf-8") as file:
+        return json.load(file)
+
+
+def parse_factor(value, where):
+    """Read a conversion factor as an exact, positive Fraction"""
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        raise ValueError(f"{where}: the factor must be a number or a string like \"1/3\"")
+    try:
+        # repr() keeps 0.3048 as 0.3048 instead of the nearest binary float
+        factor = F(repr(value)) if isinstance(value, float) else F(value)
+    except (ValueError, ZeroDivisionError):
+        raise ValueError(f"{where}: '{value}' is not a number")
+    if factor <= 0:
+        raise ValueError(f"{where}: the factor must be greater than 0")
+    return factor
+
+
+def compile_pack(raw):
+    """Check a pack that was just read and turn it into the form that is cached"""
+    if not isinstance(raw, dict) or not isinstance(raw.get("categories"), dict):
+        raise ValueError("a unit pack needs a 'categories' table")
+    unknown = set(raw) - {"categories"}
+    if unknown:
+        raise ValueError(f"unknown key '{sorted(unknown)[0]}'")
+
+    categories = {}
+    for name, data in raw["categories"].items():
+        if not isinstance(data, dict):
+            raise ValueError(f"{name}: a category must be a table")
+        unknown = set(data) - CATEGORY_KEYS
+        if unknown:
+            raise ValueError(f"{name}: unknown key '{sorted(unknown)[0]}'")
+        if name in SPECIAL_CATEGORIES:
+            raise ValueError(f"{name}: units can't be added to this category")
+
+        builtin = name in CONVERSION_DATA
+        if builtin and ("dimension" in data or "base_unit" in data):
+            raise ValueError(f"{name}: the base unit of a built-in category can't be changed")
+
+        pack_units = data.get("units", {})
+        if not isinstance(pack_units, dict) or (not pack_units and not builtin):
+            raise ValueError(f"{name}: 'units' must be a table with at least one unit")
+        compiled_units = {unit: parse_factor(factor, f"{name} / {unit}") for unit, factor in pack_units.items()}
+
+        dimension = data.get("dimension")
+        if dimension is not None:
+            # The dimension may only use built-in units, it is checked here once
+            try:
+                units.parse_expression(str(dimension), units.SYMBOL_TABLE, units.NAME_TABLE)
+            except ValueError as error:
+                raise ValueError(f"{name}: bad dimension ({error})")
+
+        symbols = data.get("symbols", {})
+        if not isinstance(symbols, dict):
+            raise ValueError(f"{name}: 'symbols' must be a table")
+        known_units = set(compiled_units) | set(CONVERSION_DATA.get(name, {}).get("units", ()))
+        for symbol, unit in symbols.items():
+            if unit not in known_units:
+                raise ValueError(f"{name}: symbol '{symbol}' points to the unknown unit '{unit}'")
+
+        categories[name] = {"base_unit": str(data.get("base_unit", "")), "dimension": dimension,
+                            "units": compiled_units, "symbols": dict(symbols)}
+
+    return {"categories": categories}
+
+
+def cache_path(path):
+    folder, filename = os.path.split(path)
+    return os.path.join(folder, "__pycache__", filename + ".pickle")
+
+
+def load_pack(path):
+    """Return the compiled pack, from the cache if the file hasn't changed since it was compiled"""
+    stat = os.stat(path)
+    key = (CACHE_VERSION, stat.st_mtime_ns, stat.st_size)
+    cached = cache_path(path)
+
+    try:
+        with open(cached, "rb") as file:
+            cached_key, pack = pickle.load(file)
+        if cached_key == key:
+            return pack
+    except (OSError, pickle.UnpicklingError, EOFError, ValueError, TypeError):
+        pass  # No usable cache: compile the pack again
+
+    try:
+        pack = compile_pack(read_pack(path))
+    except ValueError as error:  # Also covers TOML and JSON syntax errors
+        raise ValueError(f"{os.path.basename(path)}: {error}")
+
+    try:
+        os.makedirs(os.path.dirname(cached), exist_ok=True)
+        # Written to a temporary file first so a half-written cache is never read
+        with open(cached + ".tmp", "wb") as file:
+            pickle.dump((key, pack), file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(cached + ".tmp", cached)
+    except OSError:
+        pass  # A read-only folder only means the pack is compiled again next time
+
+    return pack
+
+
+def find_packs(directories=None):
+    """All pack files in the pack folders, sorted by name within each folder"""
+    paths = []
+    for directory in PACK_DIRS if directories is None else directories:
+        if os.path.isdir(directory):
+            paths += [os.path.join(directory, filename) for filename in sorted(os.listdir(directory))
+                      if filename.endswith(PACK_EXTENSIONS)]
+    return paths
+
+
+def merge_packs(packs, conversion_data=CONVERSION_DATA, conversion_types=CONVERSION_TYPES):
+    """Merge compiled (path, pack) pairs into copies of the built-in tables"""
+    data = {name: {**category, "units": category["units"].copy()} for name, category in conversion_data.items()}
+    types = list(conversion_types)
+    base_units = dict(CATEGORY_BASE_UNITS)
+    symbols = dict(SYMBOLS)
+
+    for path, pack in packs:
+        where = os.path.basename(path)
+        for name, category in pack["categories"].items():
+            if name not in data:
+                data[name] = {"base_unit": category["base_unit"], "units": {}}
+                types.append(name)
+            elif category["dimension"] is not None or category["base_unit"]:
+                raise ValueError(f"{where}: the category '{name}' is already defined")
+
+            for unit, factor in category["units"].items():
+                if unit in data[name]["units"]:
+                    raise ValueError(f"{where}: '{unit}' is already a {name} unit")
+                data[name]["units"][unit] = factor
+
+            if category["dimension"] is not None:
+                base_units[name] = category["dimension"]
+            for symbol, unit in category["symbols"].items():
+                if symbol in symbols:
+                    raise ValueError(f"{where}: the symbol '{symbol}' is already used")
+                symbols[symbol] = (name, unit)
+
+    return UnitLibrary(data, types, base_units, symbols)
+
+
+def load_unit_packs(directories=None):
+    """
+    Load every pack and install the merged units for the unit parser.
+    Returns (library, errors); a pack with an error is skipped as a whole.
+    """
+    packs = []
+    errors = []
+    library = merge_packs([])
+    for path in find_packs(directories):
+        try:
+            pack = load_pack(path)
+            # Merged one at a time so a clash only drops the pack that caused it
+            library = merge_packs(packs + [(path, pack)])
+            packs.append((path, pack))
+        except (OSError, ValueError) as error:
+            errors.append(str(error))
+
+    if packs:
+        units.load_unit_table(library.conversion_data, library.category_base_units, library.symbols)
+        compile_expression.cache_clear()
+    return library, errors
@@ -0,0 +1,158 @@
+"""
+Fuzzy search over every unit and conversion category ("mph", "kgs", "°F", "nautical").
+
+The index is built once at startup. Every unit is stored with its name,
+plural and symbols as search terms, and every term is split into trigrams.
+A query only scores the entries that share at least one trigram with it, so a
+search stays fast even with thousands of (user-defined) units.
+"""
+
+from collections import defaultdict, namedtuple
+
+from conversions import CONVERSION_DATA, CONVERSION_TYPES
+import units
+from units import PREFIXABLE, PREFIXES, lookup_word
+
+SearchResult = namedtuple("SearchResult", "label category unit score")
+
+# Search terms that can't be worked out from the unit data
+EXTRA_ALIASES = {
+    ("Number Systems", "Binary"): ["bin", "base 2"],
+    ("Number Systems", "Octal"): ["oct", "base 8"],
+    ("Number Systems", "Decimal"): ["dec", "base 10"],
+    ("Number Systems", "Hexadecimal"): ["hex", "base 16"],
+    ("Weight and Mass", "Pound"): ["lbs"],
+    ("Speed", "Kilometer per Hour"): ["kph", "kmh"],
+}
+
+
+def normalize(text):
+    """Searches ignore case and extra spaces"""
+    return " ".join(text.lower().split())
+
+
+def trigrams(term):
+    # Padding the start makes the first trigrams act like a prefix index
+    padded = f"  {term} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def plural(name):
+    lowered = name.lower()
+    if lowered.endswith("foot"):
+        return lowered[:-4] + "feet"
+    if lowered.endswith(("ch", "sh", "s", "x")):
+        return lowered + "es"
+    return lowered + "s"
+
+
+class UnitIndex:
+    """Trigram index over units and categories"""
+
+    def __init__(self):
+        self.entries = []              # (label, category, unit) per entry id
+        self.terms = []                # [(term, trigrams), ...] per entry id
+        self.grams = defaultdict(set)  # trigram → ids of the entries that contain it
+
+    def __len__(self):
+        return len(self.entries)
+
+    def add(self, category, unit=None, aliases=()):
+        """Add a unit (or a whole category when unit is None) with extra search terms"""
+        entry_id = len(self.entries)
+        label = f"{unit} ({category})" if unit else category
+        self.entries.append((label, category, unit))
+
+        terms = {normalize(term) for term in (unit or category, *aliases) if term and term.strip()}
+        self.terms.append([(term, trigrams(term)) for term in sorted(terms)])
+        for term in terms:
+            for gram in trigrams(term):
+                self.grams[gram].add(entry_id)
+
+    def search(self, query, limit=10):
+        """Return up to `limit` SearchResults, best match first"""
+        query = normalize(query)
+        if not query:
+            return []
+        query_grams = trigrams(query)
+
+        # Only entries sharing a trigram with the query are looked at
+        candidates = set()
+        for gram in query_grams:
+            candidates.update(self.grams.get(gram, ()))
+
+        results = []
+        for entry_id in sorted(candidates):
+            score = max(score_term(query, query_grams, term, grams) for term, grams in self.terms[entry_id])
+            if score > 0:
+                label, category, unit = self.entries[entry_id]
+                results.append(SearchResult(label, category, unit, score))
+
+        # Best score first; the sort is stable, so ties keep the order entries were added in
+        results.sort(key=lambda result: -result.score)
+        return results[:limit]
+
+
+def score_term(query, query_grams, term, term_grams):
+    """How well a query matches one search term (0 means not at all)"""
+    if term == query:
+        return 100
+    if term.startswith(query):
+        return 80 + 10 * len(query) / len(term)
+    if any(word.startswith(query) for word in term.split()):
+        return 70 + 10 * len(query) / len(term)
+    if query in term:
+        return 60
+
+    # Typos and extra letters ("kgs", "kilometre"): share of common trigrams
+    similarity = 2 * len(query_grams & term_grams) / (len(query_grams) + len(term_grams))
+    return 50 * similarity if similarity >= 0.4 else 0
+
+
+def symbols_by_unit():
+    """Map every unit (by its scale, dimensions and offset) to the symbols that mean it"""
+    # Looked up on the module so units added by unit packs are found too
+    symbol_table, name_table = units.SYMBOL_TABLE, units.NAME_TABLE
+    candidates = set(symbol_table) | set(PREFIXABLE)
+    candidates |= {prefix + symbol for prefix in PREFIXES for symbol in PREFIXABLE}
+
+    symbols = defaultdict(list)
+    for candidate in sorted(candidates):
+        try:
+            unit = lookup_word(candidate, symbol_table, name_table)
+        except ValueError:
+            continue
+        symbols[(unit.scale, unit.dims, unit.offset)].append(candidate)
+    return symbols
+
+
+def build_unit_index(conversion_data=CONVERSION_DATA, conversion_types=CONVERSION_TYPES):
+    """Index every category of the conversion data and every unit in it"""
+    index = UnitIndex()
+    symbols = symbols_by_unit()
+
+    for category in conversion_types:
+        index.add(category)
+
+    for category in conversion_types:
+        for name in conversion_data[category]["units"]:
+            aliases = [plural(name), *EXTRA_ALIASES.get((category, name), ())]
+            if name.endswith(" (US)"):
+                aliases += [name[:-5], plural(name[:-5])]
+            if name.startswith(("Square ", "Cubic ")):
+                # "sq ft", "cu in", "km²"
+                power, base = name.split(" ", 1)
+                short, superscript = ("sq ", "²") if power == "Square" else ("cu ", "³")
+                aliases.append(short + base)
+                base_unit = units.NAME_TABLE.get(base.lower())
+                if base_unit is not None:
+                    for symbol in symbols.get((base_unit.scale, base_unit.dims, base_unit.offset), []):
+                        aliases += [short + symbol, symbol + superscript]
+
+            unit = units.NAME_TABLE.get(name.lower())
+            if unit is not None:
+                aliases += symbols.get((unit.scale, unit.dims, unit.offset), [])
+
+            index.add(category, name, aliases)
+
+    return index
@@ -0,0 +1,404 @@
+"""
+Compound unit parsing ("km/h", "kWh per 100 km", "lb·ft²", "N·m/s^2").
+
+A unit is reduced to a scale factor relative to the SI base units and a
+dimension vector (the exponent of every base unit). Two units can be
+converted into each other when their dimension vectors match, and the
+conversion is then a single multiplication.
+
+Parsed units and conversion factors are cached, so after the first parse a
+conversion between the same two unit strings costs one multiply (and an add
+for °C / °F).
+"""
+
+import re
+from fractions import Fraction as F
+from functools import lru_cache
+
+from conversions import CONVERSION_DATA, TEMPERATURE_SCALES
+
+# Every dimension vector has one exponent per base unit, in this order
+BASE_UNITS = ("m", "kg", "s", "A", "K", "mol", "cd", "B")
+
+SUPERSCRIPTS = str.maketrans("⁻⁰¹²³⁴⁵⁶⁷⁸⁹", "-0123456789")
+
+
+class Unit:
+    """A scale factor (to SI base units), a dimension vector and an offset (only for °C / °F)"""
+
+    __slots__ = ("scale", "dims", "offset")
+
+    def __init__(self, scale, dims, offset=F(0)):
+        self.scale = F(scale)
+        self.dims = tuple(dims)
+        self.offset = F(offset)
+
+    def __mul__(self, other):
+        if not isinstance(other, Unit):
+            return Unit(self.scale * F(other), self.dims)
+        self.check_no_offset(other)
+        return Unit(self.scale * other.scale, tuple(a + b for a, b in zip(self.dims, other.dims)))
+
+    __rmul__ = __mul__
+
+    def __truediv__(self, other):
+        if not isinstance(other, Unit):
+            return Unit(self.scale / F(other), self.dims)
+        self.check_no_offset(other)
+        return Unit(self.scale / other.scale, tuple(a - b for a, b in zip(self.dims, other.dims)))
+
+    def __rtruediv__(self, other):
+        return Unit(F(other), DIMENSIONLESS) / self
+
+    def __pow__(self, power):
+        self.check_no_offset()
+        return Unit(self.scale ** power, tuple(d * power for d in self.dims))
+
+    def check_no_offset(self, other=None):
+        # °C and °F only make sense on their own: 2 °C·m has no meaning
+        if self.offset or (other is not None and other.offset):
+            raise ValueError("°C and °F can't be combined with other units (use K or °R)")
+
+    def is_compatible(self, other):
+        return self.dims == other.dims
+
+    def __repr__(self):
+        return f"Unit({self.scale}, {format_dimensions(self.dims)})"
+
+
+def dims(**exponents):
+    """Build a dimension vector, e.g. dims(m=1, s=-1) for a speed"""
+    return tuple(exponents.get(base, 0) for base in BASE_UNITS)
+
+
+def format_dimensions(dimensions):
+    """Show a dimension vector as base units, e.g. (1, 0, -1, ...) → 'm·s⁻¹'"""
+    superscript = str.maketrans("-0123456789", "⁻⁰¹²³⁴⁵⁶⁷⁸⁹")
+    parts = []
+    for base, power in zip(BASE_UNITS, dimensions):
+        if power == 1:
+            parts.append(base)
+        elif power:
+            parts.append(base + str(power).translate(superscript))
+    return "·".join(parts) or "1"
+
+
+DIMENSIONLESS = dims()
+
+# Symbols that can take an SI prefix (km, mg, µs, kWh, hPa, ...)
+PREFIXABLE = {
+    "m": Unit(1, dims(m=1)),
+    "g": Unit(F(1, 1000), dims(kg=1)),
+    "s": Unit(1, dims(s=1)),
+    "A": Unit(1, dims(A=1)),
+    "K": Unit(1, dims(K=1)),
+    "mol": Unit(1, dims(mol=1)),
+    "cd": Unit(1, dims(cd=1)),
+    "bit": Unit(F(1, 8), dims(B=1)),
+    "Hz": Unit(1, dims(s=-1)),
+    "N": Unit(1, dims(kg=1, m=1, s=-2)),
+    "J": Unit(1, dims(kg=1, m=2, s=-2)),
+    "W": Unit(1, dims(kg=1, m=2, s=-3)),
+    "Pa": Unit(1, dims(kg=1, m=-1, s=-2)),
+    "C": Unit(1, dims(A=1, s=1)),
+    "V": Unit(1, dims(kg=1, m=2, s=-3, A=-1)),
+    "ohm": Unit(1, dims(kg=1, m=2, s=-3, A=-2)),
+    "L": Unit(F(1, 1000), dims(m=3)),
+    "l": Unit(F(1, 1000), dims(m=3)),
+    "eV": Unit(F("1.602176634e-19"), dims(kg=1, m=2, s=-2)),
+    "Wh": Unit(3600, dims(kg=1, m=2, s=-2)),
+    "cal": Unit(F("4.184"), dims(kg=1, m=2, s=-2)),
+    "bar": Unit(100000, dims(kg=1, m=-1, s=-2)),
+}
+PREFIXABLE["Ω"] = PREFIXABLE["ohm"]
+
+PREFIXES = {
+    "Y": F(10) ** 24, "Z": F(10) ** 21, "E": F(10) ** 18, "P": F(10) ** 15, "T": F(10) ** 12,
+    "G": F(10) ** 9, "M": F(10) ** 6, "k": F(10) ** 3, "h": F(10) ** 2, "da": F(10),
+    "d": F(10) ** -1, "c": F(10) ** -2, "m": F(10) ** -3, "µ": F(10) ** -6, "u": F(10) ** -6,
+    "n": F(10) ** -9, "p": F(10) ** -12, "f": F(10) ** -15, "a": F(10) ** -18,
+}
+
+# Binary prefixes only make sense for bytes (KiB, MiB, ...)
+BINARY_PREFIXES = {"Ki": 1024, "Mi": 1024 ** 2, "Gi": 1024 ** 3, "Ti": 1024 ** 4, "Pi": 1024 ** 5}
+
+# The base unit of every linear category in conversions.py, as a unit expression
+CATEGORY_BASE_UNITS = {
+    "Length": "m",
+    "Weight and Mass": "kg",
+    "Volume": "L",
+    "Area": "m^2",
+    "Speed": "m/s",
+    "Time": "s",
+    "Power": "W",
+    "Data": "B",
+    "Pressure": "Pa",
+    "Angle": "rad",
+    "Energy": "J",
+}
+
+# Short symbols for units of the Conversions page: symbol → (category, unit name)
+SYMBOLS = {
+    "in": ("Length", "Inch"), "ft": ("Length", "Foot"), "yd": ("Length", "Yard"),
+    "mi": ("Length", "Mile"), "nmi": ("Length", "Nautical Mile"),
+    "lb": ("Weight and Mass", "Pound"), "oz": ("Weight and Mass", "Ounce"),
+    "st": ("Weight and Mass", "Stone"), "t": ("Weight and Mass", "Metric Ton"),
+    "ha": ("Area", "Hectare"), "ac": ("Area", "Acre"),
+    "gal": ("Volume", "Gallon (US)"), "qt": ("Volume", "Quart (US)"), "pt": ("Volume", "Pint (US)"),
+    "cup": ("Volume", "Cup (US)"), "floz": ("Volume", "Fluid Ounce (US)"),
+    "mph": ("Speed", "Mile per Hour"), "kn": ("Speed", "Knot"), "kt": ("Speed", "Knot"),
+    "min": ("Time", "Minute"), "h": ("Time", "Hour"), "hr": ("Time", "Hour"), "d": ("Time", "Day"),
+    "wk": ("Time", "Week"), "mo": ("Time", "Month"), "yr": ("Time", "Year"),
+    "hp": ("Power", "Horsepower"),
+    "B": ("Data", "Byte"), "KB": ("Data", "Kilobyte"), "kB": ("Data", "Kilobyte"),
+    "MB": ("Data", "Megabyte"), "GB": ("Data", "Gigabyte"), "TB": ("Data", "Terabyte"),
+    "PB": ("Data", "Petabyte"),
+    "psi": ("Pressure", "PSI"), "atm": ("Pressure", "Atmosphere"), "Torr": ("Pressure", "Torr"),
+    "torr": ("Pressure", "Torr"), "mmHg": ("Pressure", "mmHg"),
+    "rad": ("Angle", "Radian"), "deg": ("Angle", "Degree"), "°": ("Angle", "Degree"),
+    "grad": ("Angle", "Gradian"), "gon": ("Angle", "Gradian"), "turn": ("Angle", "Turn"),
+    "arcmin": ("Angle", "Arcminute"), "arcsec": ("Angle", "Arcsecond"),
+    "BTU": ("Energy", "BTU"), "Btu": ("Energy", "BTU"),
+}
+
+# Absolute temperatures: kelvin = value * scale + offset (the same scales as the Conversions page).
+# "newton" is left out, as a unit name it means the unit of force
+TEMPERATURE_UNITS = {name: Unit(scale, dims(K=1), offset=offset)
+                     for name, (scale, offset) in TEMPERATURE_SCALES.items() if name != "Newton"}
+TEMPERATURE_SYMBOLS = {"°C": "Celsius", "degC": "Celsius", "°F": "Fahrenheit", "degF": "Fahrenheit",
+                       "°R": "Rankine", "degR": "Rankine", "°K": "Kelvin"}
+
+
+def build_unit_table(conversion_data=CONVERSION_DATA, category_base_units=CATEGORY_BASE_UNITS,
+                     unit_symbols=SYMBOLS):
+    """
+    Return (symbols, names): case-sensitive symbols and lower-case unit names.
+    Every unit of the linear categories in the conversion data becomes a named unit.
+    """
+    # Base units that the category base units below are written in
+    symbols = {"kg": Unit(1, dims(kg=1)), "B": Unit(1, dims(B=1)), "rad": Unit(1, DIMENSIONLESS)}
+    names = {}
+
+    for category, base_expression in category_base_units.items():
+        if category not in conversion_data:
+            continue
+        base = parse_expression(base_expression, symbols, names)
+        for name, factor in conversion_data[category]["units"].items():
+            unit = base * F(factor)
+            names[name.lower()] = unit
+            # "Gallon (US)" can also be typed as "gallon"
+            if name.endswith(" (US)"):
+                names[name[:-5].lower()] = unit
+
+    for symbol, (category, name) in unit_symbols.items():
+        # Units of categories without a base unit expression have no symbol
+        if category in conversion_data and name.lower() in names:
+            symbols[symbol] = names[name.lower()]
+
+    for name, unit in TEMPERATURE_UNITS.items():
+        names[name.lower()] = unit
+    for symbol, name in TEMPERATURE_SYMBOLS.items():
+        symbols[symbol] = TEMPERATURE_UNITS[name]
+
+    return symbols, names
+
+
+def lookup_word(word, symbols, names):
+    """Find the unit for a single word: a symbol, a prefixed symbol or a unit name"""
+    if word in symbols:
+        return symbols[word]
+    if word in PREFIXABLE:
+        return PREFIXABLE[word]
+
+    # SI prefix + symbol (longest prefix first so "da" wins over "d")
+    for prefix in sorted(PREFIXES, key=len, reverse=True):
+        if word.startswith(prefix) and word[len(prefix):] in PREFIXABLE:
+            return PREFIXABLE[word[len(prefix):]] * PREFIXES[prefix]
+    for prefix, factor in BINARY_PREFIXES.items():
+        if word in (prefix + "B", prefix + "bit"):
+            return lookup_word(word[len(prefix):], symbols, names) * factor
+
+    # Unit names are not case-sensitive and may be plural ("miles", "inches", "feet")
+    lowered = word.lower()
+    for candidate in (lowered, lowered[:-1], lowered[:-2], lowered.replace("feet", "foot")):
+        if candidate in names:
+            return names[candidate]
+
+    raise ValueError(f"Unknown unit '{word}'")
+
+
+TOKEN = re.compile(r"""\s*(?:
+    (?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)
+  | (?P<superscript>[⁻⁰¹²³⁴⁵⁶⁷⁸⁹]+)
+  | (?P<operator>\*\*|[*·×/^()\-])
+  | (?P<word>°[A-Za-z]?|[^\W\d_⁰¹²³⁴⁵⁶⁷⁸⁹]+)
+)""", re.VERBOSE)
+
+
+def tokenize(text, names):
+    """Split a unit expression into tokens; multi-word unit names become one word token"""
+    tokens = []
+    position = 0
+    text = text.strip()
+    while position < len(text):
+        match = TOKEN.match(text, position)
+        if not match or match.end() == position:
+            raise ValueError(f"Can't read the unit '{text}'")
+        position = match.end()
+        kind = match.lastgroup
+        tokens.append((kind, match.group(kind)))
+
+    # Join runs of words that make up a known name ("Nautical Mile", "Kilometer per Hour")
+    merged = []
+    i = 0
+    while i < len(tokens):
+        if tokens[i][0] == "word":
+            for j in range(min(len(tokens), i + 4), i + 1, -1):
+                words = tokens[i:j]
+                if all(kind == "word" for kind, _ in words):
+                    name = " ".join(value for _, value in words)
+                    if name.lower() in names:
+                        merged.append(("word", name))
+                        i = j
+                        break
+            else:
+                merged.append(tokens[i])
+                i += 1
+        else:
+            merged.append(tokens[i])
+            i += 1
+    return merged
+
+
+def parse_expression(text, symbols, names):
+    """
+    Recursive descent parser for unit expressions:
+        product := power (("*" | "·" | "×" | "/" | nothing) power | "per" power+)*
+        power   := atom ("^" int | "**" int | superscript)?
+        atom    := unit | number | "(" product ")"
+    """
+    tokens = tokenize(text, names)
+    position = 0
+
+    def peek():
+        return tokens[position] if position < len(tokens) else (None, None)
+
+    def take():
+        nonlocal position
+        token = peek()
+        position += 1
+        return token
+
+    def exponent():
+        sign = 1
+        if peek() == ("operator", "-"):
+            take()
+            sign = -1
+        kind, value = take()
+        if kind != "number" or not value.isdigit():
+            raise ValueError(f"Expected a whole number exponent in '{text}'")
+        return sign * int(value)
+
+    def atom():
+        kind, value = take()
+        if kind == "number":
+            return Unit(F(value), DIMENSIONLESS)
+        if kind == "word":
+            return lookup_word(value, symbols, names)
+        if (kind, value) == ("operator", "("):
+            unit = product()
+            if take() != ("operator", ")"):
+                raise ValueError(f"Missing ')' in '{text}'")
+            return unit
+        raise ValueError(f"Can't read the unit '{text}'")
+
+    def power():
+        unit = atom()
+        kind, value = peek()
+        if (kind, value) in (("operator", "^"), ("operator", "**")):
+            take()
+            unit = unit ** exponent()
+        elif kind == "superscript":
+            take()
+            unit = unit ** int(value.translate(SUPERSCRIPTS))
+        return unit
+
+    def adjacent():
+        # Powers written next to each other without an operator ("100 km", "N m")
+        unit = power()
+        while peek()[0] in ("word", "number") and peek() != ("word", "per"):
+            unit = unit * power()
+        return unit
+
+    def product():
+        unit = power()
+        while position < len(tokens):
+            kind, value = peek()
+            if (kind, value) in (("operator", "*"), ("operator", "·"), ("operator", "×")):
+                take()
+                unit = unit * power()
+            elif (kind, value) == ("operator", "/"):
+                take()
+                unit = unit / power()
+            elif (kind, value) == ("word", "per"):
+                take()
+                unit = unit / adjacent()  # "kWh per 100 km" divides by 100 km
+            elif kind in ("word", "number") or (kind, value) == ("operator", "("):
+                unit = unit * power()  # "N m" means N·m
+            else:
+                break
+        return unit
+
+    result = product()
+    if position != len(tokens):
+        raise ValueError(f"Can't read the unit '{text}'")
+    return result
+
+
+SYMBOL_TABLE, NAME_TABLE = build_unit_table()
+
+
+def load_unit_table(conversion_data, category_base_units=CATEGORY_BASE_UNITS, unit_symbols=SYMBOLS):
+    """Replace the unit tables (e.g. after loading unit packs) and forget everything cached"""
+    global SYMBOL_TABLE, NAME_TABLE
+    SYMBOL_TABLE, NAME_TABLE = build_unit_table(conversion_data, category_base_units, unit_symbols)
+    parse_unit.cache_clear()
+    exact_conversion.cache_clear()
+    conversion.cache_clear()
+
+
+@lru_cache(maxsize=1024)
+def parse_unit(text):
+    """Parse a unit expression (parsed units are cached, so each text is only parsed once)"""
+    return parse_expression(text, SYMBOL_TABLE, NAME_TABLE)
+
+
+@lru_cache(maxsize=1024)
+def exact_conversion(from_text, to_text):
+    """Return the exact (scale, offset) Fractions that convert from one unit into another"""
+    source = parse_unit(from_text)
+    target = parse_unit(to_text)
+    if not source.is_compatible(target):
+        raise ValueError(f"Can't convert {from_text} ({format_dimensions(source.dims)}) "
+                         f"to {to_text} ({format_dimensions(target.dims)})")
+
+    # value → SI: value * source.scale + source.offset; SI → target: (si - target.offset) / target.scale
+    scale = source.scale / target.scale
+    offset = (source.offset - target.offset) / target.scale
+    return scale, offset
+
+
+@lru_cache(maxsize=1024)
+def conversion(from_text, to_text):
+    """Return the (scale, offset) floats that convert from one unit into another"""
+    scale, offset = exact_conversion(from_text, to_text)
+    return float(scale), float(offset)
+
+
+def convert(value, from_text, to_text):
+    """Convert a value between any two compatible units, e.g. convert(100, "km/h", "m/s")"""
+    if isinstance(value, F):
+        scale, offset = exact_conversion(from_text, to_text)
+    else:
+        scale, offset = conversion(from_text, to_text)
+    return value * scale + offset
@@ -0,0 +1,88 @@
+"""
+Table of values of f(x) from a start to a stop value in steps, for the Table page.
+
+The table is never built: a row is computed from its index (x = start + step * row,
+so no rounding error adds up), in blocks of BLOCK_ROWS rows the first time one
+of them is shown, and only the last CACHED_BLOCKS blocks are kept. A billion
+rows open as fast as ten and scrolling only computes the rows that come into view.
+"""
+
+from collections import OrderedDict
+
+from conversion_tables import row_count
+from conversions import format_result, np
+
+BLOCK_ROWS = 256
+CACHED_BLOCKS = 64
+MAX_ROWS = 2 ** 31 - 1  # The most rows a Qt view can show
+
+
+class ValueTable:
+    """Rows of x and f(x), computed a block at a time when they are asked for"""
+
+    def __init__(self, compiled, start, stop, step, scope=None):
+        self.count = row_count(start, stop, step)
+        if self.count > MAX_ROWS:
+            raise ValueError(f"That is {self.count:,} rows, the most a table can have is {MAX_ROWS:,}")
+        self.compiled = compiled  # Compiled with x as a variable (a plain number)
+        self.start = start
+        self.step = step
+        self.scope = scope or {}  # User variables and functions (see definitions.py)
+        self.blocks = OrderedDict()  # block number → values of f, None where there is no value
+        self.vectorized = np is not None
+
+    def __len__(self):
+        return self.count
+
+    def x(self, row):
+        return self.start + self.step * row
+
+    def value(self, row):
+        """f(x) of a row, None when it can't be calculated"""
+        number, offset = divmod(row, BLOCK_ROWS)
+        block = self.blocks.get(number)
+        if block is None:
+            block = self.compute_block(number)
+            self.blocks[number] = block
+            if len(self.blocks) > CACHED_BLOCKS:
+                self.blocks.popitem(last=False)
+        else:
+            self.blocks.move_to_end(number)
+        return block[offset]
+
+    def compute_block(self, number):
+        first = number * BLOCK_ROWS
+        rows = min(BLOCK_ROWS, self.count - first)
+        values = dict(self.scope)
+        if self.vectorized:
+            values["x"] = self.start + self.step * np.arange(first, first + rows, dtype=np.float64)
+            try:
+                with np.errstate(all="ignore"):
+                    ys = np.asarray(self.compiled.evaluate_array(values))
+                if not np.iscomplexobj(ys):
+                    ys = np.broadcast_to(ys.astype(float), (rows,))
+                    return [None if y != y or abs(y) == float("inf") else y for y in ys.tolist()]
+            except (TypeError, ValueError, ArithmeticError):
+                pass
+            # e.g. user functions, which are cached per number: one x at a time from now on
+            self.vectorized = False
+
+        block = []
+        for row in range(first, first + rows):
+            values["x"] = self.x(row)
+            try:
+                block.append(self.compiled.evaluate(values))
+            except (TypeError, ValueError, ArithmeticError, RecursionError):
+                block.append(None)
+        return block
+
+    def x_text(self, row):
+        return format_result(self.x(row))
+
+    def value_text(self, row):
+        value = self.value(row)
+        if value is None:
+            return "Error"
+        if self.compiled.unit_text is None:
+            return format_result(value)
+        return self.compiled.format(value)
@@ -0,0 +1,219 @@
+"""
+Worksheet: a list of lines like a tiny spreadsheet.
+
+    width = 3 m
+    height = 2.5 m
+    area = width height
+    area in ft²
+
+Each line is `name = expression` or a plain expression, and may use the names
+defined on the lines above it. Values keep their units (see expression.py).
+Lines starting with # are comments.
+
+Editing the text only replaces the lines that changed. Those lines are
+calculated again, and so are the lines that use their names, in line order
+(every line only reads lines above it, so that is a topological order of the
+dependency graph). A line whose value comes out the same stops the update
+there, and every other line keeps its cached value and compiled expression,
+so typing in a worksheet of thousands of lines only calculates a handful.
+Nothing in here depends on Qt.
+"""
+
+import heapq
+import re
+from collections import defaultdict, namedtuple
+
+from expression import INVERSE_TRIG_FUNCTIONS, KEYWORDS, TRIG_FUNCTIONS, check_variable_name, compile_expression, \
+     tokenize
+
+ANGLE_FUNCTIONS = frozenset(TRIG_FUNCTIONS + INVERSE_TRIG_FUNCTIONS)
+DEFINITION = re.compile(r"\s*([^\W\d]\w*)\s*=(.*)")
+
+# Rows of the lines that were replaced: cells[start:stop] became lines[start:new_stop]
+WorksheetChange = namedtuple("WorksheetChange", "start stop new_stop")
+
+
+class Cell:
+    """One line of a worksheet and its cached result"""
+
+    __slots__ = ("text", "name", "expression", "names", "row", "compiled", "signature",
+                 "value", "dims", "angle", "result", "error")
+
+    def __init__(self, text, row):
+        self.text = text
+        self.row = row
+        self.name = None
+        self.expression = None  # None for blank lines and comments
+        self.names = frozenset()  # Every name the expression mentions (variables, units, functions)
+        self.compiled = None
+        self.signature = None   # What `compiled` was compiled for: variables and angle mode
+        self.value = None       # In SI base units, as other lines see it
+        self.dims = None
+        self.angle = False
+        self.result = ""        # Text shown for the line
+        self.error = None
+
+        stripped = text.strip()
+        if not stripped or stripped.startswith("#"):
+            return
+        match = DEFINITION.fullmatch(text)
+        if match:
+            self.name, self.expression = match.group(1), match.group(2).strip()
+        else:
+            self.expression = stripped
+        try:
+            self.names = frozenset(value for kind, value, _ in tokenize(self.expression)
+                                   if kind == "name" and value not in KEYWORDS)
+        except ValueError:
+            pass  # Calculating the line reports the error
+
+    def __repr__(self):
+        return f"Cell({self.text!r}, {self.result!r})"
+
+    def uses_angle_mode(self):
+        return not self.names.isdisjoint(ANGLE_FUNCTIONS)
+
+
+class Worksheet:
+    """The cells of a worksheet, which names they define and which cells read each name"""
+
+    def __init__(self, angle_mode="deg"):
+        self.cells = []
+        self.angle_mode = angle_mode
+        self.definitions = defaultdict(list)  # name → cells defining it, in line order (the first one counts)
+        self.readers = defaultdict(set)       # name → cells whose expression mentions it
+
+    def __len__(self):
+        return len(self.cells)
+
+    def __getitem__(self, row):
+        return self.cells[row]
+
+    def __iter__(self):
+        return iter(self.cells)
+
+    def values(self):
+        """Name → value in base units of every line that calculated"""
+        return {name: cells[0].value for name, cells in self.definitions.items() if cells and cells[0].error is None}
+
+    def changed_range(self, lines):
+        """The rows that differ from `lines`, once the lines that stayed the same at both ends are left out"""
+        cells = self.cells
+        start, stop, new_stop = 0, len(cells), len(lines)
+        while start < min(stop, new_stop) and cells[start].text == lines[start]:
+            start += 1
+        while stop > start and new_stop > start and cells[stop - 1].text == lines[new_stop - 1]:
+            stop -= 1
+            new_stop -= 1
+        return WorksheetChange(start, stop, new_stop)
+
+    def set_lines(self, lines):
+        """Replace the text of the worksheet; returns the rows whose results were calculated"""
+        start, stop, new_stop = self.changed_range(lines)
+        return self.replace(start, stop, lines[start:new_stop])
+
+    def replace(self, start, stop, lines):
+        """Replace cells[start:stop] with new lines; returns the rows whose results were calculated"""
+        removed = self.cells[start:stop]
+        added = [Cell(text, start + offset) for offset, text in enumerate(lines)]
+        self.cells[start:stop] = added
+        if len(added) != len(removed):
+            for row in range(start + len(added), len(self.cells)):
+                self.cells[row].row = row
+
+        # Lines that mention a name whose definition came or went have to look it up again
+        names = set()
+        for cell in removed:
+            for name in cell.names:
+                self.readers[name].discard(cell)
+            if cell.name is not None:
+                self.definitions[cell.name].remove(cell)
+                names.add(cell.name)
+        for cell in added:
+            for name in cell.names:
+                self.readers[name].add(cell)
+            if cell.name is not None:
+                definitions = self.definitions[cell.name]
+                position = len(definitions)
+                while position and definitions[position - 1].row > cell.row:
+                    position -= 1
+                definitions.insert(position, cell)
+                names.add(cell.name)
+
+        dirty = set(added)
+        for name in names:
+            dirty.update(self.readers[name])
+            dirty.update(self.definitions[name])  # A second definition of a name is an error
+        return self.recalculate(dirty)
+
+    def set_angle_mode(self, angle_mode):
+        """Calculate the lines using sin, cos, tan or their inverses again; returns the rows calculated"""
+        self.angle_mode = angle_mode
+        return self.recalculate(cell for cell in self.cells if cell.uses_angle_mode())
+
+    def recalculate(self, cells):
+        """
+        Calculate `cells` again, then every line that reads a value that changed.
+        Lines are taken in row order, so a line is only calculated once the lines
+        it reads are up to date. Returns the sorted rows that were calculated.
+        """
+        queue = [(cell.row, id(cell), cell) for cell in cells]
+        heapq.heapify(queue)
+        queued = {entry[2] for entry in queue}
+        rows = []
+        while queue:
+            row, _, cell = heapq.heappop(queue)
+            rows.append(row)
+            if not self.calculate(cell) or cell.name is None or self.definitions[cell.name][0] is not cell:
+                continue
+            for reader in self.readers[cell.name]:
+                if reader.row > row and reader not in queued:
+                    queued.add(reader)
+                    heapq.heappush(queue, (reader.row, id(reader), reader))
+        return rows
+
+    def definition(self, name, row):
+        """The cell defining `name` that a line at `row` sees, None if there isn't one above it"""
+        definitions = self.definitions.get(name)
+        if definitions and definitions[0].row < row:
+            return definitions[0]
+        return None
+
+    def calculate(self, cell):
+        """Calculate one cell from the cached values of the lines above; returns True if its value changed"""
+        before = (cell.value, cell.dims, cell.angle, cell.error)
+        if cell.expression is None:
+            cell.result = ""
+            return False
+        try:
+            if cell.name is not None:
+                check_variable_name(cell.name)
+                first = self.definitions[cell.name][0]
+                if first is not cell:
+                    raise ValueError(f"'{cell.name}' is already defined on line {first.row + 1}")
+
+            variables, values = [], {}
+            for name in cell.names:
+                source = self.definition(name, cell.row)
+                if source is None:
+                    continue  # A unit or a function, or an unknown name the compiler reports
+                if source.error is not None:
+                    raise ValueError(f"'{name}' on line {source.row + 1} has an error")
+                variables.append((name, source.dims, source.angle))
+                values[name] = source.value
+
+            angle_mode = self.angle_mode if cell.uses_angle_mode() else "deg"
+            signature = (tuple(sorted(variables)), angle_mode)
+            if signature != cell.signature:
+                cell.compiled = compile_expression(cell.expression, angle_mode, signature[0])
+                cell.signature = signature
+            compiled = cell.compiled
+            cell.value = compiled.evaluate_base(values)
+            cell.dims, cell.angle, cell.error = compiled.dims, compiled.angle, None
+            cell.result = compiled.format(compiled.to_display(cell.value))
+        except (ValueError, ArithmeticError, TypeError) as error:
+            cell.value = cell.dims = None
+            cell.angle = False
+            cell.error = str(error) or type(error).__name__
+            cell.result = "Error"
+        return (cell.value, cell.dims, cell.angle, cell.error) != before